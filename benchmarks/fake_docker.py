@@ -0,0 +1,279 @@
+"""
+A stand-in for the Docker Engine API, that implements just enough of the
+API used by docker-py to register and run tool-spec containers.
+Containers do not run anything. They sleep for the configured runtime
+and write a result file into the bound /out directory.
+
+Run standalone with:
+
+    python benchmarks/fake_docker.py --port 2375
+
+and point the tool-runner to it by setting DOCKER_HOST=tcp://127.0.0.1:2375
+"""
+from typing import Optional, Dict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from pathlib import Path
+from uuid import uuid4
+import threading
+import argparse
+import struct
+import json
+import time
+import re
+
+
+TOOL_YML = """
+tools:
+  sleep:
+    title: Sleep
+    description: Sleeps for a while and writes a result file
+    parameters:
+      seconds:
+        type: float
+        optional: true
+      rows:
+        type: integer
+        optional: true
+    data:
+      input:
+        description: An arbitrary input file
+"""
+
+
+class FakeDockerState:
+    def __init__(self, runtime: float = 0.05, latency: float = 0.0, result_rows: int = 1000):
+        # default runtime of a container and latency of every API call
+        self.runtime = runtime
+        self.latency = latency
+        self.result_rows = result_rows
+        self.containers: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+        # all container events for the /events endpoint
+        self.events = []
+        self.events_cond = threading.Condition(self.lock)
+
+    def emit(self, container: dict, action: str, exit_code: Optional[int] = None):
+        event = {
+            'Type': 'container',
+            'Action': action,
+            'status': action,
+            'id': container['Id'],
+            'Actor': {'ID': container['Id'], 'Attributes': {**container['Config'].get('Labels', {}), 'image': container['Config']['Image']}},
+            'time': int(time.time()),
+            'timeNano': time.time_ns(),
+        }
+        if exit_code is not None:
+            event['Actor']['Attributes']['exitCode'] = str(exit_code)
+        with self.events_cond:
+            self.events.append(event)
+            self.events_cond.notify_all()
+
+    def create(self, config: dict) -> dict:
+        container_id = uuid4().hex + uuid4().hex
+        container = {
+            'Id': container_id,
+            'Name': f"/fake_{container_id[:12]}",
+            'Config': {'Image': config.get('Image'), 'Cmd': config.get('Cmd'), 'Env': config.get('Env') or [], 'Labels': config.get('Labels') or {}, 'Tty': False},
+            'HostConfig': {'LogConfig': {'Type': 'json-file', 'Config': {}}, **(config.get('HostConfig') or {})},
+            'State': {'Status': 'created', 'Running': False, 'ExitCode': 0},
+            'started': None,
+            'finished': threading.Event(),
+            'stdout': b'',
+            'stderr': b'',
+        }
+        with self.lock:
+            self.containers[container_id] = container
+        self.emit(container, 'create')
+        return container
+
+    def _container_runtime(self, container: dict) -> float:
+        # tools can overwrite the runtime by the 'seconds' parameter
+        for bind in container['HostConfig'].get('Binds') or []:
+            host, target = bind.split(':')[:2]
+            if target == '/in':
+                try:
+                    inputs = json.loads((Path(host) / 'inputs.json').read_text())
+                    params = list(inputs.values())[0]['parameters']
+                    if params.get('seconds') is not None:
+                        return float(params['seconds'])
+                except Exception:
+                    pass
+        return self.runtime
+
+    def _run(self, container: dict):
+        cmd = container['Config']['Cmd'] or []
+        cmd = ' '.join(cmd) if isinstance(cmd, list) else cmd
+
+        if 'cat /src/tool.yml' in cmd:
+            container['stdout'] = TOOL_YML.encode()
+        else:
+            time.sleep(self._container_runtime(container))
+
+            # write a result file to the out mount
+            for bind in container['HostConfig'].get('Binds') or []:
+                host, target = bind.split(':')[:2]
+                if target == '/out':
+                    with open(Path(host) / 'result.csv', 'w') as f:
+                        f.write('time,value\n')
+                        f.writelines([f"{i},{i * 0.5}\n" for i in range(self.result_rows)])
+            container['stdout'] = b'done\n'
+
+        container['State'] = {'Status': 'exited', 'Running': False, 'ExitCode': 0}
+        container['finished'].set()
+        self.emit(container, 'die', exit_code=0)
+
+    def start(self, container: dict):
+        container['State'] = {'Status': 'running', 'Running': True, 'ExitCode': 0}
+        container['started'] = time.time()
+        self.emit(container, 'start')
+        threading.Thread(target=self._run, args=(container, ), daemon=True).start()
+
+
+def _frame(stream: int, payload: bytes) -> bytes:
+    # docker multiplexes stdout and stderr of non-tty containers
+    return struct.pack('>BxxxL', stream, len(payload)) + payload
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which stalls on delayed ACKs otherwise
+    disable_nagle_algorithm = True
+    state: FakeDockerState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes | dict | list | None = None, content_type: str = 'application/json'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        body = body or b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _route(self, method: str):
+        if self.state.latency > 0:
+            time.sleep(self.state.latency)
+
+        url = urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        query = parse_qs(url.query)
+
+        if path == '/_ping':
+            return self._send(200, b'OK', 'text/plain')
+        if path == '/version':
+            return self._send(200, {'Version': 'fake', 'ApiVersion': '1.45', 'Components': [{'Name': 'Engine', 'Version': 'fake'}]})
+        if path == '/events':
+            return self._events(query)
+        if path == '/images/create':
+            return self._send(200, {'status': 'Pulled'})
+
+        m = re.match(r'^/images/(.+)/json$', path)
+        if m:
+            return self._send(200, {'Id': f"sha256:{uuid4().hex}", 'RepoTags': [m.group(1)]})
+
+        if path == '/containers/create' and method == 'POST':
+            container = self.state.create(self._body())
+            return self._send(201, {'Id': container['Id'], 'Warnings': []})
+
+        m = re.match(r'^/containers/([0-9a-f]+)(/[a-z]+)?$', path)
+        if not m or m.group(1) not in self.state.containers:
+            return self._send(404, {'message': f"No such container or endpoint: {path}"})
+        container = self.state.containers[m.group(1)]
+        action = m.group(2)
+
+        if action == '/json':
+            return self._send(200, {k: v for k, v in container.items() if k in ('Id', 'Name', 'Config', 'HostConfig', 'State')})
+        if action == '/start':
+            self.state.start(container)
+            return self._send(204)
+        if action == '/wait':
+            container['finished'].wait()
+            return self._send(200, {'StatusCode': container['State']['ExitCode'], 'Error': None})
+        if action == '/logs':
+            # following logs returns once the container exited
+            if query.get('follow', ['0'])[0] in ('1', 'true', 'True'):
+                container['finished'].wait()
+            body = b''
+            if query.get('stdout', ['0'])[0] in ('1', 'true', 'True'):
+                body += _frame(1, container['stdout']) if container['stdout'] else b''
+            if query.get('stderr', ['0'])[0] in ('1', 'true', 'True'):
+                body += _frame(2, container['stderr']) if container['stderr'] else b''
+            return self._send(200, body, 'application/vnd.docker.raw-stream')
+        if action == '/stats':
+            cpu = int((time.time() - (container['started'] or time.time())) * 1e9)
+            return self._send(200, {'cpu_stats': {'cpu_usage': {'total_usage': cpu}}, 'memory_stats': {'usage': 16 * 1024 ** 2, 'max_usage': 16 * 1024 ** 2}})
+        if action is None and method == 'DELETE':
+            with self.state.lock:
+                del self.state.containers[container['Id']]
+            return self._send(204)
+
+        return self._send(404, {'message': f"Not implemented: {method} {path}"})
+
+    def _events(self, query: dict):
+        # stream all container events as chunked JSON lines
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        position = len(self.state.events)
+        try:
+            while True:
+                with self.state.events_cond:
+                    self.state.events_cond.wait_for(lambda: len(self.state.events) > position, timeout=1)
+                    new = self.state.events[position:]
+                    position = len(self.state.events)
+                for event in new:
+                    line = json.dumps(event).encode() + b'\n'
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+def start_fake_docker(port: int = 0, runtime: float = 0.05, latency: float = 0.0, result_rows: int = 1000) -> ThreadingHTTPServer:
+    """
+    Start the fake Docker daemon in a background thread and return the server.
+    The port is available as server.server_port.
+    """
+    state = FakeDockerState(runtime=runtime, latency=latency, result_rows=result_rows)
+    handler = type('BoundFakeDockerHandler', (FakeDockerHandler, ), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='fake-docker').start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=2375)
+    parser.add_argument('--runtime', type=float, default=0.05, help="Default runtime of a tool container in seconds.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latency added to every API call in seconds.")
+    args = parser.parse_args()
+
+    server = start_fake_docker(port=args.port, runtime=args.runtime, latency=args.latency)
+    print(f"Fake Docker daemon listening on tcp://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
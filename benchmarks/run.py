@@ -0,0 +1,337 @@
+"""
+End-to-end benchmark of the tool-runner API.
+
+The FastAPI app from toolbox_runner.server is started in a subprocess, which
+is talking to a fake Docker daemon (see fake_docker.py) and either a Redis
+server or the file based FallbackStore. A load generator drives a weighted
+mix of API requests for each scenario and reports throughput, latency
+percentiles and the memory of the server process.
+
+The results are saved as JSON and compared to an earlier run, or to the
+baseline committed with the repository:
+
+    python benchmarks/run.py --scenario mixed --concurrency 16 --compare latest
+    python benchmarks/run.py --compare baseline
+"""
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from uuid import uuid4
+import http.client
+import subprocess
+import statistics
+import tempfile
+import threading
+import argparse
+import platform
+import random
+import socket
+import json
+import time
+import sys
+import os
+
+from fake_docker import start_fake_docker
+
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / 'results'
+BASELINE = Path(__file__).parent / 'baseline.json'
+IMAGE = 'ghcr.io/hydrocode-de/bench-tool'
+TOOL = 'sleep'
+
+# weights of the operations within a scenario
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    'submit': {'create': 1},
+    'submit_run': {'run': 1},
+    'read': {'job': 5, 'results': 3, 'list': 1},
+    'download': {'zip': 1, 'results': 1},
+    'mixed': {'create': 2, 'run': 1, 'job': 4, 'list': 1, 'results': 2, 'zip': 1},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def multipart(fields: Dict[str, str], files: Dict[str, bytes]) -> tuple:
+    boundary = uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for filename, content in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """
+    A minimal HTTP client with a persistent connection per worker thread.
+    """
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, headers: dict = {}) -> tuple:
+        for attempt in range(2):
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # reconnect once, ie. if the server closed the keep-alive connection
+                self.conn.close()
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+                if attempt == 1:
+                    raise
+
+    def json(self, method: str, path: str, **kwargs):
+        status, body = self.request(method, path, **kwargs)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path} failed with {status}: {body[:200]}")
+        return json.loads(body)
+
+
+class Operations:
+    """
+    The single API operations that can be mixed into a scenario.
+    """
+    def __init__(self, job_ids: List[str], input_size: int):
+        self.job_ids = job_ids
+        self.payload = multipart(
+            {'parameters': '{}', 'name_mapping': json.dumps({'input.csv': 'input'})},
+            {'input.csv': b'x' * input_size}
+        )
+
+    def create(self, client: Client) -> str:
+        body, content_type = self.payload
+        return client.json('POST', f'/tool/{TOOL}/create', body=body, headers={'Content-Type': content_type})['job_id']
+
+    def run(self, client: Client):
+        job_id = self.create(client)
+        client.json('POST', f'/job/{job_id}/run')
+
+    def job(self, client: Client):
+        client.json('GET', f'/job/{random.choice(self.job_ids)}')
+
+    def list(self, client: Client):
+        client.json('GET', '/jobs')
+
+    def results(self, client: Client):
+        client.json('GET', f'/job/{random.choice(self.job_ids)}/results')
+
+    def zip(self, client: Client):
+        status, _ = client.request('GET', f'/job/{random.choice(self.job_ids)}/result/results.zip')
+        if status != 200:
+            raise RuntimeError(f"results.zip failed with {status}")
+
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'toolbox_runner.server:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=ROOT,
+        env={**os.environ, 'PYTHONPATH': str(ROOT), **env},
+    )
+
+    # wait until the server answers
+    t1 = time.time()
+    while time.time() - t1 < 120:
+        if proc.poll() is not None:
+            raise RuntimeError(f"The server exited with code {proc.returncode}")
+        try:
+            if Client(port).request('GET', '/info')[0] == 200:
+                return proc
+        except (ConnectionError, http.client.HTTPException):
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("The server did not start within 120 seconds")
+
+
+def process_memory(pid: int) -> dict:
+    # resident and peak resident memory of the server process in bytes (linux only)
+    memory = {}
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                memory['rss' if key == 'VmRSS' else 'peak_rss'] = int(value.split()[0]) * 1024
+    except FileNotFoundError:
+        pass
+    return memory
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+def run_scenario(name: str, args: argparse.Namespace, env: dict) -> dict:
+    weights = SCENARIOS[name]
+    port = free_port()
+    server = start_server(port, env)
+    try:
+        # register the tool and create some finished jobs to read from
+        setup = Client(port)
+        setup.json('POST', f'/tools/register?docker_image={IMAGE}')
+        ops = Operations(job_ids=[], input_size=args.input_size)
+        for _ in range(args.seed_jobs):
+            job_id = ops.create(setup)
+            setup.json('POST', f'/job/{job_id}/run')
+            ops.job_ids.append(job_id)
+        memory_before = process_memory(server.pid)
+
+        # build the sequence of operations up front
+        rnd = random.Random(args.seed)
+        sequence = rnd.choices(list(weights.keys()), weights=list(weights.values()), k=args.requests)
+        latencies: Dict[str, List[float]] = {op: [] for op in weights}
+        errors: Dict[str, int] = {op: 0 for op in weights}
+        lock = threading.Lock()
+
+        def worker(worker_ops: List[str]):
+            client = Client(port)
+            for op in worker_ops:
+                t1 = time.perf_counter()
+                try:
+                    getattr(ops, op)(client)
+                    latencies[op].append(time.perf_counter() - t1)
+                except Exception:
+                    with lock:
+                        errors[op] += 1
+
+        t1 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(worker, [sequence[i::args.concurrency] for i in range(args.concurrency)]))
+        duration = time.perf_counter() - t1
+
+        all_latencies = [lat for values in latencies.values() for lat in values]
+        return {
+            'scenario': name,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'duration': duration,
+            'throughput': len(all_latencies) / duration,
+            'errors': sum(errors.values()),
+            'p50': percentile(all_latencies, 50),
+            'p99': percentile(all_latencies, 99),
+            'operations': {
+                op: {
+                    'count': len(values),
+                    'errors': errors[op],
+                    'mean': statistics.mean(values) if len(values) > 0 else None,
+                    'p50': percentile(values, 50),
+                    'p99': percentile(values, 99),
+                } for op, values in latencies.items()
+            },
+            'memory_before': memory_before,
+            'memory_after': process_memory(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, previous: dict):
+    print(f"\nCompared to {previous.get('commit')} from {previous.get('timestamp')}:")
+    old = {r['scenario']: r for r in previous['results']}
+    for result in current['results']:
+        if result['scenario'] not in old:
+            continue
+        before = old[result['scenario']]
+        changes = []
+        for key in ('throughput', 'p50', 'p99'):
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"  {result['scenario']:<12} " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS.keys()), help="Scenario to run. Can be repeated. Defaults to all.")
+    parser.add_argument('--requests', type=int, default=200, help="Number of requests per scenario.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Number of concurrent clients.")
+    parser.add_argument('--seed-jobs', type=int, default=20, help="Number of finished jobs created before each scenario.")
+    parser.add_argument('--input-size', type=int, default=64 * 1024, help="Size of the uploaded input file in bytes.")
+    parser.add_argument('--runtime', type=float, default=0.05, help="Runtime of a tool container in seconds.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latency of every Docker API call in seconds.")
+    parser.add_argument('--result-rows', type=int, default=1000, help="Number of rows in the result file written by a tool.")
+    parser.add_argument('--redis', default=None, help="HOST:PORT of a Redis server. The FallbackStore is used if not given.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=str(RESULTS_DIR), help="Directory to save the results to.")
+    parser.add_argument('--compare', default=None, help="Results file to compare to, 'latest' for the most recent one in the output directory or 'baseline' for the committed baseline.")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Also save the results as the new baseline to {BASELINE.relative_to(ROOT)}.")
+    args = parser.parse_args()
+
+    # start the fake docker daemon
+    docker = start_fake_docker(runtime=args.runtime, latency=args.latency, result_rows=args.result_rows)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scenario or list(SCENARIOS.keys()):
+            # every scenario starts with an empty store and mount directory
+            scenario_dir = Path(tmp) / name
+            env = {
+                'DOCKER_HOST': f'tcp://127.0.0.1:{docker.server_port}',
+                'MOUNT_BASE_DIR': str(scenario_dir / 'mounts'),
+                'STORE_FILE': str(scenario_dir / 'store.json'),
+            }
+            if args.redis is not None:
+                host, port = args.redis.split(':')
+                env.update({'REDIS_HOST': host, 'REDIS_PORT': port})
+            else:
+                env.update({'REDIS_HOST': '127.0.0.1', 'REDIS_PORT': str(free_port())})
+
+            print(f"Running scenario '{name}'...", flush=True)
+            result = run_scenario(name, args, env)
+            results.append(result)
+            print(f"  {result['throughput']:.1f} req/s, p50 {result['p50'] * 1000 if result['p50'] else 0:.1f} ms, p99 {result['p99'] * 1000 if result['p99'] else 0:.1f} ms, errors {result['errors']}, peak RSS {result['memory_after'].get('peak_rss', 0) / 1024 ** 2:.1f} MB")
+
+    docker.shutdown()
+
+    # save the results
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'store': 'redis' if args.redis else 'fallback',
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'save_baseline')},
+        'results': results,
+    }
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    # find the file to compare to before writing the new one
+    previous = None
+    if args.compare == 'latest':
+        existing = sorted(output.glob('*.json'))
+        previous = existing[-1] if len(existing) > 0 else None
+    elif args.compare == 'baseline':
+        previous = BASELINE
+    elif args.compare is not None:
+        previous = Path(args.compare)
+
+    path = output / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path.write_text(json.dumps(report, indent=4))
+    print(f"\nResults saved to {path}")
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(report, indent=4) + '\n')
+        print(f"Baseline saved to {BASELINE}")
+
+    if previous is not None:
+        compare(report, json.loads(previous.read_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -28,5 +28,8 @@ setup(
     license='MIT',
     version=version(),
     packages=find_packages(),
-    install_requires=requirements()
+    install_requires=requirements(),
+    extras_require={
+        'client': ['httpx']
+    }
 )
@@ -0,0 +1,113 @@
+import sys
+import textwrap
+
+import pytest
+
+from toolbox_runner.handler import ToolHandler
+from toolbox_runner.runner import ToolRunner
+from toolbox_runner.backends import LocalProcessBackend, LocalTool
+
+
+TOOL_YML = """
+tools:
+  echo:
+    title: Echo
+    description: Write the input file and n into echo.txt
+    parameters:
+      n:
+        type: integer
+        optional: true
+    data:
+      input:
+        description: any text file
+  table:
+    title: Table
+    description: Write a CSV table of n rows into table.csv
+    parameters:
+      n:
+        type: integer
+"""
+
+RUN_PY = """
+import os, json
+run = os.environ['TOOL_RUN']
+p = json.load(open(os.environ['PARAM_FILE']))[run]
+out = os.environ['OUT_DIR']
+n = p['parameters'].get('n') or 0
+
+if run == 'echo':
+    with open(os.path.join(out, 'echo.txt'), 'w') as f:
+        f.write(open(p['data']['input']).read() + str(n))
+elif run == 'table':
+    with open(os.path.join(out, 'table.csv'), 'w') as f:
+        f.write('id,value\\n')
+        f.writelines([f'{i},{i * 2}\\n' for i in range(n)])
+"""
+
+
+@pytest.fixture
+def tool_src(tmp_path):
+    src = tmp_path / 'tool'
+    src.mkdir()
+    (src / 'tool.yml').write_text(TOOL_YML)
+    (src / 'run.py').write_text(textwrap.dedent(RUN_PY))
+    return src
+
+
+@pytest.fixture
+def handler(tmp_path, tool_src):
+    # run the test tool as local process, thus neither Docker nor Redis is needed
+    backend = LocalProcessBackend(local_tools={'test/tool': LocalTool(src=str(tool_src), command=f"{sys.executable} run.py")})
+    runner = ToolRunner(mount_base_dir=str(tmp_path / 'mounts'), backend=backend)
+    with pytest.warns(UserWarning, match='fallback store'):
+        handler = ToolHandler(runner=runner, redis_port=1, store_file=str(tmp_path / 'store.json'))
+
+    yield handler
+    handler.scheduler.stop()
+    handler.ingestor.shutdown()
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    p = tmp_path / 'input.txt'
+    p.write_text('hello')
+    return p
+
+
+@pytest.fixture
+def client(handler, monkeypatch):
+    from fastapi.testclient import TestClient
+    import toolbox_runner.server as server
+
+    # the server uses the handler of the test
+    monkeypatch.setattr(server, '_handler', handler)
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def table_job(handler):
+    job = handler.create_job('test/tool::table', parameters={'n': 50})
+    return handler.run_job(job.job_id)
+
+
+@pytest.fixture
+def server_url(handler, monkeypatch):
+    # a real server, as the event streams never end
+    import socket
+    import threading
+    import uvicorn
+    import toolbox_runner.server as server
+
+    monkeypatch.setattr(server, '_handler', handler)
+    handler.ingestor.ingest_executor = 'thread'
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, log_level='warning'))
+    thread = threading.Thread(target=uvicorn_server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not uvicorn_server.started:
+        thread.join(0.05)
+
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    uvicorn_server.should_exit = True
+    thread.join(10)
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from toolbox_runner.accounting import QuotaExceeded
+
+
+def test_finished_jobs_are_accounted(handler, input_file):
+    for n in range(2):
+        job = handler.create_job('test/tool::echo', parameters={'n': n}, data={'input': str(input_file)}, client_id='alice')
+        handler.run_job(job.job_id)
+
+    usage = handler.accounting.usage('alice')
+    assert usage.jobs == 2
+    assert usage.running == 0
+    assert usage.cpu_seconds > 0
+    assert usage.peak_memory > 0
+    assert usage.stored_bytes > 0
+    assert handler.accounting.usage('bob').jobs == 0
+
+
+def test_peak_memory_keeps_the_maximum(handler):
+    key, field = 'usage:alice', '2024-05|test/tool::echo|peak_memory'
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda value: handler.redis_client.hmax(key, field, value), range(100)))
+
+    assert float(handler.redis_client.hgetall(key)[field]) == 99
+
+
+def test_quota_is_enforced(handler, client, input_file):
+    handler.accounting.quota_overrides = {'alice': {'max_cpu_seconds': 0}}
+
+    with pytest.raises(QuotaExceeded, match='CPU seconds'):
+        handler.create_job('test/tool::echo', data={'input': str(input_file)}, client_id='alice')
+
+    response = client.get('/usage/alice')
+    assert response.status_code == 200
+    assert response.json()['client_id'] == 'alice'
+
+    # other clients are not limited
+    handler.create_job('test/tool::echo', data={'input': str(input_file)}, client_id='bob')
@@ -0,0 +1,91 @@
+from time import monotonic
+import asyncio
+
+import pytest
+
+from toolbox_runner.admission import AdmissionController, Admission, Overloaded, admission_kind
+
+
+class Busy:
+    running = 5
+    queued = 0
+
+
+@pytest.mark.parametrize('method,path,kind', [
+    ('POST', '/tool/echo/create', 'create'),
+    ('POST', '/pipelines/create', 'create'),
+    ('POST', '/job/abc/run', 'run'),
+    ('POST', '/pipeline/abc/run', 'run'),
+    ('GET', '/job/abc/run', None),
+    ('POST', '/tools/register', None),
+])
+def test_admitted_requests(method, path, kind):
+    assert admission_kind(method, path) == kind
+
+
+def test_full_volume_rejects_new_jobs(handler, client):
+    handler.admission._free_bytes = 1024
+
+    response = client.post('/tool/echo/create')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) > 0
+
+    # reading is not limited
+    assert client.get('/jobs').status_code == 200
+
+
+def test_running_tools_reject_runs(handler, client, table_job):
+    handler.admission.admission_max_running = 1
+    handler.admission._runner = Busy()
+
+    response = client.post(f"/job/{table_job.job_id}/run")
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(handler.admission.admission_retry_after)
+
+
+def test_requests_wait_for_a_free_slot():
+    controller = AdmissionController(admission_max_pending=1, admission_max_wait=0.05)
+
+    async def run():
+        await controller.acquire('create')
+        with pytest.raises(Overloaded) as e:
+            await controller.acquire('create')
+        assert e.value.status_code == 429
+
+        # runs have their own slots
+        await controller.acquire('run')
+        controller.release('create')
+        await controller.acquire('create')
+
+    asyncio.run(run())
+    assert controller.state()['pending'] == {'create': 1, 'run': 1}
+
+
+def test_slots_are_released_once_from_any_thread():
+    controller = AdmissionController(admission_max_pending=1, admission_max_wait=0.05)
+
+    async def run():
+        await controller.acquire('run')
+        admission = Admission(controller, 'run')
+
+        # ie. by a blocking run endpoint, once the run was started
+        await asyncio.to_thread(admission.release)
+        await asyncio.sleep(0)
+        admission.release()
+        assert controller.state()['pending']['run'] == 0
+
+        await controller.acquire('run')
+
+    asyncio.run(run())
+
+
+def test_uploads_share_the_bandwidth():
+    controller = AdmissionController(upload_max_bytes_per_second=100_000)
+
+    async def run():
+        t1 = monotonic()
+        await asyncio.gather(*[controller.throttle(50_000) for _ in range(4)])
+        return monotonic() - t1
+
+    # one second of bandwidth is available at once
+    assert asyncio.run(run()) >= 0.9
@@ -0,0 +1,193 @@
+from pathlib import Path
+import importlib.util
+import subprocess
+import threading
+import textwrap
+import json
+import sys
+import os
+
+import pytest
+
+import toolbox_runner.docker_client as docker_client
+import toolbox_runner.supervisor as supervisor
+from toolbox_runner.backends import DockerBackend, OCIBackend, ProcessReaper
+from toolbox_runner.models import ToolJobStatus
+
+
+FAKE_OCI = """
+import sys, os, json
+
+# podman run --rm -v HOST:/in ... -e K=V ... --label K=V ... [--flag=value ...] IMAGE [CMD ...]
+args = sys.argv[1:]
+assert args[:2] == ['run', '--rm'], args
+mounts, env, labels, flags = {}, {}, {}, []
+i = 2
+while args[i].startswith('-'):
+    if args[i] in ('-v', '-e', '--label'):
+        option, value = args[i:i + 2]
+        i += 2
+        if option == '-v':
+            host, target = value.split(':')[:2]
+            mounts[target] = host
+        else:
+            key, val = value.split('=', 1)
+            (env if option == '-e' else labels)[key] = val
+    else:
+        flags.append(args[i])
+        i += 1
+image, command = args[i], args[i + 1:]
+
+# reading the tool specification
+if command[:1] == ['cat']:
+    sys.stdout.write(open(os.path.join(os.environ['FAKE_OCI_SRC'], command[1][len('/src/'):])).read())
+    sys.exit(0)
+
+run = env['TOOL_RUN']
+p = json.load(open(os.path.join(mounts['/in'], 'inputs.json')))[run]
+n = p['parameters'].get('n') or 0
+json.dump({'image': image, 'env': env, 'labels': labels, 'flags': flags}, open(os.path.join(mounts['/out'], 'oci.json'), 'w'))
+if n < 0:
+    sys.stderr.write('n must not be negative')
+    sys.exit(2)
+data = open(p['data']['input'].replace('/in', mounts['/in'], 1)).read()
+open(os.path.join(mounts['/out'], 'echo.txt'), 'w').write(data + str(n))
+"""
+
+
+def load_fake_docker():
+    # the fake daemon of the benchmarks
+    path = Path(__file__).parent.parent / 'benchmarks' / 'fake_docker.py'
+    spec = importlib.util.spec_from_file_location('fake_docker', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def fake_docker(monkeypatch, tmp_path):
+    server = load_fake_docker().start_fake_docker(runtime=0.3)
+    monkeypatch.setenv('DOCKER_HOST', f"tcp://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(docker_client, '_client', None)
+
+    # a supervisor of the fake daemon, that samples often
+    watcher = supervisor.ContainerSupervisor(supervisor_stats_interval=0.05, supervisor_cgroup_root=str(tmp_path / 'cgroup'))
+    monkeypatch.setattr(supervisor, '_supervisor', watcher)
+
+    yield server.RequestHandlerClass.state
+    watcher.stop()
+    server.shutdown()
+
+
+@pytest.fixture
+def oci_handler(handler, tool_src, tmp_path, monkeypatch):
+    script = tmp_path / 'fake_oci.py'
+    script.write_text(textwrap.dedent(FAKE_OCI))
+    monkeypatch.setenv('FAKE_OCI_SRC', str(tool_src))
+    handler.runner.backend = OCIBackend(oci_command=f"{sys.executable} {script}", oci_args=['--network=none'])
+    return handler
+
+
+def test_docker_backend_runs_a_container(handler, fake_docker, input_file):
+    handler.runner.backend = DockerBackend()
+    job = handler.create_job('ghcr.io/test/fake::sleep', parameters={'seconds': 0.3}, data={'input': str(input_file)}, client_id='alice')
+    job = handler.run_job(job.job_id)
+
+    assert job.status == ToolJobStatus.COMPLETED
+    assert (Path(job.out_dir) / 'result.csv').exists()
+    assert (Path(job.out_dir) / 'STDOUT.log').read_text() == 'done\n'
+
+    # the usage was sampled from the API of the fake daemon, as there is no cgroup
+    assert job.cpu_seconds > 0
+    assert job.peak_memory == 16 * 1024 ** 2
+
+    # the container is labeled for the events filter
+    container = next(iter(fake_docker.containers.values()))
+    assert container['Config']['Labels'][supervisor.LABEL] == 'true'
+
+
+def test_docker_backend_watches_all_containers_in_one_stream(handler, fake_docker, input_file):
+    handler.runner.backend = DockerBackend()
+    jobs = [handler.create_job('ghcr.io/test/fake::sleep', data={'input': str(input_file)}) for _ in range(5)]
+    futures = [handler.runner.start(handler.get_tool(job.tool_name), job.in_dir, job.out_dir) for job in jobs]
+
+    assert supervisor.get_supervisor().running == 5
+    assert all([f.result(timeout=30) for f in futures])
+    assert supervisor.get_supervisor().running == 0
+    assert len([t for t in threading.enumerate() if t.name == 'container-supervisor']) == 1
+
+
+def test_oci_backend_runs_the_cli(oci_handler, input_file):
+    job = oci_handler.create_job('test/oci::echo', parameters={'n': 2}, data={'input': str(input_file)})
+    job = oci_handler.run_job(job.job_id)
+
+    assert job.status == ToolJobStatus.COMPLETED
+    assert (Path(job.out_dir) / 'echo.txt').read_text() == 'hello2'
+
+    args = json.loads((Path(job.out_dir) / 'oci.json').read_text())
+    assert args['image'] == 'test/oci'
+    assert args['env']['TOOL_RUN'] == 'echo'
+    assert args['labels'][supervisor.LABEL] == 'true'
+    assert args['flags'] == ['--network=none']
+
+    # the usage of the container is not known to the CLI
+    assert job.cpu_seconds is None
+
+
+def test_oci_backend_reports_failures(oci_handler, input_file):
+    job = oci_handler.create_job('test/oci::echo', parameters={'n': -1}, data={'input': str(input_file)})
+    job = oci_handler.run_job(job.job_id)
+
+    assert 'n must not be negative' in job.error_message
+
+
+def burn_cpu(exit_code: int = 0) -> subprocess.Popen:
+    code = f"import sys, time\nt = time.process_time()\nwhile time.process_time() - t < 0.2: pass\nsys.exit({exit_code})"
+    return subprocess.Popen([sys.executable, '-c', code])
+
+
+def watch(reaper: ProcessReaper, process: subprocess.Popen) -> tuple:
+    done = threading.Event()
+    result = []
+    reaper.watch(process, lambda exit_code, rusage: result.extend([exit_code, rusage]) or done.set())
+    assert done.wait(30)
+    return tuple(result)
+
+
+@pytest.mark.skipif(not hasattr(os, 'pidfd_open'), reason='pidfd is Linux only')
+def test_reaper_measures_the_usage():
+    exit_code, rusage = watch(ProcessReaper(), burn_cpu(exit_code=3))
+
+    # wait4 reaped the process and returned its own usage
+    assert exit_code == 3
+    assert rusage.ru_utime + rusage.ru_stime >= 0.15
+    assert rusage.ru_maxrss > 0
+
+
+def test_reaper_polls_without_pidfd():
+    reaper = ProcessReaper(poll_interval=0.01)
+    reaper._selector = None
+
+    exit_code, rusage = watch(reaper, burn_cpu())
+    assert exit_code == 0
+    assert rusage is None
+
+
+def test_reaper_waits_for_many_processes_in_one_thread():
+    reaper = ProcessReaper()
+    done = []
+    finished = threading.Event()
+    def _done(exit_code, rusage):
+        done.append(exit_code)
+        if len(done) == 10:
+            finished.set()
+
+    threads = set()
+    for i in range(10):
+        reaper.watch(subprocess.Popen([sys.executable, '-c', f"import sys; sys.exit({i})"]), _done)
+        threads.add(reaper._thread)
+
+    assert finished.wait(30)
+    assert sorted(done) == list(range(10))
+    assert reaper._processes == {}
+    assert len(threads) == 1
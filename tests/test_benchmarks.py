@@ -0,0 +1,23 @@
+from pathlib import Path
+import subprocess
+import json
+import sys
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_mixed_scenario(tmp_path):
+    # a short run against the fake docker daemon, compared to the committed baseline
+    out = subprocess.run(
+        [sys.executable, 'benchmarks/run.py', '--scenario', 'mixed', '--requests', '20', '--concurrency', '2', '--seed-jobs', '2', '--output', str(tmp_path), '--compare', 'baseline'],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    assert out.returncode == 0, out.stderr
+
+    report = json.loads(next(tmp_path.glob('*.json')).read_text())
+    result = report['results'][0]
+    assert result['scenario'] == 'mixed'
+    assert result['errors'] == 0
+    assert sum(op['count'] for op in result['operations'].values()) == 20
+    assert 'Compared to' in out.stdout
@@ -0,0 +1,55 @@
+import asyncio
+import subprocess
+import sys
+
+from toolbox_runner.client import ToolRunnerClient, AsyncToolRunnerClient
+from toolbox_runner.models import ToolJobStatus
+
+
+def test_client_does_not_import_the_runner():
+    # the client is used without docker and the backends
+    code = "import sys, toolbox_runner.client; print('toolbox_runner.runner' in sys.modules, 'docker' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_submit_and_wait_many(handler, server_url, input_file, tmp_path):
+    # tool names with a slash are not routed
+    handler.register_tool('echo', 'test/tool')
+    with ToolRunnerClient(server_url) as client:
+        jobs = client.submit_many([{'tool_name': 'echo', 'parameters': {'n': n}, 'files': {'input': input_file}} for n in range(4)])
+        finished = list(client.wait_many([job.job_id for job in jobs], timeout=60))
+
+        assert sorted([job.job_id for job in finished]) == sorted([job.job_id for job in jobs])
+        assert all([job.status == ToolJobStatus.COMPLETED for job in finished])
+
+        paths = client.download_results(jobs[2].job_id, tmp_path / 'results')
+        assert (tmp_path / 'results' / 'echo.txt').read_text() == 'hello2'
+        assert tmp_path / 'results' / 'echo.txt' in paths
+
+
+def test_async_wait_many_uses_one_stream(handler, server_url, input_file):
+    handler.register_tool('echo', 'test/tool')
+
+    async def run():
+        async with AsyncToolRunnerClient(server_url) as client:
+            jobs = await client.submit_many([{'tool_name': 'echo', 'parameters': {'n': n}, 'files': {'input': input_file}} for n in range(4)], run=False)
+
+            streams = []
+            stream = client._client.stream
+            def _stream(method, url, **kwargs):
+                streams.append(url)
+                return stream(method, url, **kwargs)
+            client._client.stream = _stream
+
+            waiting = asyncio.ensure_future(client.wait_many([job.job_id for job in jobs], timeout=60))
+            for job in jobs:
+                await client.run_job(job.job_id)
+            return jobs, await waiting, streams
+
+    jobs, finished, streams = asyncio.run(run())
+
+    # the jobs are returned in the given order
+    assert [job.job_id for job in finished] == [job.job_id for job in jobs]
+    assert all([job.status == ToolJobStatus.COMPLETED for job in finished])
+    assert streams == ['/events']
@@ -0,0 +1,50 @@
+import threading
+
+from toolbox_runner.estimator import RuntimeEstimator
+from toolbox_runner.models import ToolJob, ToolJobStatus
+
+
+def finished_job(memory: int | None = None) -> ToolJob:
+    return ToolJob(job_id='job', tool_name='test', docker_image='test/tool', in_dir='in', out_dir='out', status=ToolJobStatus.COMPLETED, peak_memory=memory)
+
+
+def test_no_estimate_without_history(handler):
+    assert handler.estimator.predict('test', {'n': 1}) is None
+
+
+def test_runtime_is_learned_from_parameters(handler):
+    estimator = RuntimeEstimator(store=handler.redis_client, estimator_cache_seconds=0)
+    for n in range(1, 11):
+        estimator.record(finished_job(memory=1000 * n), {'n': n, 'verbose': True}, 2.0 * n + 1.0)
+
+    estimate = estimator.predict('test', {'n': 20})
+    assert estimate.method == 'regression'
+    assert abs(estimate.runtime - 41.0) < 0.1
+    assert estimate.memory == 10000
+
+
+def test_outliers_do_not_change_the_median(handler):
+    estimator = RuntimeEstimator(store=handler.redis_client, estimator_cache_seconds=0)
+    for runtime in [10.0, 11.0, 9.0, 10.0, 10.5, 9.5, 500.0]:
+        estimator.record(finished_job(), {}, runtime)
+
+    estimate = estimator.predict('test')
+    assert estimate.method == 'median'
+    assert 9.0 <= estimate.runtime <= 11.0
+
+
+def test_concurrent_records_are_kept(handler):
+    estimator = RuntimeEstimator(store=handler.redis_client, estimator_history=1000)
+    threads = [threading.Thread(target=lambda: [estimator.record(finished_job(), {}, 1.0) for _ in range(25)]) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert len(estimator.history('test')) == 200
+
+
+def test_history_is_capped(handler):
+    estimator = RuntimeEstimator(store=handler.redis_client, estimator_history=5)
+    for runtime in range(10):
+        estimator.record(finished_job(), {}, float(runtime))
+
+    assert [s['runtime'] for s in estimator.history('test')] == [5.0, 6.0, 7.0, 8.0, 9.0]
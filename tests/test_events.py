@@ -0,0 +1,116 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import json
+
+import httpx
+import pytest
+
+from toolbox_runner.events import EventBus, JobEvent
+from toolbox_runner.models import ToolJobStatus
+
+
+def collect(subscription) -> list:
+    events = []
+    while (event := subscription.get(timeout=0.1)) is not None:
+        events.append(event)
+    return events
+
+
+# the job is deleted, before its results are indexed
+@pytest.mark.filterwarnings('ignore:Could not index')
+def test_job_changes_are_published(handler, input_file):
+    with handler.events.subscribe() as subscription:
+        job = handler.create_job('test/tool::echo', data={'input': str(input_file)})
+        handler.run_job(job.job_id)
+        handler.delete_job(job.job_id)
+        events = collect(subscription)
+
+    assert events[0].event == 'created'
+    assert events[-1].event == 'deleted'
+    assert ToolJobStatus.RUNNING in [e.status for e in events]
+    assert [e.status for e in events if e.event == 'updated'][-1] == ToolJobStatus.COMPLETED
+
+
+def test_subscriptions_are_filtered_by_job(handler, input_file):
+    first = handler.create_job('test/tool::echo', data={'input': str(input_file)})
+    second = handler.create_job('test/tool::echo', data={'input': str(input_file)})
+
+    with handler.events.subscribe(job_id=first.job_id) as subscription:
+        handler.run_job(second.job_id)
+        handler.run_job(first.job_id)
+        events = collect(subscription)
+
+    assert len(events) > 0
+    assert all([e.job_id == first.job_id for e in events])
+
+
+def test_slow_subscribers_lose_the_oldest_events():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    subscription._queue.maxsize = 2
+    for i in range(5):
+        bus.publish(JobEvent(event='updated', job_id=str(i), status=ToolJobStatus.RUNNING))
+
+    assert [e.job_id for e in collect(subscription)] == ['3', '4']
+
+
+def test_finished_jobs_are_sent_to_the_webhook(handler, input_file):
+    received = []
+    done = threading.Event()
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(204)
+            self.end_headers()
+            done.set()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Hook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        job = handler.create_job('test/tool::echo', data={'input': str(input_file)}, webhook=f"http://127.0.0.1:{server.server_port}/hook")
+        handler.run_job(job.job_id)
+        assert done.wait(10)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # only the finished job is sent
+    assert len(received) == 1
+    assert received[0]['job_id'] == job.job_id
+    assert received[0]['status'] == ToolJobStatus.COMPLETED
+
+
+def test_job_event_stream_ends_with_the_job(handler, server_url, input_file):
+    job = handler.create_job('test/tool::echo', data={'input': str(input_file)})
+
+    with httpx.stream('GET', f"{server_url}/job/{job.job_id}/events", timeout=30) as response:
+        assert response.headers['content-type'].startswith('text/event-stream')
+        lines = (line for line in response.iter_lines() if line != '')
+
+        # the current state is sent first
+        assert next(lines) == ': connected'
+        first = [next(lines), next(lines)]
+        assert first[0] == 'event: updated'
+        assert JobEvent.model_validate_json(first[1][len('data: '):]).status == ToolJobStatus.PENDING
+
+        threading.Thread(target=handler.run_job, args=(job.job_id, )).start()
+        data = [JobEvent.model_validate_json(line[len('data: '):]) for line in lines if line.startswith('data: ')]
+
+    assert data[-1].status == ToolJobStatus.COMPLETED
+
+
+def test_unknown_job_has_no_event_stream(server_url):
+    assert httpx.get(f"{server_url}/job/unknown/events").status_code == 404
+
+
+def test_websocket_sends_job_events(handler, client, input_file):
+    with client.websocket_connect('/ws/jobs') as websocket:
+        job = handler.create_job('test/tool::echo', data={'input': str(input_file)})
+        event = JobEvent.model_validate_json(websocket.receive_text())
+
+    assert event.event == 'created'
+    assert event.job_id == job.job_id
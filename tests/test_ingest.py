@@ -0,0 +1,78 @@
+import os
+import signal
+import time
+
+import pytest
+
+from toolbox_runner.ingest import ResultIngestor
+from toolbox_runner.models import ToolJobStatus
+
+
+def wait_for_index(handler, job, timeout: float = 30.0) -> dict:
+    # the manifest is saved by a callback, right after the ingestion finished
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        index = handler.result_index(job)
+        if len(index) > 0:
+            return index
+        time.sleep(0.05)
+    return {}
+
+
+def test_results_are_indexed(handler, input_file):
+    job = handler.create_job('test/tool::echo', parameters={'n': 3}, data={'input': str(input_file)})
+    job = handler.run_job(job.job_id)
+
+    assert 'echo.txt' in wait_for_index(handler, job)
+
+
+def test_zarr_stores_are_not_walked(handler, tmp_path):
+    store = tmp_path / 'out' / 'data.zarr'
+    (store / 'temp' / '0').mkdir(parents=True)
+    (store / 'temp' / '0' / '0').write_bytes(b'chunk')
+    (store / '.zgroup').write_text('{}')
+    (tmp_path / 'out' / 'nested').mkdir()
+    (tmp_path / 'out' / 'nested' / 'result.txt').write_text('result')
+
+    index = handler.ingestor.ingest(str(tmp_path / 'out')).result(timeout=30)
+
+    # the chunks are part of the store
+    assert sorted(index.keys()) == ['data.zarr', 'nested/result.txt']
+    assert index['data.zarr']['sha256'] is None
+
+
+def test_failing_ingestion_does_not_fail_the_run(handler, input_file, monkeypatch):
+    def broken(self, out_dir):
+        raise RuntimeError('ingestion is broken')
+    monkeypatch.setattr(ResultIngestor, 'ingest', broken)
+
+    job = handler.create_job('test/tool::echo', parameters={'n': 3}, data={'input': str(input_file)})
+    with pytest.warns(UserWarning, match='ingestion is broken'):
+        job = handler.run_job(job.job_id)
+
+    assert job.status == ToolJobStatus.COMPLETED
+    assert handler.get_job(job.job_id).status == ToolJobStatus.COMPLETED
+
+
+def test_broken_process_pool_is_replaced(handler, input_file):
+    handler.ingestor.ingest_executor = 'process'
+    handler.ingestor.ingest_workers = 1
+
+    job = handler.create_job('test/tool::echo', parameters={'n': 1}, data={'input': str(input_file)})
+    job = handler.run_job(job.job_id)
+    assert len(wait_for_index(handler, job)) > 0
+
+    # kill the workers, this breaks the whole pool
+    pool = handler.ingestor._pool
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+    time.sleep(0.5)
+
+    for n in range(2):
+        job = handler.create_job('test/tool::echo', parameters={'n': n}, data={'input': str(input_file)})
+        job = handler.run_job(job.job_id)
+        assert job.status == ToolJobStatus.COMPLETED
+
+    # a new pool indexes the results again
+    assert handler.ingestor._pool is not pool
+    assert 'echo.txt' in wait_for_index(handler, job)
@@ -0,0 +1,81 @@
+from pathlib import Path
+import tarfile
+import zipfile
+import json
+import io
+
+import pytest
+
+from toolbox_runner.archives import is_archive, archive_stem
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    src = tmp_path / 'dataset'
+    for i in range(20):
+        (src / f"part_{i % 3}").mkdir(parents=True, exist_ok=True)
+        (src / f"part_{i % 3}" / f"{i}.csv").write_text(f"id\n{i}\n")
+    return src
+
+
+def tar_gz(files: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return buffer
+
+
+def staged_files(path: Path) -> dict:
+    return {p.relative_to(path).as_posix(): p.read_text() for p in path.rglob('*') if p.is_file()}
+
+
+@pytest.mark.parametrize('file_name,stem', [('data.zip', 'data'), ('data.tar.gz', 'data'), ('Data.TGZ', 'Data'), ('data.csv', 'data')])
+def test_archive_names(file_name, stem):
+    assert archive_stem(file_name) == stem
+    assert is_archive(file_name) == (file_name != 'data.csv')
+
+
+def test_directory_inputs_are_staged(handler, input_dir):
+    job = handler.create_job('test/tool::echo', data={'input': str(input_dir)})
+
+    staged = Path(job.in_dir) / 'input'
+    assert staged_files(staged) == staged_files(input_dir)
+    inputs = json.loads((Path(job.in_dir) / 'inputs.json').read_text())
+    assert inputs['echo']['data']['input'] == str(staged.resolve())
+
+
+def test_tar_archives_are_extracted(handler):
+    archive = tar_gz({'a.txt': b'a', 'sub/b.txt': b'b'})
+    job = handler.create_job('test/tool::echo', archives={'input': ('data.tar.gz', archive)})
+
+    assert staged_files(Path(job.in_dir) / 'input') == {'a.txt': 'a', 'sub/b.txt': 'b'}
+
+
+def test_archives_can_not_write_outside(handler, tmp_path):
+    archive = tar_gz({'../../escaped.txt': b'evil'})
+    with pytest.raises(RuntimeError):
+        handler.create_job('test/tool::echo', archives={'input': ('data.tar', archive)})
+
+    assert list(tmp_path.rglob('escaped.txt')) == []
+
+
+def test_uploaded_zip_is_extracted(handler, client):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.txt', 'a')
+        archive.writestr('sub/b.txt', 'b')
+
+    # tool names with a slash are not routed, use an alias
+    handler.register_tool('echo', 'test/tool')
+    response = client.post(
+        '/tool/echo/create',
+        data={'extract_archives': 'true', 'name_mapping': json.dumps({'data.zip': 'input'})},
+        files=[('files', ('data.zip', buffer.getvalue()))]
+    )
+
+    assert response.status_code == 200, response.text
+    assert staged_files(Path(response.json()['in_dir']) / 'input') == {'a.txt': 'a', 'sub/b.txt': 'b'}
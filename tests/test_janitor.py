@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import toolbox_runner.janitor as janitor
+from toolbox_runner.locks import acquire_lock
+
+
+def run_tables(handler, count: int):
+    jobs = []
+    for n in range(count):
+        job = handler.create_job('test/tool::table', parameters={'n': 10 * (n + 1)})
+        jobs.append(handler.run_job(job.job_id))
+    return jobs
+
+
+def test_deleted_jobs_are_trashed_and_purged(handler, table_job):
+    mount_path = handler.runner.mount_path
+    handler.delete_job(table_job.job_id)
+
+    # the files are moved out of the way at once and only purged later
+    assert not Path(table_job.out_dir).exists()
+    assert len(list(handler.janitor.trash_path(mount_path).iterdir())) == 1
+
+    assert handler.janitor.purge_trash(mount_path) == 1
+    assert list(handler.janitor.trash_path(mount_path).iterdir()) == []
+
+
+def test_keep_last_jobs_per_tool(handler):
+    jobs = run_tables(handler, 3)
+    handler.janitor.retention_keep_last = 1
+
+    assert sorted(handler.janitor.expired_jobs(handler)) == sorted([jobs[0].job_id, jobs[1].job_id])
+
+
+def test_max_age(handler):
+    old, new = run_tables(handler, 2)
+    old.created = (datetime.now() - timedelta(days=3)).isoformat()
+    handler._save_job(old)
+    handler.janitor.retention_max_age_days = 2
+
+    assert handler.janitor.expired_jobs(handler) == [old.job_id]
+
+
+def test_max_bytes_uses_the_recorded_sizes(handler, monkeypatch):
+    jobs = [handler.get_job(job.job_id) for job in run_tables(handler, 3)]
+    assert all([job.stored_bytes > 0 for job in jobs])
+
+    # the mount volume is not walked
+    def walk(path):
+        raise AssertionError(f"{path} was walked")
+    monkeypatch.setattr(janitor, 'directory_size', walk)
+
+    handler.janitor.retention_max_bytes = jobs[2].stored_bytes
+    assert handler.janitor.expired_jobs(handler) == [jobs[1].job_id, jobs[0].job_id]
+
+
+def test_run_once_deletes_expired_jobs(handler):
+    jobs = run_tables(handler, 2)
+    handler.janitor.retention_keep_last = 1
+
+    result = handler.janitor.run_once(handler)
+
+    assert result == {'deleted_jobs': [jobs[0].job_id], 'purged': 1}
+    assert handler.list_jobs() == [jobs[1].job_id]
+
+
+def test_only_one_janitor_runs_at_a_time(handler):
+    run_tables(handler, 2)
+    handler.janitor.retention_keep_last = 1
+    assert acquire_lock(handler.redis_client, 'janitor', ttl=60) is not None
+
+    assert handler.janitor.run_once(handler) == {'deleted_jobs': [], 'purged': 0}
+    assert len(handler.list_jobs()) == 2
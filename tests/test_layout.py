@@ -0,0 +1,78 @@
+from datetime import datetime
+from pathlib import Path
+import json
+import sys
+
+from toolbox_runner.runner import SHARD_PATTERN, shard_path
+from toolbox_runner.models import ToolJobStatus
+from toolbox_runner import migrate
+
+
+def test_shard_path():
+    path = shard_path('abc', datetime(2024, 5, 17), width=3)
+
+    assert path.name == 'abc'
+    assert SHARD_PATTERN.match(path.parent.as_posix())
+    assert path.parent.parent == Path('2024/05/17')
+    assert len(path.parent.name) == 3
+    assert shard_path('abc', datetime(2024, 5, 17), width=3) == path
+
+
+def test_jobs_are_sharded(handler, table_job):
+    mount_path = handler.runner.mount_path.resolve()
+    base_dir = Path(table_job.out_dir).resolve().parent
+
+    assert base_dir.relative_to(mount_path) == shard_path(table_job.job_id, datetime.fromisoformat(table_job.created))
+    assert (base_dir / 'out' / 'table.csv').exists()
+
+
+def test_empty_shards_are_pruned(handler, table_job):
+    mount_path = handler.runner.mount_path.resolve()
+    handler.delete_job(table_job.job_id)
+
+    # only the trash is left in the mount base dir
+    assert [p.name for p in mount_path.iterdir()] == [handler.janitor.trash_dir]
+
+
+def test_shards_of_other_jobs_are_kept(handler, table_job):
+    shard = Path(table_job.out_dir).resolve().parent.parent
+    (shard / 'other').mkdir()
+    handler.delete_job(table_job.job_id)
+
+    assert shard.exists()
+
+
+def test_migrate_flat_layout(handler, input_file):
+    handler.runner.mount_layout = 'flat'
+    job = handler.create_job('test/tool::echo', parameters={'n': 1}, data={'input': str(input_file)})
+    job = handler.run_job(job.job_id)
+    queued = handler.create_job('test/tool::echo', parameters={'n': 2}, data={'input': str(input_file)})
+    queued.status = ToolJobStatus.QUEUED
+    handler._save_job(queued)
+
+    handler.runner.mount_layout = 'sharded'
+    assert handler.migrate_mounts(dry_run=True) == {'migrated': [job.job_id], 'skipped': [queued.job_id]}
+    assert Path(job.out_dir).exists()
+
+    assert handler.migrate_mounts() == {'migrated': [job.job_id], 'skipped': [queued.job_id]}
+    moved = handler.get_job(job.job_id)
+    mount_path = handler.runner.mount_path.resolve()
+    assert not Path(job.out_dir).exists()
+    assert Path(moved.out_dir).parent.relative_to(mount_path) == shard_path(job.job_id, datetime.fromisoformat(job.created))
+    assert (Path(moved.out_dir) / 'echo.txt').read_text() == 'hello1'
+
+    # the host paths of the local backend point into the new directory
+    inputs = json.loads((Path(moved.in_dir) / 'inputs.json').read_text())
+    assert inputs['echo']['data']['input'].startswith(moved.in_dir)
+    assert Path(inputs['echo']['data']['input']).exists()
+
+    # the migration can be run again
+    assert handler.migrate_mounts() == {'migrated': [], 'skipped': [queued.job_id]}
+
+
+def test_migrate_cli(handler, monkeypatch, capsys):
+    monkeypatch.setattr(migrate, 'ToolHandler', lambda: handler)
+    monkeypatch.setattr(sys, 'argv', ['migrate', '--dry-run'])
+    migrate.main()
+
+    assert capsys.readouterr().out.strip() == '0 jobs to migrate, 0 skipped.'
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import pytest
+
+from toolbox_runner.handler import PipelineStepError
+from toolbox_runner.models import ToolJobStatus
+
+
+def chained_pipeline(input_file):
+    return {'steps': [
+        {'name': 'first', 'tool_name': 'test/tool::echo', 'parameters': {'n': 1}, 'data': {'input': str(input_file)}},
+        {'name': 'second', 'tool_name': 'test/tool::echo', 'parameters': {'n': 2}, 'data': {'input': {'step': 'first', 'path': 'echo.txt'}}},
+    ]}
+
+
+def test_pipeline_passes_outputs_downstream(handler, input_file):
+    pipeline = handler.create_pipeline(chained_pipeline(input_file))
+    result = handler.run_pipeline(pipeline.pipeline_id)
+
+    assert result.status == ToolJobStatus.COMPLETED
+    second = handler.get_job(result.jobs['second'])
+    assert (Path(second.out_dir) / 'echo.txt').read_text() == 'hello12'
+
+
+def test_pipeline_links_upstream_outputs(handler, input_file):
+    pipeline = handler.create_pipeline(chained_pipeline(input_file))
+    result = handler.run_pipeline(pipeline.pipeline_id)
+
+    first = handler.get_job(result.jobs['first'])
+    second = handler.get_job(result.jobs['second'])
+    upstream = Path(first.out_dir) / 'echo.txt'
+    staged = Path(second.in_dir) / 'input.txt'
+    assert staged.stat().st_ino == upstream.stat().st_ino
+
+    # staging must not change the mode of the upstream output
+    assert upstream.stat().st_mode & 0o200
+
+
+def test_pipeline_reuses_unchanged_steps(handler, input_file):
+    pipeline = handler.create_pipeline(chained_pipeline(input_file))
+    first_run = handler.run_pipeline(pipeline.pipeline_id)
+    second_run = handler.run_pipeline(pipeline.pipeline_id)
+
+    assert sorted(second_run.cached_steps) == ['first', 'second']
+    assert second_run.jobs == first_run.jobs
+
+    # without the cache, all steps run again
+    third_run = handler.run_pipeline(pipeline.pipeline_id, use_cache=False)
+    assert third_run.cached_steps == []
+    assert third_run.jobs['first'] != first_run.jobs['first']
+
+
+def test_pipeline_with_missing_input_fails(handler, tmp_path):
+    pipeline = handler.create_pipeline({'steps': [
+        {'name': 'only', 'tool_name': 'test/tool::echo', 'data': {'input': str(tmp_path / 'missing.txt')}},
+    ]})
+
+    with pytest.raises(PipelineStepError, match="Step 'only'"):
+        handler.run_pipeline(pipeline.pipeline_id)
+
+    # the failed state is saved, the pipeline is not left running
+    saved = handler.get_pipeline(pipeline.pipeline_id)
+    assert saved.status == ToolJobStatus.FAILED
+    assert 'missing.txt' in saved.error_message
+
+
+def test_run_pipeline_endpoint_returns_400_for_missing_input(handler, client, tmp_path):
+    pipeline = handler.create_pipeline({'steps': [
+        {'name': 'only', 'tool_name': 'test/tool::echo', 'data': {'input': str(tmp_path / 'missing.txt')}},
+    ]})
+    response = client.post(f"/pipeline/{pipeline.pipeline_id}/run")
+
+    assert response.status_code == 400
+    assert handler.get_pipeline(pipeline.pipeline_id).status == ToolJobStatus.FAILED
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from toolbox_runner.handler import get_cached_tool
+from toolbox_runner.registry import ToolRegistry
+
+
+@pytest.fixture
+def replicas(handler):
+    # two replicas sharing the store of the handler
+    return ToolRegistry(store=handler.redis_client), ToolRegistry(store=handler.redis_client)
+
+
+def test_concurrent_registrations_do_not_overwrite(replicas):
+    first, second = replicas
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: (first, second)[i % 2].register('tool', f"image-{i}"), range(16)))
+
+    assert results.count(True) == 1
+    winner = f"image-{results.index(True)}"
+    assert first.get('tool') == winner
+    assert second.get('tool') == winner
+
+    # registering the same image again is fine
+    assert second.register('tool', winner)
+
+
+def test_unknown_tools_are_looked_up_in_the_store(replicas):
+    first, second = replicas
+    second.load()
+    first.register('tool', 'image')
+
+    assert 'tool' not in second.tools
+    assert second.get('tool') == 'image'
+
+
+def test_refresh_loads_missed_changes(replicas):
+    first, second = replicas
+    second.load()
+    first.register('a', 'image-a')
+    first.register('b', 'image-b')
+
+    assert second.refresh()
+    assert second.version == first.version == 2
+    assert second.tools == {'a': 'image-a', 'b': 'image-b'}
+    assert not second.refresh()
+
+
+def test_published_changes_are_applied_in_order(replicas):
+    first, second = replicas
+    second.load()
+    first.register('a', 'image-a')
+    first.register('b', 'image-b')
+
+    # in order, the message is applied without reading the store
+    second._apply({'event': 'registered', 'version': 1, 'tool_name': 'a', 'docker_image': 'image-a'})
+    assert second.tools == {'a': 'image-a'}
+
+    # a gap loads the whole registry
+    first.register('c', 'image-c')
+    second._apply({'event': 'registered', 'version': 3, 'tool_name': 'c', 'docker_image': 'image-c'})
+    assert second.tools == {'a': 'image-a', 'b': 'image-b', 'c': 'image-c'}
+    assert second.version == 3
+
+
+def test_invalidate_drops_the_cached_specifications(handler):
+    handler.create_job('test/tool::table', parameters={'n': 1})
+    assert get_cached_tool.cache_info().currsize > 0
+
+    handler.registry.invalidate()
+    assert get_cached_tool.cache_info().currsize == 0
+
+
+def test_handler_rejects_a_taken_tool_name(handler):
+    handler.register_tool('echo', 'test/tool')
+    with pytest.raises(RuntimeError, match='already registered'):
+        handler.register_tool('echo', 'other/tool')
@@ -0,0 +1,78 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+
+class RemoteData(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        RemoteData.requests.append(self.path)
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+
+        # objects below /static have no ETag
+        etag = None if self.path.startswith('/static') else '"v1"'
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        body = b'remote data'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def remote():
+    RemoteData.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RemoteData)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_inputs_are_cached(handler, remote):
+    jobs = [handler.create_job('test/tool::echo', data={'input': f"{remote}/data/input.txt"}) for _ in range(2)]
+
+    staged = [Path(job.in_dir) / 'input.txt' for job in jobs]
+    assert [p.read_text() for p in staged] == ['remote data', 'remote data']
+    assert staged[0].stat().st_ino == staged[1].stat().st_ino
+
+    # the second job only revalidated the cached download
+    job = handler.run_job(jobs[1].job_id)
+    assert (Path(job.out_dir) / 'echo.txt').read_text() == 'remote data0'
+    assert RemoteData.requests == ['/data/input.txt', '/data/input.txt']
+
+
+def test_remote_inputs_without_etag_are_not_cached(handler, remote):
+    job = handler.create_job('test/tool::echo', data={'input': f"{remote}/static/input.txt"})
+
+    assert (Path(job.in_dir) / 'input.txt').read_text() == 'remote data'
+    assert list(handler.runner.downloads.cache_path(handler.runner.mount_path).glob('*/*.data')) == []
+
+
+def test_downloads_are_finished_when_staging_fails(handler, remote, tmp_path):
+    in_dir = tmp_path / 'in'
+    in_dir.mkdir()
+    handler.runner.downloads.download_workers = 1
+
+    data = {'missing': str(tmp_path / 'missing.txt'), 'first': f"{remote}/slow/first.txt", 'second': f"{remote}/slow/second.txt"}
+    with pytest.raises(FileNotFoundError):
+        handler.runner.copy_input_data(str(in_dir), data)
+
+    # nothing writes into the in_dir anymore and the queued download never started
+    assert not any([t.name.startswith('download-input') for t in threading.enumerate()])
+    assert RemoteData.requests == ['/slow/first.txt']
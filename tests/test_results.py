@@ -0,0 +1,60 @@
+import time
+from pathlib import Path
+
+
+def wait_for_etag(client, url: str, timeout: float = 10.0) -> str | None:
+    # changed files are indexed in the ingest pool
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        etag = client.get(url, headers={'Accept-Encoding': 'identity'}).headers.get('ETag')
+        if etag is not None:
+            return etag
+        time.sleep(0.05)
+    return None
+
+
+def test_range_request_of_result_file(client, table_job):
+    response = client.get(f"/job/{table_job.job_id}/result/table.csv", headers={'Range': 'bytes=0-7'})
+
+    assert response.status_code == 206
+    assert response.content == b'id,value'
+    assert response.headers['Content-Range'].startswith('bytes 0-7/')
+
+
+def test_unsatisfiable_range_is_rejected(client, table_job):
+    response = client.get(f"/job/{table_job.job_id}/result/table.csv", headers={'Range': 'bytes=100000-'})
+    assert response.status_code == 416
+
+
+def test_unchanged_file_is_not_sent_again(client, table_job):
+    url = f"/job/{table_job.job_id}/result/table.csv"
+    etag = wait_for_etag(client, url)
+    assert etag is not None
+
+    response = client.get(url, headers={'If-None-Match': etag, 'Accept-Encoding': 'identity'})
+    assert response.status_code == 304
+
+
+def test_changed_file_is_served_without_etag_until_indexed(client, handler, table_job):
+    url = f"/job/{table_job.job_id}/result/table.csv"
+    old_etag = wait_for_etag(client, url)
+    Path(table_job.out_dir, 'table.csv').write_text('id,value\n0,1\n')
+
+    # the checksum is not calculated within the request
+    response = client.get(url, headers={'If-None-Match': old_etag})
+    assert response.status_code == 200
+    assert response.content == b'id,value\n0,1\n'
+
+    new_etag = wait_for_etag(client, url)
+    assert new_etag is not None and new_etag != old_etag
+
+
+def test_archived_file_keeps_its_etag(client, handler, table_job):
+    url = f"/job/{table_job.job_id}/result/table.csv"
+    etag = wait_for_etag(client, url)
+    handler.archive_job(table_job.job_id)
+
+    response = client.get(url, headers={'Range': 'bytes=3-7'})
+    assert response.status_code == 206
+    assert response.content == b'value'
+    assert response.headers['ETag'] == etag
@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from toolbox_runner.models import ToolJobStatus
+from toolbox_runner.models import ToolJob
+from toolbox_runner.scheduler import JobScheduler
+
+
+@pytest.fixture
+def scheduled(handler):
+    handler.scheduler = JobScheduler(scheduler_max_running=2, store=handler.redis_client)
+    yield handler
+    handler.scheduler.stop()
+
+
+def test_concurrent_runs_are_scheduled(scheduled):
+    jobs = [scheduled.create_job('test/tool::table', parameters={'n': i}) for i in range(24)]
+    results, errors, running = {}, [], []
+    done = threading.Event()
+
+    def monitor():
+        while not done.wait(0.005):
+            running.append(scheduled.runner.running)
+    threading.Thread(target=monitor, daemon=True).start()
+
+    def run(job_id: str):
+        try:
+            results[job_id] = scheduled.run_job(job_id)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(job.job_id, )) for job in jobs]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    done.set()
+
+    assert errors == []
+    assert max(running) <= 2
+    assert all([job.status == ToolJobStatus.COMPLETED for job in results.values()])
+    assert len(results) == 24
+    assert scheduled.redis_client.hgetall('scheduler:queued') == {}
+
+
+def make_job(job_id: str) -> ToolJob:
+    return ToolJob(job_id=job_id, tool_name='test', docker_image='test/tool', in_dir='in', out_dir='out', status=ToolJobStatus.PENDING)
+
+
+def test_shortest_job_first():
+    scheduler = JobScheduler(scheduler_max_running=1, scheduler_aging=0.0)
+    started, blocker = [], Future()
+
+    def start(job_id: str):
+        def _start():
+            started.append(job_id)
+            return blocker if job_id == 'first' else Future()
+        return _start
+
+    scheduler.submit(make_job('first'), start('first'), runtime=1.0)
+    scheduler.submit(make_job('long'), start('long'), runtime=100.0)
+    scheduler.submit(make_job('short'), start('short'), runtime=5.0)
+    assert [q.job_id for q in scheduler.queue()] == ['short', 'long']
+
+    blocker.set_result(None)
+    assert started == ['first', 'short']
+
+
+def test_jobs_of_a_running_scheduler_are_not_claimed(handler):
+    # ie. a handler used as library, that never started the scheduler
+    library = JobScheduler(scheduler_max_running=0, store=handler.redis_client)
+    library.submit(make_job('a'), lambda: Future())
+
+    assert JobScheduler(store=handler.redis_client).orphaned() == []
+    library.stop()
+
+
+def test_orphaned_jobs_are_claimed_once(handler):
+    stopped = JobScheduler(scheduler_max_running=0, store=handler.redis_client)
+    stopped.submit(make_job('a'), lambda: Future())
+    stopped.submit(make_job('b'), lambda: Future())
+    stopped.stop()
+
+    alive = [JobScheduler(store=handler.redis_client) for _ in range(2)]
+    claimed = [s.orphaned() for s in alive]
+
+    assert sorted(claimed[0] + claimed[1]) == ['a', 'b']
+    assert claimed[1] == []
+
+
+def test_queued_jobs_are_recovered_after_restart(scheduled):
+    job = scheduled.create_job('test/tool::table', parameters={'n': 3})
+
+    # the job was queued by a scheduler, that is gone now
+    queued = scheduled.get_job(job.job_id)
+    queued.status = ToolJobStatus.QUEUED
+    scheduled._save_job(queued)
+    scheduled.redis_client.hset('scheduler:queued', mapping={job.job_id: 'stopped-scheduler'})
+
+    assert scheduled.recover_queued_jobs() == [job.job_id]
+    for _ in range(200):
+        if scheduled.get_job(job.job_id).status == ToolJobStatus.COMPLETED:
+            break
+        threading.Event().wait(0.05)
+    assert scheduled.get_job(job.job_id).status == ToolJobStatus.COMPLETED
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+from toolbox_runner.slicing import CSVSource, ResultSlicer
+
+
+@pytest.fixture
+def table(tmp_path) -> Path:
+    p = tmp_path / 'table.csv'
+    p.write_text('id,value\n' + ''.join([f'{i},{i * 2}\n' for i in range(2500)]))
+    return p
+
+
+def test_csv_rows_are_sliced(table):
+    source = CSVSource(table, index_every=100)
+    data = source.read(variables=['value'], start=1234, stop=1237)
+
+    assert data['rows'] == [['2468'], ['2470'], ['2472']]
+    assert data['start'] == 1234 and data['stop'] == 1237
+    source.close()
+
+
+@pytest.mark.parametrize('start,stop', [(-3, None), (-3, 5), (10, 5)])
+def test_csv_invalid_rows_are_rejected(table, start, stop):
+    source = CSVSource(table)
+    with pytest.raises(ValueError):
+        source.read(start=start, stop=stop)
+    source.close()
+
+
+def test_evicted_source_stays_open_until_released(tmp_path, table):
+    other = tmp_path / 'other.csv'
+    other.write_text('a\n1\n')
+    slicer = ResultSlicer(slice_cache_size=1)
+
+    source = slicer.open(table)
+    evicting = slicer.open(other)
+
+    # the first source left the cache, but is still read
+    assert source.read(start=0, stop=2)['rows'] == [['0', '0'], ['1', '2']]
+    slicer.release(source)
+    assert source._file.closed
+
+    slicer.release(evicting)
+    assert not evicting._file.closed
+    slicer.clear()
+    assert evicting._file.closed
+
+
+def test_slice_endpoint(client, table_job):
+    response = client.get(f"/job/{table_job.job_id}/slice/table.csv", params={'start': 10, 'stop': 12})
+
+    assert response.status_code == 200
+    assert response.json()['rows'] == [['10', '20'], ['11', '22']]
+
+
+@pytest.mark.parametrize('params', [{'start': -3}, {'start': 12, 'stop': 10}])
+def test_slice_endpoint_rejects_invalid_rows(client, table_job, params):
+    response = client.get(f"/job/{table_job.job_id}/slice/table.csv", params=params)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('isel', ['{"time": 5}', '{"time": []}', '{"time": [0, 1, 1, 1]}', '[0, 1]', '{"time": '])
+def test_slice_endpoint_rejects_invalid_bounds(client, table_job, isel):
+    response = client.get(f"/job/{table_job.job_id}/slice/table.csv", params={'isel': isel})
+    assert response.status_code == 400
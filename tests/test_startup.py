@@ -0,0 +1,35 @@
+import subprocess
+import json
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+import toolbox_runner.server as server
+
+
+def test_import_is_lazy():
+    code = "import sys, json, toolbox_runner.server; print(json.dumps([m for m in ('docker', 'redis', 'yaml') if m in sys.modules]))"
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60)
+
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout) == []
+
+
+def test_ready_after_startup(handler, monkeypatch):
+    monkeypatch.setattr(server, '_handler', handler)
+    client = TestClient(server.app)
+    assert client.get('/ready').status_code == 503
+
+    with client:
+        response = client.get('/ready')
+        assert response.status_code == 200
+        assert response.json()['ready']
+
+        # the tool specifications are loaded in the background
+        t1 = time.time()
+        while client.get('/ready').json()['tools_cached'] is None and time.time() - t1 < 10:
+            time.sleep(0.05)
+        assert client.get('/ready').json()['tools_cached'] is not None
+
+    assert client.get('/ready').status_code == 503
@@ -0,0 +1,84 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from toolbox_runner.locks import acquire_lock, release_lock, store_lock, LockedError
+from toolbox_runner.models import ToolJobStatus
+
+
+@pytest.fixture
+def echo_job(handler, input_file):
+    job = handler.create_job('test/tool::echo', parameters={'n': 5}, data={'input': str(input_file)})
+    return handler.run_job(job.job_id)
+
+
+def test_archive_and_rehydrate(handler, echo_job):
+    archived = handler.archive_job(echo_job.job_id)
+
+    assert Path(archived.archive).exists()
+    assert not Path(echo_job.out_dir).exists()
+    assert 'echo.txt' in [f.filename for f in handler.storage.list_files(archived)]
+    with handler.storage.open_file(archived, 'echo.txt') as f:
+        assert f.read() == b'hello5'
+
+    restored = handler.rehydrate_job(echo_job.job_id)
+    assert restored.archive is None
+    assert (Path(restored.out_dir) / 'echo.txt').read_text() == 'hello5'
+    assert not Path(archived.archive).exists()
+
+
+def test_concurrent_archiving_writes_one_archive(handler, echo_job):
+    results = []
+
+    def archive():
+        try:
+            results.append(handler.archive_job(echo_job.job_id).archive)
+        except LockedError:
+            results.append(None)
+    threads = [threading.Thread(target=archive) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    archives = [r for r in results if r is not None]
+    assert len(set(archives)) == 1
+    cold = handler.storage.cold_path(handler.runner.mount_path)
+    assert [p.name for p in cold.iterdir()] == [f"{echo_job.job_id}.zip"]
+
+
+def test_running_jobs_are_not_archived(handler, echo_job):
+    job = handler.get_job(echo_job.job_id)
+    job.status = ToolJobStatus.RUNNING
+    handler._save_job(job)
+
+    with pytest.raises(RuntimeError):
+        handler.archive_job(job.job_id)
+
+
+def test_idle_jobs_are_archived(handler, echo_job):
+    handler.storage.archive_after_hours = 0.0
+    assert handler.storage.run_once(handler) == [echo_job.job_id]
+    assert handler.get_job(echo_job.job_id).archive is not None
+
+
+def test_lock_is_exclusive(handler):
+    store = handler.redis_client
+    with store_lock(store, 'job:a', ttl=10):
+        with pytest.raises(LockedError):
+            with store_lock(store, 'job:a', ttl=10):
+                pass
+    with store_lock(store, 'job:a', ttl=10):
+        pass
+
+
+def test_expired_lock_is_not_released_by_its_former_holder(handler):
+    store = handler.redis_client
+    old = acquire_lock(store, 'job:a', ttl=0.05)
+    time.sleep(0.1)
+    new = acquire_lock(store, 'job:a', ttl=10)
+    assert new is not None
+
+    assert not release_lock(store, 'job:a', old)
+    assert acquire_lock(store, 'job:a', ttl=10) is None
+    assert release_lock(store, 'job:a', new)
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from toolbox_runner.handler import FallbackStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FallbackStore(file_location=str(tmp_path / 'store.json'))
+
+
+def run_concurrently(target, n: int = 16):
+    barrier = threading.Barrier(n)
+
+    def run(i: int):
+        barrier.wait()
+        target(i)
+    threads = [threading.Thread(target=run, args=(i, )) for i in range(n)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+
+def test_concurrent_hset_keeps_all_fields(store):
+    run_concurrently(lambda i: [store.hset('hash', mapping={f"{i}-{j}": 'x'}) for j in range(20)])
+    assert len(store.hgetall('hash')) == 16 * 20
+
+
+def test_store_is_saved(store, tmp_path):
+    store.hset('hash', mapping={'a': '1'})
+    store.set('key', 'value')
+
+    reloaded = FallbackStore(file_location=str(tmp_path / 'store.json'))
+    assert reloaded.hgetall('hash') == {'a': '1'}
+    assert reloaded.get('key') == 'value'
+
+
+def test_concurrent_hdel_removes_each_field_once(store):
+    store.hset('hash', mapping={str(i): 'x' for i in range(100)})
+    removed = []
+    run_concurrently(lambda i: removed.extend([f for f in map(str, range(100)) if store.hdel('hash', f) == 1]))
+
+    assert sorted(removed, key=int) == [str(i) for i in range(100)]
+    assert store.hgetall('hash') == {}
@@ -0,0 +1,112 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import select
+
+from toolbox_runner.supervisor import ContainerSupervisor, read_cgroup_usage
+
+
+CONTAINER_ID = 'abc123'
+
+
+class NoApiClient:
+    @property
+    def api(self):
+        raise AssertionError('The Docker API was requested.')
+
+
+def cgroup_v2(root: Path, usage_usec: int, peak: int, current: int = 1024) -> Path:
+    path = root / 'system.slice' / f"docker-{CONTAINER_ID}.scope"
+    path.mkdir(parents=True)
+    (path / 'cpu.stat').write_text(f"usage_usec {usage_usec}\nuser_usec 1\nsystem_usec 1\n")
+    (path / 'memory.current').write_text(f"{current}\n")
+    if peak is not None:
+        (path / 'memory.peak').write_text(f"{peak}\n")
+    return path
+
+
+def test_read_cgroup_v2_usage(tmp_path):
+    cgroup_v2(tmp_path, usage_usec=2_500_000, peak=4096)
+    assert read_cgroup_usage(tmp_path, CONTAINER_ID) == {'cpu_seconds': 2.5, 'peak_memory': 4096}
+
+
+def test_read_cgroup_v2_without_peak_uses_current(tmp_path):
+    cgroup_v2(tmp_path, usage_usec=1_000_000, peak=None, current=2048)
+    assert read_cgroup_usage(tmp_path, CONTAINER_ID)['peak_memory'] == 2048
+
+
+def test_read_cgroup_v1_usage(tmp_path):
+    for controller, name, value in (('cpuacct', 'cpuacct.usage', 3_000_000_000), ('memory', 'memory.max_usage_in_bytes', 8192)):
+        path = tmp_path / controller / 'docker' / CONTAINER_ID
+        path.mkdir(parents=True)
+        (path / name).write_text(f"{value}\n")
+
+    assert read_cgroup_usage(tmp_path, CONTAINER_ID) == {'cpu_seconds': 3.0, 'peak_memory': 8192}
+
+
+def test_missing_cgroup(tmp_path):
+    assert read_cgroup_usage(tmp_path, CONTAINER_ID) is None
+
+
+def test_sample_reads_cgroups_without_api_requests(tmp_path):
+    supervisor = ContainerSupervisor(supervisor_cgroup_root=str(tmp_path))
+    supervisor._watched[CONTAINER_ID] = (None, None)
+    path = cgroup_v2(tmp_path, usage_usec=1_000_000, peak=4096)
+
+    supervisor._sample(NoApiClient())
+    (path / 'cpu.stat').write_text("usage_usec 2000000\n")
+    (path / 'memory.peak').write_text("1024\n")
+    supervisor._sample(NoApiClient())
+
+    # the CPU time is cumulative, the memory the highest seen
+    assert supervisor._usage[CONTAINER_ID] == {'cpu_seconds': 2.0, 'peak_memory': 4096}
+
+
+def test_sample_falls_back_to_the_api(tmp_path):
+    class Api:
+        def stats(self, container_id, stream, one_shot):
+            # cgroup v2 hosts report no max_usage
+            return {'cpu_stats': {'cpu_usage': {'total_usage': 5_000_000_000}}, 'memory_stats': {'usage': 512}}
+
+    class Client:
+        api = Api()
+
+    supervisor = ContainerSupervisor(supervisor_cgroup_root=str(tmp_path))
+    supervisor._watched[CONTAINER_ID] = (None, None)
+    supervisor._sample(Client())
+
+    assert supervisor._usage[CONTAINER_ID] == {'cpu_seconds': 5.0, 'peak_memory': 512}
+
+
+def test_final_usage_is_read_on_exit(tmp_path):
+    # ie. a run shorter than the sampling interval
+    supervisor = ContainerSupervisor(supervisor_cgroup_root=str(tmp_path))
+    supervisor._executor = ThreadPoolExecutor(max_workers=1)
+    future = Future()
+    supervisor._watched[CONTAINER_ID] = (future, lambda exit_code, oom_killed, usage: (exit_code, usage))
+    cgroup_v2(tmp_path, usage_usec=300_000, peak=4096)
+
+    supervisor._resolve(CONTAINER_ID, 0)
+
+    assert future.result(timeout=5) == (0, {'cpu_seconds': 0.3, 'peak_memory': 4096})
+    supervisor._executor.shutdown()
+
+
+def test_usage_is_read_once_the_cgroup_is_empty(tmp_path):
+    supervisor = ContainerSupervisor(supervisor_cgroup_root=str(tmp_path))
+    supervisor._epoll = select.epoll()
+    supervisor._watched[CONTAINER_ID] = (None, None)
+    path = cgroup_v2(tmp_path, usage_usec=300_000, peak=4096)
+    (path / 'cgroup.events').write_text("populated 1\nfrozen 0\n")
+
+    events = open(path / 'cgroup.events')
+    supervisor._events[events.fileno()] = (CONTAINER_ID, events)
+    supervisor._exited(events.fileno())
+    assert CONTAINER_ID not in supervisor._usage
+
+    (path / 'cgroup.events').write_text("populated 0\nfrozen 0\n")
+    supervisor._exited(events.fileno())
+
+    assert supervisor._usage[CONTAINER_ID] == {'cpu_seconds': 0.3, 'peak_memory': 4096}
+    assert supervisor._events == {}
+    assert events.closed
+    supervisor._epoll.close()
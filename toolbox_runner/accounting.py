@@ -0,0 +1,160 @@
+"""
+Resource accounting and quotas per client. Every job is created on behalf of
+a client, identified by a request header. The CPU time, wall time, peak memory
+and stored bytes of its jobs are summed up per client and tool in the store,
+so that all workers and replicas enforce the same quotas.
+"""
+from typing import Optional, List, Dict, Literal, Any
+from datetime import datetime
+
+from pydantic import Field
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import ToolJob, ResourceUsage, UsageReport
+
+
+# usage, that is summed up per quota period - all other usage is current state
+PERIODIC = ('jobs', 'cpu_seconds', 'wall_seconds', 'peak_memory')
+CURRENT = 'current'
+
+# compare and set in one step, as concurrent jobs finish at the same time
+MAX_SCRIPT = """
+if tonumber(redis.call('hget', KEYS[1], ARGV[1]) or '0') < tonumber(ARGV[2]) then
+    return redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, client_id: str, quota: str, used: float, limit: float):
+        self.client_id = client_id
+        self.quota = quota
+        self.used = used
+        self.limit = limit
+        super().__init__(f"Client '{client_id}' reached its quota of {limit:g} {quota} (used: {used:g}).")
+
+
+class ResourceAccountant(BaseSettings):
+    client_header: str = Field('X-Client-Id', description="Request header, that identifies the client. It is not authenticated and should be set by a proxy.")
+    default_client_id: str = Field('anonymous', description="Client of requests without the client header.")
+    quota_period: Literal['day', 'month'] = Field('month', description="Period after which the CPU and wall time quotas reset.")
+
+    # quotas of every client - unlimited if not set
+    quota_max_running_jobs: Optional[int] = None
+    quota_max_cpu_seconds: Optional[float] = None
+    quota_max_wall_seconds: Optional[float] = None
+    quota_max_stored_bytes: Optional[int] = None
+    quota_overrides: Dict[str, Dict[str, Optional[float]]] = Field({}, description="Quotas of single clients, ie. {\"alice\": {\"max_cpu_seconds\": 36000}}. Set a quota to null to lift it.")
+
+    store: Optional[Any] = Field(None, repr=False)
+
+    def client(self, client_id: Optional[str]) -> str:
+        return client_id if client_id is not None and client_id != '' else self.default_client_id
+
+    def period(self, when: Optional[datetime] = None) -> str:
+        when = when or datetime.now()
+        return when.strftime('%Y-%m-%d' if self.quota_period == 'day' else '%Y-%m')
+
+    def limits(self, client_id: str) -> Dict[str, Optional[float]]:
+        limits = {
+            'max_running_jobs': self.quota_max_running_jobs,
+            'max_cpu_seconds': self.quota_max_cpu_seconds,
+            'max_wall_seconds': self.quota_max_wall_seconds,
+            'max_stored_bytes': self.quota_max_stored_bytes,
+        }
+        limits.update(self.quota_overrides.get(client_id, {}))
+        return limits
+
+    def _add(self, job: ToolJob, metric: str, amount: float):
+        if amount == 0:
+            return
+        scope = self.period() if metric in PERIODIC else CURRENT
+        self.store.hincrbyfloat(f"usage:{self.client(job.client_id)}", f"{scope}|{job.tool_name}|{metric}", amount)
+
+    def _max(self, job: ToolJob, metric: str, value: float):
+        key = f"usage:{self.client(job.client_id)}"
+        field = f"{self.period()}|{job.tool_name}|{metric}"
+
+        # the fallback store has no scripts
+        if hasattr(self.store, 'hmax'):
+            self.store.hmax(key, field, value)
+        else:
+            self.store.eval(MAX_SCRIPT, 1, key, field, value)
+
+    def job_created(self, job: ToolJob):
+        self._add(job, 'jobs', 1)
+        self._add(job, 'stored_bytes', job.stored_bytes or 0)
+
+    def job_started(self, job: ToolJob):
+        self._add(job, 'running', 1)
+
+    def job_finished(self, job: ToolJob, wall_seconds: Optional[float]):
+        self._add(job, 'running', -1)
+        self._add(job, 'cpu_seconds', job.cpu_seconds or 0)
+        self._add(job, 'wall_seconds', wall_seconds or 0)
+        if job.peak_memory is not None:
+            self._max(job, 'peak_memory', job.peak_memory)
+
+    def stored_changed(self, job: ToolJob, stored_bytes: int):
+        """
+        Account the new size of the files of the job and set it on the job.
+        """
+        self._add(job, 'stored_bytes', stored_bytes - (job.stored_bytes or 0))
+        job.stored_bytes = stored_bytes
+
+    def clients(self) -> List[str]:
+        return [key.split(':', 1)[-1] for key in self.store.scan_iter('usage:*')]
+
+    def usage(self, client_id: Optional[str] = None, period: Optional[str] = None) -> UsageReport:
+        """
+        Return the usage of the client in the given period, by default the
+        current one. Running jobs and stored bytes are always the current state.
+        """
+        client_id = self.client(client_id)
+        period = period or self.period()
+
+        tools: Dict[str, dict] = {}
+        for field, value in (self.store.hgetall(f"usage:{client_id}") or {}).items():
+            scope, tool_name, metric = field.split('|', 2)
+            if scope != CURRENT and scope != period:
+                continue
+            tools.setdefault(tool_name, {})[metric] = float(value)
+
+        report = UsageReport(client_id=client_id, period=period)
+        for tool_name, metrics in tools.items():
+            usage = ResourceUsage(**{k: int(v) if k in ('jobs', 'running', 'peak_memory', 'stored_bytes') else v for k, v in metrics.items()})
+            report.tools[tool_name] = usage
+            report.jobs += usage.jobs
+            report.running += usage.running
+            report.cpu_seconds += usage.cpu_seconds
+            report.wall_seconds += usage.wall_seconds
+            report.peak_memory = max(report.peak_memory, usage.peak_memory)
+            report.stored_bytes += usage.stored_bytes
+
+        return report
+
+    def check(self, client_id: Optional[str], starting: bool = False) -> Optional[UsageReport]:
+        """
+        Raise QuotaExceeded, if the client used up one of its quotas. The
+        running jobs are only checked, if a job is about to be started.
+        """
+        client_id = self.client(client_id)
+        limits = self.limits(client_id)
+        if all([limit is None for limit in limits.values()]):
+            return None
+        usage = self.usage(client_id)
+
+        checks = [
+            ('max_cpu_seconds', 'CPU seconds', usage.cpu_seconds),
+            ('max_wall_seconds', 'wall seconds', usage.wall_seconds),
+            ('max_stored_bytes', 'stored bytes', usage.stored_bytes),
+        ]
+        if starting:
+            checks.append(('max_running_jobs', 'running jobs', usage.running))
+
+        for name, quota, used in checks:
+            if limits.get(name) is not None and used >= limits[name]:
+                raise QuotaExceeded(client_id, quota, used, limits[name])
+
+        return usage
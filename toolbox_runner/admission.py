@@ -0,0 +1,259 @@
+"""
+Admission control for the endpoints, that stage files or start tools. The
+load of the server is sampled in the background. Once a threshold is crossed,
+new requests are rejected with a 429 or 503 and a Retry-After header, before
+their body is read. Requests wait for a free slot for a short time, before
+they are rejected. Run requests give their slot back, once the run was
+started or queued, thus blocking runs do not hold a slot until they finished.
+
+- 503: the mount volume is almost full or the store is too slow
+- 429: too many requests in flight, tools running or runs queued
+
+The bandwidth of all uploads together can be capped as well.
+"""
+from typing import TYPE_CHECKING, Optional, Dict, Callable, Literal, Any
+from time import monotonic
+import threading
+import warnings
+import asyncio
+import shutil
+import re
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+from starlette.responses import JSONResponse
+
+if TYPE_CHECKING:
+    from toolbox_runner.handler import ToolHandler
+
+
+# the requests that are admitted, by their path
+ADMITTED = {
+    'create': re.compile(r'/(tool/.+/create|pipelines/create)$'),
+    'run': re.compile(r'/(job|pipeline)/[^/]+/run$'),
+}
+
+Kind = Literal['create', 'run']
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(reason)
+
+
+def admission_kind(method: str, path: str) -> Optional[Kind]:
+    if method != 'POST':
+        return None
+    for kind, pattern in ADMITTED.items():
+        if pattern.search(path):
+            return kind
+    return None
+
+
+class AdmissionController(BaseSettings):
+    admission_max_pending: Optional[int] = Field(32, description="Maximum number of create and run requests each, that are handled at the same time.")
+    admission_max_wait: float = Field(2.0, description="Seconds a request waits for a free slot, before it is rejected.")
+    admission_max_running: Optional[int] = Field(None, description="Maximum number of running tools. Further runs are rejected.")
+    admission_max_queued: Optional[int] = Field(100, description="Maximum number of runs waiting in the scheduler queue. Further runs are rejected.")
+    admission_min_free_bytes: Optional[int] = Field(1024 ** 3, description="Minimum free space on the mount volume. New jobs are rejected below.")
+    admission_max_store_latency: Optional[float] = Field(0.5, description="Seconds a store round trip may take, before new jobs are rejected.")
+    admission_retry_after: int = Field(5, description="Seconds the clients are asked to wait, before they retry a rejected request.")
+    admission_interval: float = Field(1.0, description="Seconds between two samples of the free space and the store latency.")
+    upload_max_bytes_per_second: Optional[int] = Field(None, description="Bandwidth of all uploads together. Not limited if not set.")
+
+    _free_bytes: Optional[int] = PrivateAttr(None)
+    _store_latency: Optional[float] = PrivateAttr(None)
+    _runner: Optional[Any] = PrivateAttr(None)
+    _scheduler: Optional[Any] = PrivateAttr(None)
+    _pending: Dict[str, int] = PrivateAttr(default_factory=lambda: {'create': 0, 'run': 0})
+    _slots: Dict[str, asyncio.Semaphore] = PrivateAttr(default_factory=dict)
+    _upload_lock: Optional[asyncio.Lock] = PrivateAttr(None)
+    _allowance: float = PrivateAttr(0.0)
+    _last_upload: float = PrivateAttr(0.0)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+
+    def sample(self, handler: 'ToolHandler'):
+        """
+        Measure the free space of the mount volume and the store latency.
+        """
+        self._runner = handler.runner
+        self._scheduler = handler.scheduler
+        self._free_bytes = shutil.disk_usage(handler.runner.mount_path).free
+
+        t1 = monotonic()
+        handler.redis_client.exists('version')
+        latency = monotonic() - t1
+
+        # a single slow round trip should not reject requests
+        self._store_latency = latency if self._store_latency is None else 0.7 * self._store_latency + 0.3 * latency
+
+    @property
+    def running(self) -> int:
+        return self._runner.running if self._runner is not None else 0
+
+    @property
+    def queued(self) -> int:
+        return self._scheduler.queued if self._scheduler is not None else 0
+
+    def state(self) -> dict:
+        return {
+            'pending': dict(self._pending),
+            'running': self.running,
+            'queued': self.queued,
+            'free_bytes': self._free_bytes,
+            'store_latency': self._store_latency,
+        }
+
+    def check(self, kind: Kind):
+        """
+        Raise Overloaded, if the server can't take a request of this kind.
+        """
+        # freeing space takes longer, ie. until the janitor ran
+        if self.admission_min_free_bytes is not None and self._free_bytes is not None and self._free_bytes < self.admission_min_free_bytes:
+            raise Overloaded(503, f"Only {self._free_bytes} bytes are left on the mount volume.", self.admission_retry_after * 12)
+        if self.admission_max_store_latency is not None and self._store_latency is not None and self._store_latency > self.admission_max_store_latency:
+            raise Overloaded(503, f"The store is responding slowly ({self._store_latency:.2f}s).", self.admission_retry_after)
+        if kind == 'run' and self.admission_max_running is not None and self.running >= self.admission_max_running:
+            raise Overloaded(429, f"{self.running} tools are running already.", self.admission_retry_after)
+        if kind == 'run' and self.admission_max_queued is not None and self.queued >= self.admission_max_queued:
+            raise Overloaded(429, f"{self.queued} runs are queued already.", self.admission_retry_after)
+
+    async def acquire(self, kind: Kind):
+        """
+        Check the load and wait for a free slot. Has to be followed by release.
+        """
+        self.check(kind)
+        if self.admission_max_pending is None:
+            self._pending[kind] += 1
+            return
+
+        # the semaphores belong to the event loop of the server
+        if kind not in self._slots:
+            self._slots[kind] = asyncio.Semaphore(self.admission_max_pending)
+        try:
+            await asyncio.wait_for(self._slots[kind].acquire(), timeout=self.admission_max_wait)
+        except asyncio.TimeoutError:
+            raise Overloaded(429, f"Too many {kind} requests are pending.", self.admission_retry_after)
+        self._pending[kind] += 1
+
+    def release(self, kind: Kind):
+        self._pending[kind] -= 1
+        if kind in self._slots:
+            self._slots[kind].release()
+
+    async def throttle(self, size: int):
+        """
+        Wait until size more bytes may be uploaded. All uploads share one
+        token bucket, that holds up to one second of bandwidth.
+        """
+        rate = self.upload_max_bytes_per_second
+        if rate is None or size == 0:
+            return
+        if self._upload_lock is None:
+            self._upload_lock = asyncio.Lock()
+
+        # the lock is handed out first come, first served
+        async with self._upload_lock:
+            now = monotonic()
+            self._allowance = min(rate, self._allowance + (now - self._last_upload) * rate) - size
+            self._last_upload = now
+            if self._allowance < 0:
+                await asyncio.sleep(-self._allowance / rate)
+
+    def _loop(self, handler: 'ToolHandler'):
+        while not self._stop.is_set():
+            try:
+                self.sample(handler)
+            except Exception as e:
+                warnings.warn(f"Could not sample the server load: {str(e)}")
+            self._stop.wait(self.admission_interval)
+
+    def start(self, handler: 'ToolHandler'):
+        """
+        Start sampling the load in a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(handler, ), daemon=True, name='admission')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class Admission:
+    """
+    The slot of an admitted request. It is released once, either by the
+    endpoint as soon as the request was handed off, or after the response.
+    """
+    def __init__(self, controller: AdmissionController, kind: Kind):
+        self.controller = controller
+        self.kind = kind
+        self._loop = asyncio.get_running_loop()
+        self._lock = threading.Lock()
+        self._released = False
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+
+        # the endpoints run in the thread pool, the slots belong to the event loop
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self.controller.release(self.kind)
+        else:
+            self._loop.call_soon_threadsafe(self.controller.release, self.kind)
+
+
+def admission_release(request) -> Callable[[], None]:
+    """
+    Return a callable, that releases the admission slot of the request. The
+    run endpoints call it, once the run was started or queued.
+    """
+    admission = request.scope.get('state', {}).get('admission')
+    return admission.release if admission is not None else lambda: None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware, that admits the create and run requests and throttles
+    the uploads. Rejected requests are answered before the body is read.
+    """
+    def __init__(self, app, get_controller: Callable[[], AdmissionController]):
+        self.app = app
+        self.get_controller = get_controller
+
+    async def __call__(self, scope, receive, send):
+        kind = admission_kind(scope['method'], scope['path']) if scope['type'] == 'http' else None
+        if kind is None:
+            return await self.app(scope, receive, send)
+
+        controller = self.get_controller()
+        try:
+            await controller.acquire(kind)
+        except Overloaded as e:
+            response = JSONResponse({'detail': str(e)}, status_code=e.status_code, headers={'Retry-After': str(e.retry_after)})
+            return await response(scope, receive, send)
+
+        async def throttled_receive() -> dict:
+            message = await receive()
+            await controller.throttle(len(message.get('body', b'')))
+            return message
+
+        # the endpoint may release the slot earlier
+        admission = Admission(controller, kind)
+        scope.setdefault('state', {})['admission'] = admission
+        try:
+            await self.app(scope, throttled_receive if kind == 'create' else receive, send)
+        finally:
+            admission.release()
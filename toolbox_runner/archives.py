@@ -0,0 +1,24 @@
+"""
+File names of zip and tar archives. Used by the runner, the server and the
+client, thus this module must not import anything heavy.
+"""
+from pathlib import Path
+
+
+# uploaded files with these extensions can be extracted into the in_dir
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_stem(file_name: str) -> str:
+    """
+    Return the file name without the (double) archive extension.
+    """
+    name = Path(file_name).name
+    for ext in sorted(ARCHIVE_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return Path(name).stem
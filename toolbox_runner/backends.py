@@ -0,0 +1,322 @@
+"""
+Execution backends, that run a tool on its initialized mount directories.
+
+- docker: runs the tool image with docker-py (the default)
+- oci: runs the tool image with a docker compatible CLI, ie. podman
+- local: runs the tool as a local process, without any container
+
+The local backend is only meant for trusted tools, that we build ourselves.
+As there is no container, /in and /out do not exist. The tool is started
+with PARAM_FILE pointing to the inputs.json and IN_DIR and OUT_DIR pointing
+to the job directories and the data paths in the inputs.json are host paths.
+"""
+from typing import TYPE_CHECKING, Optional, Dict, List, Literal, Callable, ClassVar, Any
+from concurrent.futures import Future
+from pathlib import Path
+import subprocess
+import selectors
+import threading
+import shlex
+import os
+
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.docker_client import get_client
+from toolbox_runner.supervisor import get_supervisor, LABEL
+
+if TYPE_CHECKING:
+    from toolbox_runner.models import Tool
+
+
+class ExecutionResult(BaseModel):
+    exit_code: int
+    oom_killed: bool = False
+
+    # None, if the backend already wrote the logs to the out_dir
+    stdout: Optional[str] = None
+    stderr: Optional[str] = None
+
+    # None, if the backend could not measure the usage
+    cpu_seconds: Optional[float] = None
+    peak_memory: Optional[int] = None
+
+
+class ExecutionBackend(BaseSettings):
+    # paths of the input directory as seen by the tool
+    container_paths: ClassVar[bool] = True
+
+    # backends are passed to cached functions, ie. to read tool specifications
+    def __hash__(self):
+        return id(self)
+
+    def in_path(self, in_dir: str) -> str:
+        return '/in' if self.container_paths else str(Path(in_dir).resolve())
+
+    def labels(self, tool: 'Tool', extra_args: dict) -> Dict[str, str]:
+        # the label is used to filter the container events
+        return {LABEL: 'true', 'toolbox_runner.tool': tool.name, **extra_args.get('labels', {})}
+
+    def start(self, tool: 'Tool', in_dir: Path, out_dir: Path, host_in_dir: Path, host_out_dir: Path, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
+        """
+        Start the tool and return a future of its ExecutionResult.
+        """
+        raise NotImplementedError
+
+    def read_file(self, docker_image: str, path: str) -> bytes:
+        """
+        Read a file from the tool image, ie. the tool specification.
+        """
+        raise NotImplementedError
+
+
+class DockerBackend(ExecutionBackend):
+    def start(self, tool: 'Tool', in_dir: Path, out_dir: Path, host_in_dir: Path, host_out_dir: Path, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
+        # build the run args
+        run_args = dict(
+            image=tool.docker_image,
+            volumes=[
+                f"{host_in_dir.resolve()}:/in",
+                f"{host_out_dir.resolve()}:/out",
+                *extra_mounts
+            ],
+            environment=[
+                f"TOOL_RUN={tool.name}",
+                *[f"{k.upper()}={v}" for k, v in extra_env.items()]
+            ],
+            labels=self.labels(tool, extra_args),
+            **{k: v for k, v in extra_args.items() if k != 'labels'}
+        )
+
+        from docker.errors import APIError
+
+        # get a docker client
+        client = get_client()
+        supervisor = get_supervisor()
+
+        try:
+            container = client.containers.create(**run_args)
+        except APIError as e:
+            raise RuntimeError(f"Could not create the tool container: {e.explanation}")
+
+        def _collect(exit_code: int, oom_killed: bool, usage: Dict[str, Any]) -> ExecutionResult:
+            # load the logs from the container
+            return ExecutionResult(
+                exit_code=exit_code,
+                oom_killed=oom_killed,
+                stdout=container.logs(stdout=True, stderr=False).decode(),
+                stderr=container.logs(stdout=False, stderr=True).decode(),
+                **usage
+            )
+
+        # watch the container before it is started, to not miss its exit
+        future = supervisor.supervise(container.id, _collect)
+        try:
+            container.start()
+        except APIError as e:
+            supervisor.forget(container.id)
+            raise RuntimeError(f"Could not start the tool container: {e.explanation}")
+        supervisor.started(container.id)
+
+        return future
+
+    def read_file(self, docker_image: str, path: str) -> bytes:
+        client = get_client()
+        return client.containers.run(docker_image, command=f"cat {path}", remove=True)
+
+
+class ProcessReaper:
+    """
+    Waits for all child processes of the process based backends in a single
+    thread. On Linux, the exit of a process is noticed through its pidfd,
+    elsewhere the processes are polled.
+    """
+    def __init__(self, poll_interval: float = 0.05):
+        self.poll_interval = poll_interval
+        self._processes: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._selector = selectors.DefaultSelector() if hasattr(os, 'pidfd_open') else None
+
+        # used to wake up the selector, if a process was added
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        if self._selector is not None:
+            self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def watch(self, process: subprocess.Popen, callback: Callable[[int, Optional[Any]], Any]):
+        """
+        Call callback with the exit code and the resource usage of the
+        process, once it exited. The usage is None, if the process was polled.
+        """
+        with self._lock:
+            pidfd = None
+            if self._selector is not None:
+                try:
+                    pidfd = os.pidfd_open(process.pid)
+                    self._selector.register(pidfd, selectors.EVENT_READ, process.pid)
+                except OSError:
+                    pidfd = None
+            self._processes[process.pid] = (process, callback, pidfd)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name='process-reaper')
+                self._thread.start()
+        os.write(self._wakeup_w, b'\0')
+
+    def _reap(self, pid: int):
+        with self._lock:
+            process, callback, pidfd = self._processes.pop(pid)
+            if pidfd is not None:
+                self._selector.unregister(pidfd)
+                os.close(pidfd)
+
+        # reap the process ourselves, to get its resource usage
+        rusage = None
+        if process.returncode is None:
+            try:
+                _, status, rusage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                pass
+        callback(process.wait(), rusage)
+
+    def _loop(self):
+        while True:
+            if self._selector is not None:
+                for key, _ in self._selector.select(timeout=1.0):
+                    if key.fd == self._wakeup_r:
+                        os.read(self._wakeup_r, 1024)
+                    else:
+                        self._reap(key.data)
+
+            # processes without pidfd are polled
+            with self._lock:
+                polled = [pid for pid, (process, _, pidfd) in self._processes.items() if pidfd is None and process.poll() is not None]
+            for pid in polled:
+                self._reap(pid)
+
+            if self._selector is None:
+                threading.Event().wait(self.poll_interval)
+
+
+_reaper: Optional[ProcessReaper] = None
+_reaper_lock = threading.Lock()
+
+
+def get_reaper() -> ProcessReaper:
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = ProcessReaper()
+        return _reaper
+
+
+def _run_process(command: List[str], out_dir: Path, env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None, measure: bool = True) -> Future:
+    """
+    Start the process with its output written to the log files of the out_dir
+    and return a future of the ExecutionResult. If measure is set, the CPU
+    time and peak memory of the process are reported as its usage.
+    """
+    stdout = open(out_dir / 'STDOUT.log', 'wb')
+    stderr = open(out_dir / 'STDERR.log', 'wb')
+    try:
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr, stdin=subprocess.DEVNULL, env=env, cwd=cwd)
+    finally:
+        # the child process holds its own handles
+        stdout.close()
+        stderr.close()
+
+    future = Future()
+    def _done(exit_code: int, rusage: Optional[Any]):
+        # the handler treats an existing STDERR.log as error
+        err_path = out_dir / 'STDERR.log'
+        if err_path.exists() and err_path.stat().st_size == 0:
+            err_path.unlink()
+
+        usage = {}
+        if measure and rusage is not None:
+            # ru_maxrss is given in kilobytes on Linux
+            usage = {'cpu_seconds': rusage.ru_utime + rusage.ru_stime, 'peak_memory': rusage.ru_maxrss * 1024}
+        future.set_result(ExecutionResult(exit_code=exit_code, **usage))
+    get_reaper().watch(process, _done)
+    return future
+
+
+class OCIBackend(ExecutionBackend):
+    oci_command: str = Field('podman', description="Docker compatible CLI used to run the tool images.")
+    oci_args: List[str] = Field([], description="Additional arguments passed to the run command of the CLI.")
+
+    def start(self, tool: 'Tool', in_dir: Path, out_dir: Path, host_in_dir: Path, host_out_dir: Path, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
+        command = [
+            *shlex.split(self.oci_command), 'run', '--rm',
+            '-v', f"{host_in_dir.resolve()}:/in",
+            '-v', f"{host_out_dir.resolve()}:/out",
+            '-e', f"TOOL_RUN={tool.name}",
+        ]
+        for mount in extra_mounts:
+            command.extend(['-v', mount])
+        for k, v in extra_env.items():
+            command.extend(['-e', f"{k.upper()}={v}"])
+        for k, v in self.labels(tool, extra_args).items():
+            command.extend(['--label', f"{k}={v}"])
+
+        # other docker-py arguments are passed on as CLI flags
+        for k, v in extra_args.items():
+            if k != 'labels':
+                command.append(f"--{k.replace('_', '-')}={v}")
+
+        command.extend([*self.oci_args, tool.docker_image])
+
+        # the container does not run as child of the CLI, its usage is unknown
+        return _run_process(command, out_dir, measure=False)
+
+    def read_file(self, docker_image: str, path: str) -> bytes:
+        return subprocess.run([*shlex.split(self.oci_command), 'run', '--rm', docker_image, 'cat', path], capture_output=True, check=True).stdout
+
+
+class LocalTool(BaseModel):
+    # the directory that takes the place of /src in the tool image
+    src: str
+
+    # the command to run the tool, ie. 'python run.py'
+    command: str
+
+
+class LocalProcessBackend(ExecutionBackend):
+    container_paths: ClassVar[bool] = False
+    local_tools: Dict[str, LocalTool] = Field({}, description="Tools, that can be run as local process, by their docker image.")
+
+    def _local_tool(self, docker_image: str) -> LocalTool:
+        if docker_image not in self.local_tools:
+            raise RuntimeError(f"The image {docker_image} is not configured to be run as local process. Add it to LOCAL_TOOLS.")
+        return self.local_tools[docker_image]
+
+    def start(self, tool: 'Tool', in_dir: Path, out_dir: Path, host_in_dir: Path, host_out_dir: Path, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
+        local_tool = self._local_tool(tool.docker_image)
+        env = {
+            **os.environ,
+            'TOOL_RUN': tool.name,
+            'PARAM_FILE': str(in_dir.resolve() / 'inputs.json'),
+            'IN_DIR': str(in_dir.resolve()),
+            'OUT_DIR': str(out_dir.resolve()),
+            **{k.upper(): str(v) for k, v in extra_env.items()}
+        }
+        return _run_process(shlex.split(local_tool.command), out_dir, env=env, cwd=local_tool.src)
+
+    def read_file(self, docker_image: str, path: str) -> bytes:
+        # paths below /src are read from the source directory of the tool
+        local_tool = self._local_tool(docker_image)
+        return (Path(local_tool.src) / Path(path).relative_to('/src')).read_bytes()
+
+
+BACKENDS = {
+    'docker': DockerBackend,
+    'oci': OCIBackend,
+    'local': LocalProcessBackend,
+}
+
+
+def create_backend(name: Literal['docker', 'oci', 'local']) -> ExecutionBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown execution backend '{name}'. Use one of {list(BACKENDS.keys())}")
+    return BACKENDS[name]()
@@ -0,0 +1,577 @@
+"""
+Clients for the REST API of the tool-runner server. ToolRunnerClient blocks,
+AsyncToolRunnerClient is used with asyncio. Both keep a pool of persistent
+connections, stream uploads and downloads from and to disk and wait for
+jobs using the server-sent job events, falling back to polling with an
+increasing interval, if the server does not offer them.
+
+    with ToolRunnerClient('http://localhost:8000') as client:
+        jobs = client.submit_many([
+            {'tool_name': 'ghcr.io/org/image::tool', 'parameters': {'n': i}, 'files': {'input': 'data.csv'}}
+            for i in range(100)
+        ])
+        for job in client.wait_many([job.job_id for job in jobs]):
+            client.download_results(job.job_id, f"results/{job.job_id}")
+"""
+from typing import TYPE_CHECKING, Optional, List, Dict, Iterable, Iterator, AsyncIterator, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+import asyncio
+import json
+import time
+import os
+
+from toolbox_runner.models import Tool, ToolJob, ToolJobStatus, ToolResultFile, JobEvent, UsageReport, QueueEntry
+from toolbox_runner.archives import is_archive, archive_stem
+
+if TYPE_CHECKING:
+    import httpx
+
+
+CHUNK_SIZE = 1024 * 1024
+FINAL_STATUS = (ToolJobStatus.COMPLETED, ToolJobStatus.FAILED)
+
+# default header of the server, that identifies the client for the accounting
+CLIENT_HEADER = 'X-Client-Id'
+
+
+# the server is overloaded, if these come with a Retry-After header
+RETRY_STATUS = (429, 503)
+
+
+class ToolRunnerAPIError(Exception):
+    def __init__(self, status_code: int, detail: Any, retry_after: Optional[float] = None):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        super().__init__(f"{status_code}: {detail}")
+
+
+def _httpx():
+    # the client is optional, the server does not need it
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("The tool-runner client needs the httpx package to be installed.")
+    return httpx
+
+
+def _headers(headers: Dict[str, str], client_id: Optional[str]) -> Dict[str, str]:
+    return {**headers, CLIENT_HEADER: client_id} if client_id is not None else headers
+
+
+def _check(response: 'httpx.Response') -> 'httpx.Response':
+    if response.is_error:
+        try:
+            detail = response.json().get('detail', response.text)
+        except Exception:
+            detail = response.text
+        try:
+            retry_after = float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            retry_after = None
+        raise ToolRunnerAPIError(response.status_code, detail, retry_after=retry_after)
+    return response
+
+
+def _rewind(kwargs: dict):
+    # uploads are sent again from the start
+    for _, (_, f) in kwargs.get('files') or []:
+        f.seek(0)
+
+
+def _upload_name(name: str, path: Path) -> str:
+    # the server uses the file name to find the input name
+    if is_archive(path.name):
+        ext = path.name[len(archive_stem(path.name)):]
+        return f"{name}{ext}"
+    return f"{name}{path.suffix}"
+
+
+def _create_form(parameters: dict, local_data: dict, files: Dict[str, str | Path], webhook: Optional[str], extract_archives: bool) -> tuple[dict, list]:
+    """
+    Build the form fields and the upload list of a create request. The
+    uploads are opened lazily by the caller, so that they are streamed.
+    """
+    uploads = [(_upload_name(name, Path(path)), name, Path(path)) for name, path in files.items()]
+    form = {
+        'parameters': json.dumps(parameters),
+        'local_data': json.dumps(local_data),
+        'name_mapping': json.dumps({upload_name: name for upload_name, name, _ in uploads}),
+        'extract_archives': 'true' if extract_archives else 'false',
+    }
+    if webhook is not None:
+        form['webhook'] = webhook
+    return form, uploads
+
+
+def _parse_event(lines: List[str]) -> Optional[JobEvent]:
+    data = '\n'.join([line[5:].lstrip() for line in lines if line.startswith('data:')])
+    return JobEvent.model_validate_json(data) if data != '' else None
+
+
+def _iter_events(lines: Iterable[str]) -> Iterator[Optional[JobEvent]]:
+    block = []
+    for line in lines:
+        if line != '':
+            block.append(line)
+            continue
+        # comments are yielded as None, ie. the keep-alive messages
+        event = _parse_event(block)
+        block = []
+        yield event
+
+
+async def _aiter_events(lines: AsyncIterator[str]) -> AsyncIterator[Optional[JobEvent]]:
+    block = []
+    async for line in lines:
+        if line != '':
+            block.append(line)
+            continue
+        # comments are yielded as None, ie. the keep-alive messages
+        event = _parse_event(block)
+        block = []
+        yield event
+
+
+def _finished(job: ToolJob) -> bool:
+    return job.status in FINAL_STATUS
+
+
+class _Backoff:
+    """
+    Polling interval that starts short and grows up to max_interval.
+    """
+    def __init__(self, interval: float = 0.1, max_interval: float = 5.0, factor: float = 1.5):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+
+    def next(self) -> float:
+        interval = self.interval
+        self.interval = min(self.interval * self.factor, self.max_interval)
+        return interval
+
+
+class ToolRunnerClient:
+    def __init__(self, base_url: str = 'http://127.0.0.1:8000', timeout: float = 60.0, max_connections: int = 32, headers: Dict[str, str] = {}, workers: int = 16, client_id: Optional[str] = None, retries: int = 3):
+        httpx = _httpx()
+        self.workers = workers
+        self.retries = retries
+        self._client = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            headers=_headers(headers, client_id),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._client.close()
+
+    def _get(self, url: str, **kwargs) -> Any:
+        return _check(self._client.get(url, **kwargs)).json()
+
+    def _post(self, url: str, **kwargs) -> Any:
+        """
+        Post to the server. Requests rejected by an overloaded server are
+        retried after the time given in its Retry-After header.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return _check(self._client.post(url, **kwargs)).json()
+            except ToolRunnerAPIError as e:
+                if e.status_code not in RETRY_STATUS or e.retry_after is None or attempt == self.retries:
+                    raise
+                time.sleep(e.retry_after)
+                _rewind(kwargs)
+
+    def info(self) -> dict:
+        return self._get('/info')
+
+    def list_tools(self) -> List[str]:
+        return self._get('/tools')
+
+    def get_tool(self, tool_name: str) -> Tool:
+        return Tool.model_validate(self._get(f"/tool/{tool_name}"))
+
+    def create_job(self, tool_name: str, parameters: dict = {}, files: Dict[str, str | Path] = {}, local_data: Dict[str, str] = {}, webhook: Optional[str] = None, extract_archives: bool = False) -> ToolJob:
+        """
+        Create a job. files maps input names to local files, that are
+        uploaded. local_data maps input names to paths or URLs, that the
+        server can read itself.
+        """
+        form, uploads = _create_form(parameters, local_data, files, webhook, extract_archives)
+        with ExitStack() as stack:
+            # the files are read in chunks, while they are sent
+            upload_files = [('files', (upload_name, stack.enter_context(open(path, 'rb')))) for upload_name, _, path in uploads]
+            return ToolJob.model_validate(self._post(f"/tool/{tool_name}/create", data=form, files=upload_files or None))
+
+    def run_job(self, job_id: str, wait: bool = False) -> ToolJob:
+        """
+        Start the job. By default, this returns right after the job started.
+        """
+        return ToolJob.model_validate(self._post(f"/job/{job_id}/run", params={'wait': wait}))
+
+    def get_job(self, job_id: str) -> ToolJob:
+        return ToolJob.model_validate(self._get(f"/job/{job_id}"))
+
+    def list_jobs(self) -> List[ToolJob]:
+        return [ToolJob.model_validate(job) for job in self._get('/jobs')]
+
+    def delete_job(self, job_id: str, keep_files: bool = False):
+        _check(self._client.delete(f"/job/{job_id}", params={'keep_files': keep_files}))
+
+    def list_results(self, job_id: str) -> List[ToolResultFile]:
+        return [ToolResultFile.model_validate(f) for f in self._get(f"/job/{job_id}/results")]
+
+    def usage(self, client_id: Optional[str] = None, period: Optional[str] = None) -> UsageReport:
+        """
+        Return the resource usage of a client, by default of this one.
+        """
+        client_id = client_id or self._client.headers.get(CLIENT_HEADER, 'anonymous')
+        return UsageReport.model_validate(self._get(f"/usage/{client_id}", params={'period': period} if period else {}))
+
+    def queue(self) -> List[QueueEntry]:
+        return [QueueEntry.model_validate(e) for e in self._get("/queue")]
+
+    def submit_many(self, jobs: Iterable[dict], run: bool = True) -> List[ToolJob]:
+        """
+        Create, and by default start, many jobs concurrently. Each job is
+        given as the keyword arguments of create_job.
+        """
+        def _submit(kwargs: dict) -> ToolJob:
+            job = self.create_job(**kwargs)
+            return self.run_job(job.job_id) if run else job
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(_submit, jobs))
+
+    def _poll(self, job_id: str, deadline: Optional[float]) -> ToolJob:
+        backoff = _Backoff()
+        while True:
+            job = self.get_job(job_id)
+            if _finished(job):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} did not finish in time.")
+            time.sleep(backoff.next())
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> ToolJob:
+        """
+        Block until the job finished and return it.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        httpx = _httpx()
+
+        try:
+            with self._client.stream('GET', f"/job/{job_id}/events", timeout=httpx.Timeout(self._client.timeout.connect, read=60.0)) as response:
+                # older servers do not send events
+                if response.status_code in (404, 405):
+                    return self._poll(job_id, deadline)
+                if response.is_error:
+                    response.read()
+                _check(response)
+
+                for event in _iter_events(response.iter_lines()):
+                    if event is not None and event.event == 'deleted':
+                        raise ToolRunnerAPIError(404, f"Job {job_id} was deleted.")
+                    if event is not None and event.job is not None and _finished(event.job):
+                        return event.job
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"Job {job_id} did not finish in time.")
+        except httpx.TransportError:
+            pass
+
+        # the stream ended without a result, ie. due to a proxy
+        return self._poll(job_id, deadline)
+
+    def wait_many(self, job_ids: Iterable[str], timeout: Optional[float] = None) -> Iterator[ToolJob]:
+        """
+        Yield the jobs in the order they finish. All jobs are followed
+        through a single event stream.
+        """
+        pending = set(job_ids)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        httpx = _httpx()
+
+        try:
+            with self._client.stream('GET', '/events', timeout=httpx.Timeout(self._client.timeout.connect, read=60.0)) as response:
+                if response.status_code not in (404, 405):
+                    if response.is_error:
+                        response.read()
+                    _check(response)
+
+                    # the jobs might have finished before the stream was opened
+                    for job_id in list(pending):
+                        job = self.get_job(job_id)
+                        if _finished(job):
+                            pending.discard(job_id)
+                            yield job
+                    if len(pending) == 0:
+                        return
+
+                    for event in _iter_events(response.iter_lines()):
+                        if len(pending) == 0:
+                            return
+                        if event is not None and event.job_id in pending and event.job is not None and _finished(event.job):
+                            pending.discard(event.job_id)
+                            yield event.job
+                            if len(pending) == 0:
+                                return
+                        if deadline is not None and time.monotonic() > deadline:
+                            raise TimeoutError(f"{len(pending)} jobs did not finish in time.")
+        except httpx.TransportError:
+            pass
+
+        # poll the remaining jobs
+        for job_id in list(pending):
+            yield self._poll(job_id, deadline)
+
+    def download(self, job_id: str, file_name: str, dst: str | Path) -> Path:
+        """
+        Stream a single result file to dst. The file only appears at dst,
+        once it is complete.
+        """
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}.part")
+        try:
+            with self._client.stream('GET', f"/job/{job_id}/result/{file_name}") as response:
+                if response.is_error:
+                    response.read()
+                _check(response)
+                with open(tmp, 'wb') as f:
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        f.write(chunk)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return dst
+
+    def download_results(self, job_id: str, dst_dir: str | Path) -> List[Path]:
+        """
+        Download all result files of the job concurrently into dst_dir.
+        """
+        job = self.get_job(job_id)
+        names = [Path(f.path).relative_to(job.out_dir).as_posix() for f in self.list_results(job_id) if not f.is_dir]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda name: self.download(job_id, name, Path(dst_dir) / name), names))
+
+
+class AsyncToolRunnerClient:
+    def __init__(self, base_url: str = 'http://127.0.0.1:8000', timeout: float = 60.0, max_connections: int = 32, headers: Dict[str, str] = {}, concurrency: int = 16, client_id: Optional[str] = None, retries: int = 3):
+        httpx = _httpx()
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            headers=_headers(headers, client_id),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _get(self, url: str, **kwargs) -> Any:
+        return _check(await self._client.get(url, **kwargs)).json()
+
+    async def _post(self, url: str, **kwargs) -> Any:
+        for attempt in range(self.retries + 1):
+            try:
+                return _check(await self._client.post(url, **kwargs)).json()
+            except ToolRunnerAPIError as e:
+                if e.status_code not in RETRY_STATUS or e.retry_after is None or attempt == self.retries:
+                    raise
+                await asyncio.sleep(e.retry_after)
+                _rewind(kwargs)
+
+    async def info(self) -> dict:
+        return await self._get('/info')
+
+    async def list_tools(self) -> List[str]:
+        return await self._get('/tools')
+
+    async def get_tool(self, tool_name: str) -> Tool:
+        return Tool.model_validate(await self._get(f"/tool/{tool_name}"))
+
+    async def create_job(self, tool_name: str, parameters: dict = {}, files: Dict[str, str | Path] = {}, local_data: Dict[str, str] = {}, webhook: Optional[str] = None, extract_archives: bool = False) -> ToolJob:
+        """
+        Create a job. files maps input names to local files, that are
+        uploaded. local_data maps input names to paths or URLs, that the
+        server can read itself.
+        """
+        form, uploads = _create_form(parameters, local_data, files, webhook, extract_archives)
+        with ExitStack() as stack:
+            upload_files = [('files', (upload_name, stack.enter_context(open(path, 'rb')))) for upload_name, _, path in uploads]
+            return ToolJob.model_validate(await self._post(f"/tool/{tool_name}/create", data=form, files=upload_files or None))
+
+    async def run_job(self, job_id: str, wait: bool = False) -> ToolJob:
+        return ToolJob.model_validate(await self._post(f"/job/{job_id}/run", params={'wait': wait}))
+
+    async def get_job(self, job_id: str) -> ToolJob:
+        return ToolJob.model_validate(await self._get(f"/job/{job_id}"))
+
+    async def list_jobs(self) -> List[ToolJob]:
+        return [ToolJob.model_validate(job) for job in await self._get('/jobs')]
+
+    async def delete_job(self, job_id: str, keep_files: bool = False):
+        _check(await self._client.delete(f"/job/{job_id}", params={'keep_files': keep_files}))
+
+    async def list_results(self, job_id: str) -> List[ToolResultFile]:
+        return [ToolResultFile.model_validate(f) for f in await self._get(f"/job/{job_id}/results")]
+
+    async def usage(self, client_id: Optional[str] = None, period: Optional[str] = None) -> UsageReport:
+        client_id = client_id or self._client.headers.get(CLIENT_HEADER, 'anonymous')
+        return UsageReport.model_validate(await self._get(f"/usage/{client_id}", params={'period': period} if period else {}))
+
+    async def queue(self) -> List[QueueEntry]:
+        return [QueueEntry.model_validate(e) for e in await self._get("/queue")]
+
+    async def submit_many(self, jobs: Iterable[dict], run: bool = True) -> List[ToolJob]:
+        """
+        Create, and by default start, many jobs concurrently. Each job is
+        given as the keyword arguments of create_job.
+        """
+        async def _submit(kwargs: dict) -> ToolJob:
+            async with self._semaphore:
+                job = await self.create_job(**kwargs)
+                return await self.run_job(job.job_id) if run else job
+
+        return await asyncio.gather(*[_submit(kwargs) for kwargs in jobs])
+
+    async def _poll(self, job_id: str, deadline: Optional[float]) -> ToolJob:
+        backoff = _Backoff()
+        while True:
+            job = await self.get_job(job_id)
+            if _finished(job):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} did not finish in time.")
+            await asyncio.sleep(backoff.next())
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> ToolJob:
+        """
+        Wait until the job finished and return it.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        httpx = _httpx()
+
+        try:
+            async with self._client.stream('GET', f"/job/{job_id}/events", timeout=httpx.Timeout(self._client.timeout.connect, read=60.0)) as response:
+                if response.status_code in (404, 405):
+                    return await self._poll(job_id, deadline)
+                if response.is_error:
+                    await response.aread()
+                _check(response)
+
+                async for event in _aiter_events(response.aiter_lines()):
+                    if event is not None and event.event == 'deleted':
+                        raise ToolRunnerAPIError(404, f"Job {job_id} was deleted.")
+                    if event is not None and event.job is not None and _finished(event.job):
+                        return event.job
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"Job {job_id} did not finish in time.")
+        except httpx.TransportError:
+            pass
+
+        return await self._poll(job_id, deadline)
+
+    async def wait_many(self, job_ids: Iterable[str], timeout: Optional[float] = None) -> List[ToolJob]:
+        """
+        Wait for all jobs and return them in the given order. All jobs are
+        followed through a single event stream.
+        """
+        job_ids = list(job_ids)
+        pending = set(job_ids)
+        finished: Dict[str, ToolJob] = {}
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        httpx = _httpx()
+
+        async def _get(job_id: str) -> ToolJob:
+            async with self._semaphore:
+                return await self.get_job(job_id)
+
+        try:
+            async with self._client.stream('GET', '/events', timeout=httpx.Timeout(self._client.timeout.connect, read=60.0)) as response:
+                if response.status_code not in (404, 405):
+                    if response.is_error:
+                        await response.aread()
+                    _check(response)
+
+                    # the jobs might have finished before the stream was opened
+                    for job in await asyncio.gather(*[_get(job_id) for job_id in pending]):
+                        if _finished(job):
+                            finished[job.job_id] = job
+                            pending.discard(job.job_id)
+
+                    if len(pending) > 0:
+                        async for event in _aiter_events(response.aiter_lines()):
+                            if event is not None and event.job_id in pending and event.job is not None and _finished(event.job):
+                                finished[event.job_id] = event.job
+                                pending.discard(event.job_id)
+                                if len(pending) == 0:
+                                    break
+                            if deadline is not None and time.monotonic() > deadline:
+                                raise TimeoutError(f"{len(pending)} jobs did not finish in time.")
+        except httpx.TransportError:
+            pass
+
+        # poll the remaining jobs
+        async def _poll(job_id: str) -> ToolJob:
+            async with self._semaphore:
+                return await self._poll(job_id, deadline)
+
+        for job in await asyncio.gather(*[_poll(job_id) for job_id in pending]):
+            finished[job.job_id] = job
+
+        return [finished[job_id] for job_id in job_ids]
+
+    async def download(self, job_id: str, file_name: str, dst: str | Path) -> Path:
+        """
+        Stream a single result file to dst. The file only appears at dst,
+        once it is complete.
+        """
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}.part")
+        try:
+            async with self._client.stream('GET', f"/job/{job_id}/result/{file_name}") as response:
+                if response.is_error:
+                    await response.aread()
+                _check(response)
+                with open(tmp, 'wb') as f:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        f.write(chunk)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return dst
+
+    async def download_results(self, job_id: str, dst_dir: str | Path) -> List[Path]:
+        """
+        Download all result files of the job concurrently into dst_dir.
+        """
+        job = await self.get_job(job_id)
+        names = [Path(f.path).relative_to(job.out_dir).as_posix() for f in await self.list_results(job_id) if not f.is_dir]
+
+        async def _download(name: str) -> Path:
+            async with self._semaphore:
+                return await self.download(job_id, name, Path(dst_dir) / name)
+
+        return await asyncio.gather(*[_download(name) for name in names])
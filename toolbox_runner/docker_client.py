@@ -1,11 +1,19 @@
-from typing import Union
-import docker
-from docker import DockerClient
+from typing import TYPE_CHECKING, Optional, Union
+import threading
 
+# docker is only imported, once a client is needed
+if TYPE_CHECKING:
+    from docker import DockerClient
 
 
+# the client is shared between all threads
+_client: Optional['DockerClient'] = None
+_client_lock = threading.Lock()
+
 
 def docker_version() -> Union[str, 'False']:
+    import docker
+
     try:
         # try to instantiate the client
         client = docker.from_env()
@@ -18,9 +26,21 @@ def docker_version() -> Union[str, 'False']:
         return False
 
 
-def get_client() -> DockerClient:
-    if docker_version():
-        return docker.from_env()
+def get_client() -> 'DockerClient':
+    """
+    Return the docker client of this process. The client is only created
+    once, to reuse its connections for all containers.
+    """
+    global _client
+    import docker
+
+    with _client_lock:
+        if _client is not None:
+            return _client
+
+        if docker_version():
+            _client = docker.from_env()
+            return _client
     
-    else:
-        raise RuntimeError('Docker is not available. Have you started the docker daemon?')
+        else:
+            raise RuntimeError('Docker is not available. Have you started the docker daemon?')
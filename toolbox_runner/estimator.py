@@ -0,0 +1,154 @@
+"""
+Runtime and memory estimates of tool runs, learned from the finished jobs of
+each tool. The estimate is the median runtime, unless a linear regression on
+the numeric parameters of the tool predicts the history clearly better.
+Outliers are removed by their distance to the median, before anything is fitted.
+"""
+from typing import Optional, List, Dict, Tuple, Any
+from time import monotonic
+import threading
+import json
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import ToolJob, RuntimeEstimate
+
+
+def _median(values: List[float]) -> float:
+    values = sorted(values)
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 == 1 else (values[mid - 1] + values[mid]) / 2
+
+
+def _quantile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def numeric_parameters(parameters: dict) -> Dict[str, float]:
+    # booleans are integers in Python, but not a size of the problem
+    return {k: float(v) for k, v in parameters.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    """
+    Solve the linear system a x = b by Gaussian elimination. Returns None,
+    if a is singular.
+    """
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                factor = m[r][col] / m[col][col]
+                m[r] = [x - factor * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def fit_linear(xs: List[List[float]], ys: List[float], ridge: float = 1e-6) -> Optional[List[float]]:
+    """
+    Least squares fit of ys = w0 + w1 * x1 + ... The features are few, so
+    the normal equations are solved directly. The intercept is not regularized.
+    """
+    rows = [[1.0, *x] for x in xs]
+    k = len(rows[0])
+    ata = [[sum(r[i] * r[j] for r in rows) + (ridge if i == j and i > 0 else 0.0) for j in range(k)] for i in range(k)]
+    aty = [sum(r[i] * y for r, y in zip(rows, ys)) for i in range(k)]
+    return _solve(ata, aty)
+
+
+class RuntimeEstimator(BaseSettings):
+    estimator_history: int = Field(200, description="Number of finished jobs per tool, that are kept to estimate the runtime.")
+    estimator_min_samples: int = Field(5, description="Number of finished jobs of a tool needed, before it is estimated.")
+    estimator_cache_seconds: float = Field(60.0, description="Seconds a fitted estimate is re-used, before the history is loaded again.")
+
+    store: Optional[Any] = Field(None, repr=False)
+
+    _models: Dict[str, Tuple[float, Optional[dict]]] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def history(self, tool_name: str) -> List[dict]:
+        return [json.loads(s) for s in self.store.lrange(f"runtimesamples:{tool_name}", 0, -1)]
+
+    def record(self, job: ToolJob, parameters: dict, runtime: float):
+        """
+        Add the runtime of a finished job to the history of its tool.
+        """
+        sample = {'parameters': numeric_parameters(parameters), 'runtime': runtime, 'memory': job.peak_memory}
+
+        # both are atomic, thus concurrent jobs of all replicas are kept
+        self.store.rpush(f"runtimesamples:{job.tool_name}", json.dumps(sample))
+        self.store.ltrim(f"runtimesamples:{job.tool_name}", -self.estimator_history, -1)
+        with self._lock:
+            self._models.pop(job.tool_name, None)
+
+    def fit(self, tool_name: str) -> Optional[dict]:
+        samples = self.history(tool_name)
+        if len(samples) < self.estimator_min_samples:
+            return None
+        runtimes = [s['runtime'] for s in samples]
+        median = _median(runtimes)
+
+        # drop the outliers, ie. runs on a busy host
+        mad = _median([abs(r - median) for r in runtimes])
+        if mad > 0:
+            samples = [s for s in samples if abs(s['runtime'] - median) <= 5 * 1.4826 * mad]
+        runtimes = [s['runtime'] for s in samples]
+        memory = [s['memory'] for s in samples if s.get('memory') is not None]
+
+        model = {
+            'samples': len(samples),
+            'median': _median(runtimes),
+            'memory': int(_quantile(memory, 0.9)) if len(memory) > 0 else None,
+            'names': [],
+            'weights': None,
+        }
+
+        # only parameters given in all runs and not always the same can explain the runtime
+        names = sorted(set.intersection(*[set(s['parameters'].keys()) for s in samples]))
+        names = [n for n in names if len({s['parameters'][n] for s in samples}) > 1]
+        if len(names) == 0 or len(samples) < len(names) + 3:
+            return model
+
+        xs = [[s['parameters'][n] for n in names] for s in samples]
+        weights = fit_linear(xs, runtimes)
+        if weights is None:
+            return model
+
+        # use the regression only, if it explains the history clearly better
+        error = _median([abs(r - sum(w * x for w, x in zip(weights, [1.0, *row]))) for row, r in zip(xs, runtimes)])
+        if error < 0.8 * _median([abs(r - model['median']) for r in runtimes]):
+            model.update(names=names, weights=weights)
+        return model
+
+    def _model(self, tool_name: str) -> Optional[dict]:
+        with self._lock:
+            cached = self._models.get(tool_name)
+        if cached is not None and monotonic() - cached[0] < self.estimator_cache_seconds:
+            return cached[1]
+
+        model = self.fit(tool_name)
+        with self._lock:
+            self._models[tool_name] = (monotonic(), model)
+        return model
+
+    def predict(self, tool_name: str, parameters: dict = {}) -> Optional[RuntimeEstimate]:
+        """
+        Estimate the runtime and peak memory of a run of the tool with the
+        given parameters. Returns None, if the tool did not run often enough.
+        """
+        model = self._model(tool_name)
+        if model is None:
+            return None
+
+        values = numeric_parameters(parameters)
+        if model['weights'] is not None and all([n in values for n in model['names']]):
+            runtime = sum(w * x for w, x in zip(model['weights'], [1.0, *[values[n] for n in model['names']]]))
+            return RuntimeEstimate(runtime=max(runtime, 0.0), memory=model['memory'], samples=model['samples'], method='regression')
+
+        return RuntimeEstimate(runtime=model['median'], memory=model['memory'], samples=model['samples'], method='median')
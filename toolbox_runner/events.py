@@ -0,0 +1,207 @@
+"""
+Event bus for job state changes. Clients can subscribe to the events
+instead of polling the store for changes.
+"""
+from typing import TYPE_CHECKING, Optional, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+import threading
+import warnings
+import asyncio
+import queue
+import time
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import JobEvent, ToolJob
+
+if TYPE_CHECKING:
+    from redis import Redis
+
+
+CHANNEL = 'toolbox_runner:jobs'
+
+
+class Subscription:
+    """
+    A queue of events for a single subscriber. If the subscriber is too slow,
+    the oldest events are dropped. Subscriptions created with an event loop
+    are read using aget, without blocking a thread.
+    """
+    def __init__(self, bus: 'EventBus', job_id: Optional[str] = None, loop: Optional[asyncio.AbstractEventLoop] = None, maxsize: int = 1000):
+        self.bus = bus
+        self.job_id = job_id
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize) if loop is not None else queue.Queue(maxsize=maxsize)
+
+    def _put_nowait(self, event: JobEvent):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except (queue.Full, asyncio.QueueFull):
+                try:
+                    self._queue.get_nowait()
+                except (queue.Empty, asyncio.QueueEmpty):
+                    pass
+
+    def put(self, event: JobEvent):
+        if self.job_id is not None and event.job_id != self.job_id:
+            return
+        
+        if self._loop is None:
+            self._put_nowait(event)
+        else:
+            # asyncio queues are not thread-safe
+            try:
+                self._loop.call_soon_threadsafe(self._put_nowait, event)
+            except RuntimeError:
+                # the loop is already closed
+                self.close()
+
+    def get(self, timeout: Optional[float] = None) -> JobEvent | None:
+        """
+        Return the next event or None, if there was no event within timeout.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout: Optional[float] = None) -> JobEvent | None:
+        """
+        Return the next event or None, if there was no event within timeout.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class EventBus:
+    """
+    In-process event bus. This is used together with the FallbackStore, as
+    there can only be a single process using the store file anyway.
+    """
+    def __init__(self):
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: Optional[str] = None, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        subscription = Subscription(self, job_id=job_id, loop=loop)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def _dispatch(self, event: JobEvent):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def publish(self, event: JobEvent):
+        self._dispatch(event)
+
+    def close(self):
+        pass
+
+
+class RedisEventBus(EventBus):
+    """
+    Event bus using Redis pub/sub, to share events between all workers and
+    replicas. Each process holds a single subscription to Redis and passes
+    the events on to its local subscribers.
+    """
+    def __init__(self, client: 'Redis'):
+        super().__init__()
+        self.client = client
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    self._pubsub.subscribe(CHANNEL)
+                message = self._pubsub.get_message(timeout=1.0)
+                if message is not None and message['type'] == 'message':
+                    self._dispatch(JobEvent.model_validate_json(message['data']))
+            except Exception as e:
+                warnings.warn(f"Lost the subscription to the job events: {str(e)}")
+                self._pubsub = None
+                self._stop.wait(1.0)
+
+    def subscribe(self, job_id: Optional[str] = None, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        # the Redis subscription is only started, if there are any subscribers
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, daemon=True, name='job-events')
+            self._thread.start()
+        return super().subscribe(job_id=job_id, loop=loop)
+
+    def publish(self, event: JobEvent):
+        self.client.publish(CHANNEL, event.model_dump_json())
+
+    def close(self):
+        self._stop.set()
+
+
+class WebhookNotifier(BaseSettings):
+    webhook_urls: List[str] = Field([], description="URLs that are notified about every finished job.")
+    webhook_timeout: float = 10.0
+    webhook_retries: int = 3
+
+    _executor: ThreadPoolExecutor = PrivateAttr(default_factory=lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix='webhook'))
+
+    def _send(self, url: str, payload: bytes):
+        error = 'unexpected response'
+        for attempt in range(self.webhook_retries):
+            try:
+                request = Request(url, data=payload, headers={'Content-Type': 'application/json'}, method='POST')
+                with urlopen(request, timeout=self.webhook_timeout) as response:
+                    if response.status < 300:
+                        return
+                    error = f"status {response.status}"
+            except Exception as e:
+                error = str(e)
+            if attempt < self.webhook_retries - 1:
+                time.sleep(2 ** attempt)
+        warnings.warn(f"Could not deliver webhook to {url}: {error}")
+
+    def notify(self, event: JobEvent, extra_urls: List[str] = []):
+        """
+        Send the event to all configured URLs in the background.
+        """
+        payload = event.model_dump_json().encode()
+        for url in [*self.webhook_urls, *extra_urls]:
+            self._executor.submit(self._send, url, payload)
+
+
+def job_event(event: str, job: ToolJob) -> JobEvent:
+    return JobEvent(event=event, job_id=job.job_id, status=job.status, job=job)
+
+
+def create_event_bus(store: Any) -> EventBus:
+    """
+    Create the event bus matching the store in use.
+    """
+    if hasattr(store, 'pubsub'):
+        return RedisEventBus(store)
+    return EventBus()
@@ -1,85 +1,279 @@
-from typing import Optional, Generator, List, Dict
+from typing import Optional, Generator, List, Dict, Tuple, BinaryIO, Callable
 from typing import Any
 from pathlib import Path
 import json
+import os
 import warnings
 import uuid
 from functools import cache
-import shutil
+from datetime import datetime, timedelta
+from time import monotonic
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from functools import partial
 
-import redis
-from redis import ConnectionError
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
-from toolbox_runner.runner import ToolRunner
+from toolbox_runner.runner import ToolRunner, shard_path
+from toolbox_runner.janitor import MountJanitor, directory_size
+from toolbox_runner.storage import TieredStorage
+from toolbox_runner.locks import store_lock
+from toolbox_runner.results import resolve_result_path
+from toolbox_runner.remote import is_remote
+from toolbox_runner.ingest import ResultIngestor
+from toolbox_runner.accounting import ResourceAccountant
+from toolbox_runner.admission import AdmissionController
+from toolbox_runner.estimator import RuntimeEstimator
+from toolbox_runner.scheduler import JobScheduler
+from toolbox_runner.registry import ToolRegistry
+from toolbox_runner.events import EventBus, WebhookNotifier, create_event_bus, job_event
 from toolbox_runner.tools import ToolSniffer
 from toolbox_runner.models import ToolJob, ToolJobStatus, ToolResultStatus, Tool
+from toolbox_runner.models import Pipeline, PipelineStep, PipelineJob, StepOutput
 
 class FallbackStore:
     __file_location: str = Path(__file__).parent / 'store.json'
 
-    def __init__(self):
+    def __init__(self, file_location: Optional[str] = None):
+        # the store may be written from several threads, ie. by pipelines
+        self._lock = threading.Lock()
+
+        # keys set with px are locks of this process, they are not saved, as
+        # they would never expire after a crash
+        self._expiring: Dict[str, Tuple[Any, float]] = {}
+
+        if file_location is not None:
+            self.__file_location = Path(file_location)
+
         if not self.__file_location.exists():
             self.store = {}
         else:
             with open(self.__file_location, 'r') as f:
                 self.store = json.load(f)
 
+    def _expiring_value(self, key: str) -> Any:
+        value, expires = self._expiring.get(key, (None, 0.0))
+        return value if expires > monotonic() else None
+
     def exists(self, key: str) -> bool:
-        return key in self.store
+        return key in self.store or self._expiring_value(key) is not None
     
     def get(self, key: str) -> str | int | dict | None:
+        if key in self._expiring:
+            return self._expiring_value(key)
         return self.store.get(key, None)
 
     def hgetall(self, key: str) -> dict | None:
         return self.store.get(key, {})
     
     def scan_iter(self, key: str | None = None) -> Generator[str, None, None]:
-        for k in self.store.keys():
+        # iterate a copy, other threads might add keys meanwhile
+        for k in list(self.store.keys()):
             if key is not None and not k.startswith(key.strip('*')):
                 continue
             yield k
 
-    def set(self, key: str, value: str | int | dict) -> bool:
-        # set into the store
-        self.store[key] = value
+    def set(self, key: str, value: str | int | dict, nx: bool = False, px: Optional[int] = None) -> bool:
+        with self._lock:
+            # like redis, nx only sets keys that do not exist
+            if nx and (key in self.store or self._expiring_value(key) is not None):
+                return False
+            if px is not None:
+                self._expiring[key] = (value, monotonic() + px / 1000)
+                return True
+            self._expiring.pop(key, None)
 
-        # write to the file
-        with open(self.__file_location, 'w') as f:
-            json.dump(self.store, f, indent=4)
+            # set into the store
+            self.store[key] = value
+
+            # write to the file
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
         
         return True
     
     def hset(self, key: str, mapping: dict) -> bool:
-        return self.set(key, mapping)
+        # like redis, update existing fields of the hash, the hash is read and written under the same lock
+        with self._lock:
+            self.store[key] = {**self.store.get(key, {}), **mapping}
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+        return True
     
+    def hincrbyfloat(self, key: str, field: str, amount: float = 1.0) -> float:
+        # the value is read and written under the same lock
+        with self._lock:
+            mapping = dict(self.store.get(key, {}))
+            mapping[field] = float(mapping.get(field, 0)) + amount
+            self.store[key] = mapping
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+        
+        return mapping[field]
+
+    def hmax(self, key: str, field: str, value: float) -> bool:
+        """
+        Set the field to value, if it is higher than the current value. Redis
+        uses a script for the same, see toolbox_runner.accounting.
+        """
+        with self._lock:
+            mapping = dict(self.store.get(key, {}))
+            if float(mapping.get(field, 0)) >= value:
+                return False
+            mapping[field] = value
+            self.store[key] = mapping
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+        
+        return True
+
+    def hsetnx(self, key: str, field: str, value: str) -> bool:
+        with self._lock:
+            mapping = dict(self.store.get(key, {}))
+            if field in mapping:
+                return False
+            mapping[field] = value
+            self.store[key] = mapping
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+        return True
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            self.store[key] = int(self.store.get(key, 0)) + amount
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+            return self.store[key]
+
+    def _redis_range(self, start: int, end: int) -> slice:
+        # redis includes the end of a range, -1 is the last element
+        return slice(start, end + 1 if end != -1 else None)
+
+    def rpush(self, key: str, *values: str) -> int:
+        with self._lock:
+            self.store[key] = [*self.store.get(key, []), *values]
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+            return len(self.store[key])
+
+    def ltrim(self, key: str, start: int, end: int) -> bool:
+        with self._lock:
+            self.store[key] = self.store.get(key, [])[self._redis_range(start, end)]
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+        return True
+
+    def lrange(self, key: str, start: int, end: int) -> List[str]:
+        return list(self.store.get(key, [])[self._redis_range(start, end)])
+
+    def hdel(self, key: str, *fields: str) -> int:
+        # the number of removed fields is used to claim jobs, thus this has to be atomic
+        with self._lock:
+            mapping = dict(self.store.get(key, {}))
+            removed = [f for f in fields if f in mapping]
+            for f in removed:
+                del mapping[f]
+            self.store[key] = mapping
+
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+        return len(removed)
+
     def delete(self, key: str):
-        if key not in self.store:
-            raise KeyError(f"Key '{key}' not found in store")
+        with self._lock:
+            if self._expiring.pop(key, None) is not None:
+                return
+            if key not in self.store:
+                raise KeyError(f"Key '{key}' not found in store")
         
-        del self.store[key]
+            del self.store[key]
+            
+            with open(self.__file_location, 'w') as f:
+                json.dump(self.store, f, indent=4)
+
+    def compare_and_delete(self, key: str, value: str) -> bool:
+        """
+        Delete the key only, if it still holds the given value. Redis uses a
+        script for the same, see toolbox_runner.locks.
+        """
+        with self._lock:
+            if self._expiring_value(key) == value:
+                del self._expiring[key]
+                return True
+            if key in self.store and self.store[key] == value:
+                del self.store[key]
+
+                with open(self.__file_location, 'w') as f:
+                    json.dump(self.store, f, indent=4)
+                return True
         
-        with open(self.__file_location, 'w') as f:
-            json.dump(self.store, f, indent=4)
+        return False
 
 
 @cache
-def get_cached_tool(tool_name: str, docker_image: str) -> Tool | None:
+def get_cached_tool(tool_name: str, docker_image: str, store: Optional[Any] = None, backend: Optional[Any] = None) -> Tool | None:
+    # other workers or replicas might have saved the tool specification already
+    key = f"toolspec:{docker_image}::{tool_name}"
+    if store is not None:
+        spec = store.get(key)
+        if spec is not None:
+            return Tool.model_validate_json(spec)
+
     # use a tool sniffer to get the tool
-    sniffer = ToolSniffer(docker_image=docker_image)
+    sniffer = ToolSniffer(docker_image=docker_image, backend=backend)
     tool = sniffer.tool(name=tool_name)
 
+    # save the specification, so that it is only sniffed once
+    if store is not None:
+        store.set(key, tool.model_dump_json())
+
     return tool
 
+class PipelineStepError(Exception):
+    """
+    A step of a pipeline could not be prepared, ie. as one of its inputs does
+    not exist. The failed pipeline job is saved before this is raised.
+    """
+    def __init__(self, message: str, pipeline_job: PipelineJob):
+        self.pipeline_job = pipeline_job
+        super().__init__(message)
+
+
 class ToolHandler(BaseSettings):
     redis_host: str = '127.0.0.1'
     redis_port: int = 6379
+    redis_connect_timeout: float = Field(2.0, description="Seconds to wait for the Redis server, before the fallback store is used.")
+    store_file: Optional[str] = Field(None, description="Location of the file used as store, if Redis is not available.")
 
-    tool_map: Dict[str, str] = Field({}, repr=False)
+    pipeline_workers: int = Field(4, description="Maximum number of pipeline steps that are run in parallel.")
 
-    redis_client: Optional[redis.Redis | FallbackStore] = Field(None, repr=False)
+    redis_client: Optional[Any] = Field(None, repr=False)
     runner: Optional[ToolRunner] = Field(None, repr=False)
+    janitor: Optional[MountJanitor] = Field(None, repr=False)
+    storage: Optional[TieredStorage] = Field(None, repr=False)
+    events: Optional[EventBus] = Field(None, repr=False)
+    webhooks: Optional[WebhookNotifier] = Field(None, repr=False)
+    ingestor: Optional[ResultIngestor] = Field(None, repr=False)
+    accounting: Optional[ResourceAccountant] = Field(None, repr=False)
+    admission: Optional[AdmissionController] = Field(None, repr=False)
+    estimator: Optional[RuntimeEstimator] = Field(None, repr=False)
+    scheduler: Optional[JobScheduler] = Field(None, repr=False)
+    registry: Optional[ToolRegistry] = Field(None, repr=False)
 
     def _hset(self, key: str, value: dict):
         """
@@ -88,48 +282,138 @@ class ToolHandler(BaseSettings):
         """
         self.redis_client.hset(key, mapping={k: v for k, v in value.items() if v is not None})
 
+    def _save_job(self, job: ToolJob, event: str = 'updated'):
+        """
+        Save the job to the store and publish the change to all subscribers.
+        Finished jobs are also send to the webhooks.
+        """
+        self._hset(f"tooljob:{job.job_id}", job.model_dump())
+
+        # publishing must not break the job handling
+        try:
+            self.events.publish(job_event(event, job))
+            if job.status in (ToolJobStatus.COMPLETED, ToolJobStatus.FAILED):
+                self.webhooks.notify(job_event(event, job), extra_urls=[job.webhook] if job.webhook is not None else [])
+        except Exception as e:
+            warnings.warn(f"Could not publish the update of job {job.job_id}: {str(e)}")
+
     def model_post_init(self, __context: Any) -> None:
-        # create the redis client
-        self.redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=0, decode_responses=True)
+        # redis is only imported, when a handler is created
+        import redis
+        from redis.retry import Retry
+        from redis.backoff import NoBackoff, ExponentialBackoff
+
+        # create the redis client - the first connection is not retried to fail fast
+        self.redis_client = redis.Redis(
+            host=self.redis_host,
+            port=self.redis_port,
+            db=0,
+            decode_responses=True,
+            socket_connect_timeout=self.redis_connect_timeout,
+            retry=Retry(NoBackoff(), 0)
+        )
 
         # try to get the version, set if it does not exist
         try:
             if not self.redis_client.exists('version'):
                 self.redis_client.set('version', 1)
-        except ConnectionError:
+            self.redis_client.set_retry(Retry(ExponentialBackoff(), 3))
+        except (redis.ConnectionError, redis.TimeoutError):
             warnings.warn(f"Could not connect to Redis server, is it running at {self.redis_host}:{self.redis_port}? Using fallback store. Note that this will be a file...")
-            self.redis_client = FallbackStore()
+            self.redis_client = FallbackStore(file_location=self.store_file)
 
         # create an instance of the tool runner
         if self.runner is None:
             self.runner = ToolRunner()
+        
+        # create the janitor, that cleans up the mount directories
+        if self.janitor is None:
+            self.janitor = MountJanitor()
+
+        # create the storage tiering, that archives idle jobs
+        if self.storage is None:
+            self.storage = TieredStorage()
+
+        # create the event bus for job updates
+        if self.events is None:
+            self.events = create_event_bus(self.redis_client)
+        if self.webhooks is None:
+            self.webhooks = WebhookNotifier()
+
+        # create the ingestor, that indexes the results of finished jobs
+        if self.ingestor is None:
+            self.ingestor = ResultIngestor()
+
+        # create the accounting of the resources used by each client
+        if self.accounting is None:
+            self.accounting = ResourceAccountant()
+        self.accounting.store = self.redis_client
+
+        # create the admission control, that sheds load under pressure
+        if self.admission is None:
+            self.admission = AdmissionController()
+
+        # create the runtime estimator and the scheduler, that orders the runs by it
+        if self.estimator is None:
+            self.estimator = RuntimeEstimator()
+        self.estimator.store = self.redis_client
+        if self.scheduler is None:
+            self.scheduler = JobScheduler()
+        self.scheduler.store = self.redis_client
 
         # load existing registered tools from the Redis store
-        if self.redis_client.exists('tool_map'):
-            self.tool_map = self.redis_client.hgetall('tool_map')
+        if self.registry is None:
+            self.registry = ToolRegistry()
+        self.registry.store = self.redis_client
+        self.registry.load()
 
         return super().model_post_init(__context)
+
+    @property
+    def tool_map(self) -> Dict[str, str]:
+        return self.registry.tools
     
     def get_tool(self, tool_name: str) -> Tool | None:
         # get the docker image name of the tool
-        docker_image = self.tool_map.get(tool_name, None)
+        docker_image = self.registry.get(tool_name)
         if docker_image is None:
             return None
         
         # use the function with cache
-        tool = get_cached_tool(tool_name, docker_image)
+        tool = get_cached_tool(tool_name, docker_image, self.redis_client, self.runner.backend)
 
         return tool
     
     def clear_tool_cache(self):
-        get_cached_tool.cache_clear()
+        # remove the saved specifications
+        for key in list(self.redis_client.scan_iter('toolspec:*')):
+            self.redis_client.delete(key)
+
+        # and drop the cached ones of all workers and replicas
+        self.registry.invalidate()
+
+    def warm_tool_cache(self, max_workers: int = 4) -> int:
+        """
+        Load the specifications of all registered tools into the cache.
+        Returns the number of tools that could be loaded.
+        """
+        def load(tool_name: str) -> bool:
+            try:
+                return self.get_tool(tool_name) is not None
+            except Exception as e:
+                warnings.warn(f"Could not load the specification of tool {tool_name}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return sum(executor.map(load, list(self.tool_map.keys())))
 
     def register_tool(self, tool_name: str, docker_image: str) -> bool:
-        if tool_name in self.tool_map:
+        """
+        Register the tool for all workers and replicas. Registering a tool
+        again with the same docker image does nothing.
+        """
+        if not self.registry.register(tool_name, docker_image):
             raise RuntimeError(f"A tool of name {tool_name} is already registered. Currently, tool names have to be unique.")
-        
-        self.tool_map[tool_name] = docker_image
-        self._hset('tool_map', self.tool_map)
 
         return True
 
@@ -140,11 +424,18 @@ class ToolHandler(BaseSettings):
         parameters: dict = {},
         data: dict = {},
         in_dir: Optional[str] = None,
-        out_dir: Optional[str] = None
+        out_dir: Optional[str] = None,
+        webhook: Optional[str] = None,
+        archives: Dict[str, Tuple[str, BinaryIO]] = {},
+        client_id: Optional[str] = None
     ) -> ToolJob:
         """
         Create a new job for running by setting up the ToolRunner and creating a
         ToolJob entry in the Redis database.
+        archives maps input names to (file_name, fileobj) tuples of zip or
+        tar archives, that are extracted into the input directory.
+        The job is accounted to client_id and raises QuotaExceeded, if the 
+        client used up its quota.
 
         """
         # if the docker image is None, we need a full tool name build like: docker_image::tool_name
@@ -156,6 +447,9 @@ class ToolHandler(BaseSettings):
             else:
                 ValueError(f"Tool of name {tool_name} is not kwown to this Handler. Pass the containing 'docker_image' or prefix the tool name as docker_image::tool_name. The image will be registered for future use.")
 
+        # nothing is staged for clients without quota left
+        self.accounting.check(client_id)
+
         # check if the tool is already registered:
         if tool_name not in self.tool_map:
             self.register_tool(tool_name, docker_image)
@@ -163,33 +457,47 @@ class ToolHandler(BaseSettings):
         # load the tool specification
         tool = self.get_tool(tool_name)
         
+        # the mount points are derived from the job id
+        job_id = str(uuid.uuid4())
+
         # create the job
         # this returns the mount points in case they were not pre-defined
         try:
-            in_dir, out_dir = self.runner.init_tool(tool=tool, parameter=parameters, data=data, in_dir=in_dir, out_dir=out_dir)
+            in_dir, out_dir = self.runner.init_tool(tool=tool, parameter=parameters, data=data, in_dir=in_dir, out_dir=out_dir, archives=archives, job_id=job_id)
         except Exception as e:
             raise RuntimeError(f"Could not initialize the tool {tool_name} with the given parameters and data. ERROR: {str(e)}")    
  
  
         # crete the tool job entry
         toolJob = ToolJob(
-            job_id=str(uuid.uuid4()),
+            job_id=job_id,
             docker_image=docker_image,
             tool_name=tool_name,
             in_dir=in_dir,
             out_dir=out_dir,
             status=ToolJobStatus.PENDING,
+            created=datetime.now().isoformat(),
+            webhook=webhook,
+            client_id=self.accounting.client(client_id),
+            stored_bytes=directory_size(Path(in_dir)) + directory_size(Path(out_dir))
         )
+        estimate = self.estimator.predict(tool_name, self._job_parameters(toolJob))
+        toolJob.predicted_runtime = estimate.runtime if estimate is not None else None
 
         # set the job in the store
-        self._hset(f"tooljob:{toolJob.job_id}", toolJob.model_dump())
+        self._save_job(toolJob, event='created')
+        self.accounting.job_created(toolJob)
         
         # return the job
         return toolJob
 
-    def run_job(self, job_id: str, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> ToolJob:
+    def run_job(self, job_id: str, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}, wait: bool = True, on_admitted: Optional[Callable[[], None]] = None) -> ToolJob:
         """
-        Load the job-info from the store and run it using the ToolRunner
+        Load the job-info from the store and run it using the ToolRunner.
+        If wait is False, the running job is returned right after the container
+        started and the job is updated in the background, once it finished.
+        If the scheduler limits the running tools, the job might be returned
+        queued instead. on_admitted is called once the job was started or queued.
         """
         # check for the job_id
         if not self.redis_client.exists(f"tooljob:{job_id}"):
@@ -201,20 +509,89 @@ class ToolHandler(BaseSettings):
         # use the sniffer to get access to the tool
         tool = self.get_tool(job.tool_name)
 
-        # update the job to mark it running
+        # raises QuotaExceeded, if the client can't start another job
+        self.accounting.check(job.client_id, starting=True)
+
+        # the history of the tool might have grown since the job was created
+        estimate = self.estimator.predict(job.tool_name, self._job_parameters(job))
+        if estimate is not None:
+            job.predicted_runtime = estimate.runtime
+
+        start = partial(self._start_job, job, tool, extra_mounts=extra_mounts, extra_args=extra_args, extra_env=extra_env)
+        if not self.scheduler.enabled:
+            future = start()
+        else:
+            # queue the job, it is marked running once the scheduler starts it
+            job.status = ToolJobStatus.QUEUED
+            job.eta = self.scheduler.forecast(job, job.predicted_runtime)
+            self._save_job(job)
+            future = self.scheduler.submit(job, start, runtime=job.predicted_runtime, memory=estimate.memory if estimate is not None else None)
+
+        if on_admitted is not None:
+            on_admitted()
+        if not wait:
+            return job
+        return future.result()
+
+    def recover_queued_jobs(self) -> List[str]:
+        """
+        Queue the jobs again, that were queued by a scheduler which stopped,
+        ie. as its server restarted. Jobs that can't be queued are marked
+        failed. Returns the ids of the queued jobs.
+        """
+        queued = []
+        for job_id in self.scheduler.orphaned():
+            if not self.redis_client.exists(f"tooljob:{job_id}"):
+                continue
+            try:
+                self.run_job(job_id, wait=False)
+                queued.append(job_id)
+            except Exception as e:
+                job = self.get_job(job_id)
+                job.status = ToolJobStatus.FAILED
+                job.error_message = f"The job was queued before a restart and could not be queued again. ERROR: {str(e)}"
+                self._save_job(job)
+        
+        return queued
+
+    def _start_job(self, job: ToolJob, tool: Tool, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
+        """
+        Mark the job running and start the tool. Returns a future of the job,
+        that resolves once the job was updated after the tool finished.
+        """
         job.status = ToolJobStatus.RUNNING
-        self._hset(f"tooljob:{job_id}", job.model_dump())
+        if job.predicted_runtime is not None:
+            job.eta = (datetime.now() + timedelta(seconds=job.predicted_runtime)).isoformat()
+        self._save_job(job)
+        self.accounting.job_started(job)
 
-        # run the tool
+        finished = Future()
         try:
-            self.runner.run(tool=tool, in_dir=job.in_dir, out_dir=job.out_dir, extra_args=extra_args, extra_mounts=extra_mounts, extra_env=extra_env)
-            
+            future = self.runner.start(tool=tool, in_dir=job.in_dir, out_dir=job.out_dir, extra_args=extra_args, extra_mounts=extra_mounts, extra_env=extra_env)
+        except Exception as e:
+            finished.set_result(self._finish_job(job, error=e))
+            return finished
+
+        def _done(f: Future):
+            try:
+                finished.set_result(self._finish_job(job, error=f.exception()))
+            except Exception as e:
+                finished.set_exception(e)
+        future.add_done_callback(_done)
+
+        return finished
+
+    def _finish_job(self, job: ToolJob, error: Optional[Exception] = None) -> ToolJob:
+        """
+        Update the job after the tool container exited.
+        """
+        if error is None:
             # in any other case mark the job as completed
             job.status = ToolJobStatus.COMPLETED
             job.result_status = ToolResultStatus.SUCCESS
-        except Exception as e:
+        else:
             job.status = ToolJobStatus.FAILED
-            job.error_message = str(e)
+            job.error_message = str(error)
 
         # get the metadata from the out_path
         try:
@@ -235,12 +612,63 @@ class ToolHandler(BaseSettings):
             if error_msg != '':
                 job.error_message = error_msg
                 job.result_status = ToolResultStatus.ERROR
+
+        # account the used resources, as measured by the execution backend
+        try:
+            run_metadata = json.loads((Path(job.out_dir) / 'RUN_METADATA.json').read_text())
+        except FileNotFoundError:
+            run_metadata = {}
+        job.cpu_seconds = run_metadata.get('cpu_seconds')
+        job.peak_memory = run_metadata.get('peak_memory')
+        self.accounting.stored_changed(job, sum([directory_size(p) for p in self._mount_dirs(job)]))
+        self.accounting.job_finished(job, run_metadata.get('runtime'))
+
+        # learn the runtime of the tool from successful runs only
+        if job.status == ToolJobStatus.COMPLETED and run_metadata.get('runtime') is not None:
+            try:
+                self.estimator.record(job, self._job_parameters(job), run_metadata['runtime'])
+            except Exception as e:
+                warnings.warn(f"Could not record the runtime of job {job.job_id}: {str(e)}")
                 
         # update the job
-        self._hset(f"tooljob:{job_id}", job.model_dump())
+        self._save_job(job)
+
+        # index the results in the background - this is optional and must not fail the job
+        try:
+            self.ingest_results(job)
+        except Exception as e:
+            warnings.warn(f"Could not index the results of job {job.job_id}: {str(e)}")
         
         return job
 
+    def ingest_results(self, job: ToolJob) -> Optional[Future]:
+        """
+        Checksum, type and summarize all result files of the job in the
+        process pool of the ingestor and save them to the result manifest.
+        """
+        if not self.ingestor.ingest_results or job.out_dir is None or not Path(job.out_dir).exists():
+            return None
+        
+        def _save(future: Future):
+            try:
+                entries = future.result()
+                if len(entries) > 0:
+                    self.redis_client.hset(f"resultmanifest:{job.job_id}", mapping={name: json.dumps(entry) for name, entry in entries.items()})
+            except Exception as e:
+                warnings.warn(f"Could not index the results of job {job.job_id}: {str(e)}")
+        
+        future = self.ingestor.ingest(job.out_dir)
+        future.add_done_callback(_save)
+        return future
+
+    def result_index(self, job: ToolJob) -> Dict[str, dict]:
+        """
+        Return the result manifest of the job by file name. The entries hold
+        the size and mtime_ns of the indexed file, to tell if it changed since.
+        """
+        manifest = self.redis_client.hgetall(f"resultmanifest:{job.job_id}") or {}
+        return {name: json.loads(entry) for name, entry in manifest.items()}
+
     def get_job(self, job_id: str) -> ToolJob:
         """
         Return the job metadata for the given job_id
@@ -250,26 +678,204 @@ class ToolHandler(BaseSettings):
         # TODO debug log here
         return ToolJob(**data)
 
+    def _job_parameters(self, job: ToolJob) -> dict:
+        """
+        Return the validated parameters of the job from its inputs.json.
+        """
+        try:
+            inputs = json.loads((Path(job.in_dir) / 'inputs.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+        return inputs.get(job.tool_name, {}).get('parameters', {})
+
+    def _mount_dirs(self, job: ToolJob) -> List[Path]:
+        """
+        Return the directories that hold the mount files of a job.
+        """
+        in_parent = Path(job.in_dir).parent
+        
+        # never remove the mount base dir itself
+        if in_parent.resolve() == self.runner.mount_path.resolve():
+            return [Path(job.in_dir), Path(job.out_dir)]
+        elif in_parent == Path(job.out_dir).parent:
+            # default layout - the whole job folder can be moved at once
+            return [in_parent]
+        else:
+            return [Path(job.in_dir), Path(job.out_dir), in_parent]
+
     def delete_job(self, job_id: str, keep_mount_files: bool = False) -> bool:
         """
-        Delete a job from the store and optionally remove the mount files
+        Delete a job from the store and optionally remove the mount files.
+        The mount files are moved to the trash, which is purged by the janitor
+        in the background.
         """
-        # check if the mount files should be removed
-        if not keep_mount_files:
-            # get the job
-            job = self.get_job(job_id)
+        # get the job
+        job = self.get_job(job_id) if self.redis_client.exists(f"tooljob:{job_id}") else None
 
+        # check if the mount files should be removed
+        if not keep_mount_files and job is not None:
             # remove 
             if job.in_dir is not None:
-                shutil.rmtree(job.in_dir, ignore_errors=True)
-                shutil.rmtree(job.out_dir, ignore_errors=True)
-                if Path(job.in_dir).parent.exists():
-                    shutil.rmtree(Path(job.in_dir).parent, ignore_errors=True)
+                self.janitor.trash(self._mount_dirs(job), self.runner.mount_path)
+            if job.archive is not None:
+                self.janitor.trash([job.archive], self.runner.mount_path)
         
+        # the files are not accounted to the client anymore
+        if job is not None:
+            self.accounting.stored_changed(job, 0)
+
         # delete the metadata itself
         self.redis_client.delete(f"tooljob:{job_id}")
+        if self.redis_client.exists(f"resultmanifest:{job_id}"):
+            self.redis_client.delete(f"resultmanifest:{job_id}")
+        
+        if job is not None:
+            self.events.publish(job_event('deleted', job))
         return True
 
+    def result_checksum(self, job: ToolJob, file_name: str) -> Optional[str]:
+        """
+        Return the SHA256 checksum of a single result file from the result
+        manifest of the job. If the file is not indexed yet or changed since,
+        it is indexed in the ingest pool and None is returned meanwhile.
+        """
+        key = f"resultmanifest:{job.job_id}"
+        manifest = self.redis_client.hgetall(key) or {}
+        entry = json.loads(manifest[file_name]) if file_name in manifest else None
+
+        if job.archive is not None:
+            # archived files do not change anymore
+            size = self.storage.file_size(job, file_name)
+            if entry is not None and entry['size'] == size and entry.get('sha256') is not None:
+                return entry['sha256']
+        else:
+            stat = resolve_result_path(job.out_dir, file_name).stat()
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return entry['sha256']
+
+        # hashing a large file would block the request
+        def _save(future: Future):
+            try:
+                self.redis_client.hset(key, mapping={file_name: json.dumps(future.result())})
+            except Exception as e:
+                warnings.warn(f"Could not index the result file {file_name} of job {job.job_id}: {str(e)}")
+
+        future = self.ingestor.index_file(job.out_dir, file_name, archive=job.archive)
+        if future is not None:
+            future.add_done_callback(_save)
+        
+        return None
+
+    def archive_job(self, job_id: str) -> ToolJob:
+        """
+        Move the mount files of a finished job into a compressed archive
+        in the cold storage.
+        """
+        # other workers or replicas might archive the same job
+        with store_lock(self.redis_client, f"job:{job_id}", ttl=self.storage.storage_lock_seconds):
+            job = self.get_job(job_id)
+            if job.archive is not None:
+                return job
+            if job.status in (ToolJobStatus.PENDING, ToolJobStatus.QUEUED, ToolJobStatus.RUNNING):
+                raise RuntimeError(f"Job {job_id} is {job.status} and cannot be archived.")
+
+            # write the archive before anything is removed
+            job.archive = self.storage.archive(job, self.runner.mount_path)
+            self.accounting.stored_changed(job, Path(job.archive).stat().st_size)
+            self._save_job(job)
+
+            # remove the hot copy
+            self.janitor.trash(self._mount_dirs(job), self.runner.mount_path)
+
+        return job
+
+    def rehydrate_job(self, job_id: str) -> ToolJob:
+        """
+        Restore the mount files of an archived job.
+        """
+        job = self.get_job(job_id)
+        if job.archive is None:
+            return job
+        
+        # wait for other workers restoring or archiving the job right now
+        with store_lock(self.redis_client, f"job:{job_id}", ttl=self.storage.storage_lock_seconds, wait=self.storage.storage_lock_seconds):
+            job = self.get_job(job_id)
+            if job.archive is None:
+                return job
+
+            self.storage.rehydrate(job)
+            self.janitor.trash([job.archive], self.runner.mount_path)
+
+            # the job is hot again
+            job.archive = None
+            self.accounting.stored_changed(job, sum([directory_size(p) for p in self._mount_dirs(job)]))
+            self.redis_client.hdel(f"tooljob:{job.job_id}", 'archive')
+            self._save_job(job)
+
+        return job
+
+    def migrate_mounts(self, dry_run: bool = False) -> Dict[str, List[str]]:
+        """
+        Move the mount directories of all jobs in the flat layout into the
+        sharded layout of the runner. The directories are renamed, thus this
+        is fast as long as the shards are on the same volume. Queued and
+        running jobs are skipped, as well as jobs with custom mount points.
+        Returns the ids of the migrated and of the skipped jobs.
+        """
+        mount_path = self.runner.mount_path.resolve()
+        report = {'migrated': [], 'skipped': []}
+
+        for job in self.list_jobs(ids_only=False):
+            old_dir = Path(job.in_dir).parent
+            if old_dir.parent.resolve() != mount_path or Path(job.out_dir).parent != old_dir:
+                continue
+            if job.status in (ToolJobStatus.QUEUED, ToolJobStatus.RUNNING):
+                report['skipped'].append(job.job_id)
+                continue
+
+            # older jobs do not have a creation date, use the mount directory instead
+            if job.created is not None:
+                created = datetime.fromisoformat(job.created)
+            elif old_dir.exists():
+                created = datetime.fromtimestamp(old_dir.stat().st_mtime)
+            else:
+                created = None
+            new_dir = mount_path / shard_path(job.job_id, created, width=self.runner.mount_shard_width)
+            if dry_run:
+                report['migrated'].append(job.job_id)
+                continue
+
+            # archived jobs have no mount directory, they are rehydrated into the new one
+            if old_dir.exists():
+                new_dir.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    # reserve the new directory, the rename replaces it atomically
+                    new_dir.mkdir()
+                    os.rename(old_dir, new_dir)
+                except OSError as e:
+                    warnings.warn(f"Could not move the mount directory of job {job.job_id} to {new_dir}: {str(e)}")
+                    report['skipped'].append(job.job_id)
+                    continue
+
+                # the local backend writes host paths into the inputs.json
+                inputs_json = new_dir / 'in' / 'inputs.json'
+                old_in = str(Path(job.in_dir).resolve())
+                if inputs_json.exists() and old_in in inputs_json.read_text():
+                    inputs = json.loads(inputs_json.read_text())
+                    data = inputs.get(job.tool_name, {}).get('data', {})
+                    for name, path in data.items():
+                        if isinstance(path, str) and path.startswith(old_in):
+                            data[name] = str(new_dir / 'in') + path[len(old_in):]
+                    inputs_json.write_text(json.dumps(inputs, indent=4))
+
+            # update the job without notifying the webhooks again
+            job.in_dir = str(new_dir / 'in')
+            job.out_dir = str(new_dir / 'out')
+            self._hset(f"tooljob:{job.job_id}", {'in_dir': job.in_dir, 'out_dir': job.out_dir})
+            report['migrated'].append(job.job_id)
+
+        return report
+
     def list_jobs(self, ids_only: bool = True) -> List[str] | List[ToolJob]:
         """
         List all keys starting with tooljob:* from the store
@@ -285,5 +891,215 @@ class ToolHandler(BaseSettings):
         else:
             return [self.get_job(job_id) for job_id in scan_list]
 
-    
+    def create_pipeline(self, pipeline: Pipeline | dict, client_id: Optional[str] = None) -> PipelineJob:
+        """
+        Validate a pipeline of chained tool runs and save it to the store.
+        The single jobs are only created once the pipeline is run, as the
+        data inputs of a step depend on the outputs of its upstream steps.
+        All jobs of the pipeline are accounted to client_id.
 
+        """
+        # validate the pipeline graph
+        if isinstance(pipeline, dict):
+            pipeline = Pipeline.model_validate(pipeline)
+
+        # make sure all tools can be resolved before anything is run
+        for step in pipeline.steps:
+            if step.docker_image is None and '::' not in step.tool_name and step.tool_name not in self.tool_map:
+                raise ValueError(f"Tool of name {step.tool_name} used in step '{step.name}' is not known to this Handler.")
+
+        pipeline_job = PipelineJob(pipeline_id=str(uuid.uuid4()), pipeline=pipeline, client_id=client_id)
+        self.redis_client.set(f"pipeline:{pipeline_job.pipeline_id}", pipeline_job.model_dump_json())
+
+        return pipeline_job
+
+    def get_pipeline(self, pipeline_id: str) -> PipelineJob:
+        """
+        Return the pipeline metadata for the given pipeline_id
+        """
+        pipeline_id = f"pipeline:{pipeline_id}" if not pipeline_id.startswith('pipeline:') else pipeline_id
+        data = self.redis_client.get(pipeline_id)
+        if data is None:
+            raise ValueError(f"Pipeline with id {pipeline_id} not found in the store")
+        
+        return PipelineJob.model_validate_json(data)
+
+    def list_pipelines(self, ids_only: bool = True) -> List[str] | List[PipelineJob]:
+        """
+        List all pipelines saved to the store
+        """
+        scan_list = [pipeline_id.split(':')[-1] for pipeline_id in self.redis_client.scan_iter('pipeline:*')]
+
+        if ids_only:
+            return scan_list
+        else:
+            return [self.get_pipeline(pipeline_id) for pipeline_id in scan_list]
+
+    def _step_cache_key(self, step: PipelineStep, upstream_keys: Dict[str, str]) -> str:
+        """
+        Build a key that changes whenever the tool, the parameters, or any
+        of the inputs of a step change. Local files are identified by their
+        path, size and modification time, remote files by their URL and ETag
+        and step outputs by the key of the upstream step.
+        """
+        data = {}
+        for name, source in step.data.items():
+            if isinstance(source, StepOutput):
+                data[name] = [upstream_keys[source.step], source.path]
+            elif is_remote(source):
+                # remote objects without an ETag are never cached
+                data[name] = [source, self.runner.downloads.etag(source) or str(uuid.uuid4())]
+            else:
+                stat = Path(source).stat()
+                data[name] = [str(Path(source).resolve()), stat.st_size, stat.st_mtime_ns]
+        
+        payload = {
+            'tool_name': step.tool_name,
+            'docker_image': step.docker_image or self.tool_map.get(step.tool_name),
+            'parameters': step.parameters,
+            'data': data
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _cached_step_job(self, cache_key: str) -> ToolJob | None:
+        # check if there is a cache entry at all
+        job_id = self.redis_client.get(f"pipelinecache:{cache_key}")
+        if job_id is None or not self.redis_client.exists(f"tooljob:{job_id}"):
+            return None
+        
+        # the job is only usable, if it completed and the outputs are still there
+        job = self.get_job(job_id)
+        if job.status != ToolJobStatus.COMPLETED:
+            return None
+        if job.archive is not None:
+            job = self.rehydrate_job(job.job_id)
+        if not Path(job.out_dir).exists():
+            return None
+        
+        return job
+
+    def _run_step(self, step: PipelineStep, upstream_jobs: Dict[str, ToolJob], client_id: Optional[str] = None) -> ToolJob:
+        # resolve the references to upstream outputs into paths of the upstream out_dir
+        data = {}
+        for name, source in step.data.items():
+            if isinstance(source, StepOutput):
+                data[name] = str(Path(upstream_jobs[source.step].out_dir) / source.path)
+            else:
+                data[name] = source
+        
+        # create and run the job like any other
+        job = self.create_job(step.tool_name, docker_image=step.docker_image, parameters=step.parameters, data=data, client_id=client_id)
+        return self.run_job(job.job_id)
+
+    def run_pipeline(self, pipeline_id: str, use_cache: bool = True, on_admitted: Optional[Callable[[], None]] = None) -> PipelineJob:
+        """
+        Run all steps of a pipeline. Each step is started as soon as all of 
+        its upstream steps have completed, thus independent branches run in 
+        parallel. Outputs of upstream steps are passed by reference and
+        steps with unchanged inputs re-use the job of an earlier run.
+        on_admitted is called once the pipeline is marked running.
+
+        """
+        pipeline_job = self.get_pipeline(pipeline_id)
+
+        # update the pipeline to mark it running
+        pipeline_job.status = ToolJobStatus.RUNNING
+        pipeline_job.jobs = {}
+        pipeline_job.cached_steps = []
+        pipeline_job.error_message = None
+        self.redis_client.set(f"pipeline:{pipeline_job.pipeline_id}", pipeline_job.model_dump_json())
+        if on_admitted is not None:
+            on_admitted()
+
+        try:
+            return self._run_pipeline_steps(pipeline_job, use_cache=use_cache)
+        except PipelineStepError:
+            raise
+        except Exception as e:
+            # the pipeline must never be left running
+            pipeline_job.status = ToolJobStatus.FAILED
+            pipeline_job.error_message = f"The pipeline could not be run. ERROR: {str(e)}"
+            self.redis_client.set(f"pipeline:{pipeline_job.pipeline_id}", pipeline_job.model_dump_json())
+            raise
+
+    def _run_pipeline_steps(self, pipeline_job: PipelineJob, use_cache: bool = True) -> PipelineJob:
+        pipeline = pipeline_job.pipeline
+        done: Dict[str, ToolJob] = {}
+        cache_keys: Dict[str, str] = {}
+        failed: List[str] = []
+        unprepared: List[str] = []
+        pending = {step.name: step for step in pipeline.steps}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.pipeline_workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                # submit every step that has all upstream steps completed
+                for name in pipeline.topological_order():
+                    step = pending.get(name)
+                    if step is None or not set(step.depends_on).issubset(done.keys()):
+                        continue
+                    del pending[name]
+
+                    # check if an earlier run with the same inputs can be re-used
+                    try:
+                        cache_keys[name] = self._step_cache_key(step, cache_keys)
+                        cached_job = self._cached_step_job(cache_keys[name]) if use_cache else None
+                    except Exception as e:
+                        failed.append(name)
+                        unprepared.append(name)
+                        pipeline_job.error_message = f"Step '{name}' could not be prepared. ERROR: {str(e)}"
+                        continue
+
+                    if cached_job is not None:
+                        done[name] = cached_job
+                        pipeline_job.jobs[name] = cached_job.job_id
+                        pipeline_job.cached_steps.append(name)
+                    else:
+                        running[executor.submit(self._run_step, step, dict(done), pipeline_job.client_id)] = name
+                
+                # steps depending on failed steps will never run
+                if len(running) == 0:
+                    break
+
+                # wait for the next step to finish
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        job = future.result()
+                    except Exception as e:
+                        failed.append(name)
+                        pipeline_job.error_message = f"Step '{name}' could not be run. ERROR: {str(e)}"
+                        continue
+                    
+                    pipeline_job.jobs[name] = job.job_id
+                    if job.status == ToolJobStatus.COMPLETED:
+                        done[name] = job
+                        self.redis_client.set(f"pipelinecache:{cache_keys[name]}", job.job_id)
+                    else:
+                        failed.append(name)
+                        pipeline_job.error_message = f"Step '{name}' failed. ERROR: {job.error_message}"
+                
+                # save the intermediate state
+                self.redis_client.set(f"pipeline:{pipeline_job.pipeline_id}", pipeline_job.model_dump_json())
+
+        # anything left pending could not run due to a failed upstream step
+        if len(failed) > 0 or len(pending) > 0:
+            pipeline_job.status = ToolJobStatus.FAILED
+        else:
+            pipeline_job.status = ToolJobStatus.COMPLETED
+        self.redis_client.set(f"pipeline:{pipeline_job.pipeline_id}", pipeline_job.model_dump_json())
+
+        # steps that could not even be started are caused by the request
+        if len(unprepared) > 0:
+            raise PipelineStepError(pipeline_job.error_message, pipeline_job)
+
+        return pipeline_job
+
+    def delete_pipeline(self, pipeline_id: str) -> bool:
+        """
+        Delete a pipeline from the store. The jobs of the single steps are kept,
+        as they might be re-used by other pipeline runs.
+        """
+        self.redis_client.delete(f"pipeline:{pipeline_id}")
+        return True
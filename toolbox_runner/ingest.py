@@ -0,0 +1,251 @@
+"""
+Ingestion of the results of a finished job. Each output file is read once
+in a process pool, to calculate its checksum, detect its content type and
+extract a short summary. The results are saved into the result manifest of
+the job, so that they do not have to be calculated in a request.
+"""
+from typing import Optional, Dict, List, Literal, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, Future, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+import multiprocessing
+import threading
+import hashlib
+import warnings
+import zipfile
+import time
+import csv
+import os
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.results import media_type, file_checksum, CHUNK_SIZE
+from toolbox_runner.slicing import NETCDF_EXTENSIONS, ZARR_EXTENSIONS
+
+
+# plain text files are not summarized as tables
+TABLE_EXTENSIONS = ('.csv', '.tsv')
+
+
+def _csv_columns(path: Path) -> List[str]:
+    with open(path, 'r', newline='', errors='replace') as f:
+        header = f.readline().rstrip('\r\n')
+    try:
+        delimiter = '\t' if path.suffix == '.tsv' else csv.Sniffer().sniff(header, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    return next(csv.reader([header], delimiter=delimiter), [])
+
+
+def _dataset_summary(path: Path) -> Optional[dict]:
+    # the summary of datasets is only available with xarray
+    try:
+        import xarray
+    except ImportError:
+        return None
+
+    try:
+        ds = xarray.open_zarr(path) if path.suffix in ZARR_EXTENSIONS else xarray.open_dataset(path)
+    except Exception:
+        return None
+
+    with ds:
+        return {
+            'dims': {str(k): int(v) for k, v in ds.sizes.items()},
+            'variables': {
+                str(name): {'dims': [str(d) for d in var.dims], 'shape': list(var.shape), 'dtype': str(var.dtype)}
+                for name, var in ds.data_vars.items()
+            }
+        }
+
+
+def _exit_with_parent(parent_pid: int):
+    # the workers of a killed server would wait for work forever
+    def _watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1.0)
+        os._exit(0)
+    threading.Thread(target=_watch, daemon=True).start()
+
+
+def ingest_file(out_dir: str, file_name: str) -> dict:
+    """
+    Read a single result file and return its manifest entry. The checksum
+    and the row count of CSV files are calculated in the same pass.
+    """
+    p = Path(out_dir) / file_name
+    stat = p.stat()
+
+    # zarr stores are directories and only summarized
+    if p.is_dir():
+        return {'size': None, 'mtime_ns': stat.st_mtime_ns, 'sha256': None, 'content_type': None, 'summary': _dataset_summary(p)}
+
+    is_csv = p.suffix.lower() in TABLE_EXTENSIONS
+    h = hashlib.sha256()
+    lines = 0
+    last = b''
+    with open(p, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+            if is_csv:
+                lines += chunk.count(b'\n')
+                last = chunk[-1:]
+
+    summary = None
+    if is_csv:
+        # the last line might not end with a newline
+        rows = lines + (1 if last not in (b'', b'\n') else 0)
+        summary = {'columns': _csv_columns(p), 'row_count': max(rows - 1, 0)}
+    elif p.suffix.lower() in NETCDF_EXTENSIONS:
+        summary = _dataset_summary(p)
+
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': h.hexdigest(),
+        'content_type': media_type(file_name),
+        'summary': summary
+    }
+
+
+def ingest_archived_file(archive: str, file_name: str) -> dict:
+    """
+    Return the manifest entry of a single result file of an archived job.
+    Only the checksum is calculated, the archive is not extracted.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        size = zf.getinfo(f"out/{file_name}").file_size
+        with zf.open(f"out/{file_name}") as f:
+            sha256 = file_checksum(f)
+
+    return {'size': size, 'mtime_ns': None, 'sha256': sha256, 'content_type': media_type(file_name), 'summary': None}
+
+
+class ResultIngestor(BaseSettings):
+    ingest_results: bool = Field(True, description="Index the result files of every finished job.")
+    ingest_workers: Optional[int] = Field(None, description="Number of workers used to index result files. Defaults to the number of CPUs.")
+    ingest_executor: Optional[Literal['process', 'thread']] = Field(None, description="Index in a process or a thread pool. Defaults to processes in the server and threads otherwise.")
+
+    _pool: Optional[Executor] = PrivateAttr(None)
+    _pending: set = PrivateAttr(default_factory=set)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.ingest_executor == 'process':
+                    # forking a threaded server is not safe. Spawned workers import
+                    # the __main__ module again, thus this is only the default in the server
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.ingest_workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_exit_with_parent,
+                        initargs=(os.getpid(), )
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.ingest_workers, thread_name_prefix='ingest')
+            return self._pool
+
+    def _reset(self, pool: Executor):
+        # a killed worker breaks the whole process pool, the next ingestion creates a new one
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn: Callable[[str, str], dict], path: str, file_name: str) -> Future:
+        pool = self.pool
+        try:
+            return pool.submit(fn, path, file_name)
+        except BrokenProcessPool:
+            self._reset(pool)
+            return self.pool.submit(fn, path, file_name)
+
+    def index_file(self, out_dir: str, file_name: str, archive: Optional[str] = None) -> Optional[Future]:
+        """
+        Index a single result file in the pool, ie. as it changed after the
+        job was indexed. Returns None, if the file is indexed already.
+        """
+        key = (archive or out_dir, file_name)
+        with self._lock:
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+
+        def _forget(f: Future):
+            with self._lock:
+                self._pending.discard(key)
+            if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+                self._reset(pool)
+
+        pool = self.pool
+        try:
+            future = self._submit(ingest_archived_file if archive is not None else ingest_file, archive or out_dir, file_name)
+        except Exception:
+            with self._lock:
+                self._pending.discard(key)
+            raise
+        future.add_done_callback(_forget)
+        return future
+
+    def ingest(self, out_dir: str) -> Future:
+        """
+        Index all files of the out_dir in the process pool. The returned
+        future resolves to the manifest entries by file name, once all
+        files are done. Files that could not be read are left out.
+        """
+        base = Path(out_dir)
+        file_names = []
+        for root, dirs, files in os.walk(base):
+            root = Path(root)
+            # zarr stores are indexed as a whole, their chunks are not walked
+            stores = [d for d in dirs if Path(d).suffix in ZARR_EXTENSIONS]
+            dirs[:] = [d for d in dirs if d not in stores]
+            file_names.extend([(root / name).relative_to(base).as_posix() for name in stores + files])
+
+        index = Future()
+        entries: Dict[str, dict] = {}
+        pending = [len(file_names)]
+        lock = threading.Lock()
+        if len(file_names) == 0:
+            index.set_result(entries)
+            return index
+
+        def _done(f: Future, file_name: str):
+            try:
+                entry = f.result()
+            except CancelledError:
+                # the ingestor was shut down
+                entry = None
+            except Exception as e:
+                entry = None
+                if isinstance(e, BrokenProcessPool):
+                    self._reset(pool)
+                warnings.warn(f"Could not index the result file {file_name}: {str(e)}")
+            with lock:
+                if entry is not None:
+                    entries[file_name] = entry
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                index.set_result(entries)
+
+        pool = self.pool
+        for file_name in file_names:
+            try:
+                future = self._submit(ingest_file, str(base), file_name)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(partial(_done, file_name=file_name))
+
+        return index
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
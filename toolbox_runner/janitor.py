@@ -0,0 +1,246 @@
+from typing import TYPE_CHECKING, Optional, List, Dict
+from pathlib import Path
+from datetime import datetime, timedelta
+from uuid import uuid4
+from time import time, sleep
+import threading
+import warnings
+import shutil
+import os
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import ToolJob, ToolJobStatus
+from toolbox_runner.runner import SHARD_PATTERN
+from toolbox_runner.locks import acquire_lock, release_lock
+
+if TYPE_CHECKING:
+    from toolbox_runner.handler import ToolHandler
+
+
+def directory_size(path: Path) -> int:
+    """
+    Sum up the size of all files below path.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class MountJanitor(BaseSettings):
+    trash_dir: str = Field('.trash', description="Name of the directory below the mount base dir, that holds deleted mounts until they are purged.")
+    janitor_interval: float = Field(600, description="Seconds between two runs of the janitor.")
+    delete_rate: int = Field(50 * 1024 ** 2, description="Maximum number of bytes per second that the janitor deletes. Set to 0 to disable throttling.")
+    janitor_lock_seconds: float = Field(3600, description="Seconds a janitor run may take, before another worker may start one. Frees the lock of a crashed worker.")
+
+    # retention policies - all disabled by default
+    retention_max_age_days: Optional[float] = None
+    retention_max_bytes: Optional[int] = Field(None, description="Maximum total size of the files of all jobs, as recorded with the jobs. The oldest finished jobs are deleted first.")
+    retention_keep_last: Optional[int] = Field(None, description="Number of most recent jobs to keep per tool.")
+
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+
+    def trash_path(self, mount_path: Path) -> Path:
+        p = mount_path / self.trash_dir
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    def trash(self, paths: List[str | Path], mount_path: Path):
+        """
+        Move the given directories or files into the trash directory. As the 
+        trash lives on the same volume, this is a rename and returns instantly.
+        Anything that cannot be renamed is removed right away.
+        """
+        trash = self.trash_path(mount_path)
+        for path in paths:
+            path = Path(path)
+            if not path.exists():
+                continue
+            parent = path.resolve().parent
+
+            try:
+                path.rename(trash / f"{path.name}_{uuid4().hex}")
+            except OSError:
+                # the path is on a different volume
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+
+            self.prune_shard(parent, mount_path)
+
+    def prune_shard(self, shard: Path, mount_path: Path):
+        """
+        Remove the shard folder of the sharded layout and its date folders,
+        as long as they are empty.
+        """
+        mount_path = mount_path.resolve()
+        if not shard.is_relative_to(mount_path) or not SHARD_PATTERN.match(shard.relative_to(mount_path).as_posix()):
+            return
+
+        # rmdir fails on folders that are not empty
+        for p in (shard, shard.parent, shard.parent.parent, shard.parent.parent.parent):
+            try:
+                os.rmdir(p)
+            except OSError:
+                break
+
+    def _remove_throttled(self, path: Path):
+        """
+        Remove a directory tree bottom-up, while not exceeding the configured
+        delete_rate.
+        """
+        t1 = time()
+        deleted = 0
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    deleted += os.lstat(file_path).st_size
+                    os.unlink(file_path)
+                except FileNotFoundError:
+                    continue
+
+                # sleep if we are ahead of the allowed rate
+                if self.delete_rate > 0:
+                    ahead = deleted / self.delete_rate - (time() - t1)
+                    if ahead > 0:
+                        sleep(ahead)
+
+            for name in dirs:
+                dir_path = os.path.join(root, name)
+                if os.path.islink(dir_path):
+                    os.unlink(dir_path)
+                else:
+                    os.rmdir(dir_path)
+
+        os.rmdir(path)
+
+    def purge_trash(self, mount_path: Path) -> int:
+        """
+        Finally delete everything in the trash directory.
+        Returns the number of purged directories.
+        """
+        purged = 0
+        for path in self.trash_path(mount_path).iterdir():
+            if self._stop.is_set():
+                break
+            try:
+                if path.is_dir() and not path.is_symlink():
+                    self._remove_throttled(path)
+                else:
+                    path.unlink()
+                purged += 1
+            except OSError as e:
+                warnings.warn(f"Could not purge {path} from the trash: {str(e)}")
+
+        return purged
+
+    def _job_created(self, job: ToolJob) -> datetime:
+        # older jobs do not have a creation date, use the out_dir instead
+        if job.created is not None:
+            return datetime.fromisoformat(job.created)
+        try:
+            return datetime.fromtimestamp(Path(job.out_dir).stat().st_mtime)
+        except FileNotFoundError:
+            return datetime.fromtimestamp(0)
+
+    def _job_size(self, job: ToolJob) -> int:
+        # the size is recorded, whenever the files of a job change
+        if job.stored_bytes is not None:
+            return job.stored_bytes
+
+        # older jobs have to be measured
+        size = directory_size(Path(job.in_dir)) + directory_size(Path(job.out_dir))
+        if job.archive is not None and Path(job.archive).exists():
+            size += Path(job.archive).stat().st_size
+        return size
+
+    def expired_jobs(self, handler: 'ToolHandler') -> List[str]:
+        """
+        Apply the retention policies and return the ids of all jobs that should
+        be deleted. Pending and running jobs are never deleted.
+        """
+        # get all finished jobs, newest first
+        all_jobs = handler.list_jobs(ids_only=False)
+        jobs = [job for job in all_jobs if job.status not in (ToolJobStatus.PENDING, ToolJobStatus.QUEUED, ToolJobStatus.RUNNING)]
+        created = {job.job_id: self._job_created(job) for job in jobs}
+        jobs.sort(key=lambda job: created[job.job_id], reverse=True)
+
+        expired = set()
+
+        # max age
+        if self.retention_max_age_days is not None:
+            limit = datetime.now() - timedelta(days=self.retention_max_age_days)
+            expired.update([job.job_id for job in jobs if created[job.job_id] < limit])
+
+        # keep only the last N jobs of each tool
+        if self.retention_keep_last is not None:
+            per_tool: Dict[str, int] = {}
+            for job in jobs:
+                per_tool[job.tool_name] = per_tool.get(job.tool_name, 0) + 1
+                if per_tool[job.tool_name] > self.retention_keep_last:
+                    expired.add(job.job_id)
+
+        # delete the oldest jobs until the total size fits, running jobs count as well
+        if self.retention_max_bytes is not None:
+            sizes = {job.job_id: self._job_size(job) for job in all_jobs}
+            total = sum(sizes.values()) - sum([sizes[job_id] for job_id in expired])
+            for job in reversed(jobs):
+                if total <= self.retention_max_bytes:
+                    break
+                if job.job_id not in expired:
+                    expired.add(job.job_id)
+                    total -= sizes[job.job_id]
+
+        return [job.job_id for job in jobs if job.job_id in expired]
+
+    def run_once(self, handler: 'ToolHandler') -> dict:
+        """
+        Delete all expired jobs and purge the trash. The janitor runs in
+        every worker, but only one of them cleans up at a time, so that the
+        deletions are not done twice and stay within the delete_rate.
+        """
+        token = acquire_lock(handler.redis_client, 'janitor', ttl=self.janitor_lock_seconds)
+        if token is None:
+            return {'deleted_jobs': [], 'purged': 0}
+
+        try:
+            expired = self.expired_jobs(handler)
+            for job_id in expired:
+                handler.delete_job(job_id)
+
+            purged = self.purge_trash(handler.runner.mount_path)
+        finally:
+            release_lock(handler.redis_client, 'janitor', token)
+
+        return {'deleted_jobs': expired, 'purged': purged}
+
+    def _loop(self, handler: 'ToolHandler'):
+        while not self._stop.is_set():
+            try:
+                self.run_once(handler)
+            except Exception as e:
+                warnings.warn(f"The mount janitor failed: {str(e)}")
+            self._stop.wait(self.janitor_interval)
+
+    def start(self, handler: 'ToolHandler'):
+        """
+        Start the janitor in a background thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(handler, ), daemon=True, name='mount-janitor')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,62 @@
+"""
+Locks shared by all workers and replicas through the store. A lock is a key
+set with SET NX and an expiry, thus a lock of a crashed process is freed
+after its ttl.
+"""
+from typing import Any, Generator
+from contextlib import contextmanager
+from time import monotonic, sleep
+import uuid
+
+
+# get and delete in one step, the lock might have expired and been taken by another process
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LockedError(RuntimeError):
+    pass
+
+
+def acquire_lock(store: Any, name: str, ttl: float) -> str | None:
+    """
+    Try to take the lock once. Returns the token needed to release it, or
+    None if another process holds the lock.
+    """
+    token = str(uuid.uuid4())
+    if store.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000)):
+        return token
+    return None
+
+
+def release_lock(store: Any, name: str, token: str) -> bool:
+    """
+    Release the lock, if it is still held with the given token. Returns
+    False, if it expired meanwhile.
+    """
+    # the fallback store is used by a single process and has no scripts
+    if hasattr(store, 'compare_and_delete'):
+        return store.compare_and_delete(f"lock:{name}", token)
+    return bool(store.eval(RELEASE_SCRIPT, 1, f"lock:{name}", token))
+
+
+@contextmanager
+def store_lock(store: Any, name: str, ttl: float, wait: float = 0.0) -> Generator[None, None, None]:
+    """
+    Hold the lock while the block runs. If the lock is held by another
+    process for longer than wait seconds, a LockedError is raised.
+    """
+    deadline = monotonic() + wait
+    while (token := acquire_lock(store, name, ttl)) is None:
+        if monotonic() >= deadline:
+            raise LockedError(f"'{name}' is locked by another process.")
+        sleep(0.1)
+
+    try:
+        yield
+    finally:
+        release_lock(store, name, token)
@@ -0,0 +1,30 @@
+"""
+Move the mount directories of existing jobs from the flat layout into the
+sharded layout, ie. <mount_base_dir>/2024/05/17/3f/<job_id>. The handler is
+configured from the environment, just like the server. Queued and running
+jobs are skipped, run the migration again once they finished.
+
+    python -m toolbox_runner.migrate --dry-run
+"""
+import argparse
+
+from toolbox_runner.handler import ToolHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help="Only list the jobs, that would be moved.")
+    args = parser.parse_args()
+
+    handler = ToolHandler()
+    report = handler.migrate_mounts(dry_run=args.dry_run)
+
+    for job_id in report['migrated']:
+        print(f"{'would move' if args.dry_run else 'moved'} {job_id}")
+    for job_id in report['skipped']:
+        print(f"skipped {job_id}")
+    print(f"{len(report['migrated'])} jobs {'to migrate' if args.dry_run else 'migrated'}, {len(report['skipped'])} skipped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
-from typing import Optional, List, Dict, Type
+from typing import Optional, List, Dict, Type, Literal, Any
+from datetime import datetime
 from enum import StrEnum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 
 from toolbox_runner.util import create_input_model, InputParameter
 
@@ -39,14 +40,18 @@ class Tool(BaseModel):
     # image metadata
     docker_image: str
 
+    # the validator is cached along with the tool
+    _validator: Optional[Type[InputParameter]] = PrivateAttr(None)
+
     def input_validator(self) -> Type[InputParameter]:
         """
         Create a Pydantic model of the input parameters dynamically from the contents
         of the parameters attribute.
         """
-        Model = create_input_model(self.name, self.parameters)
+        if self._validator is None:
+            self._validator = create_input_model(self.name, self.parameters)
 
-        return Model
+        return self._validator
     
     def input_file(self, parameter: Optional[dict] = None, data: Dict[str, str] = {}) -> dict:
         """
@@ -77,6 +82,7 @@ class Tool(BaseModel):
 
 class ToolJobStatus(StrEnum):
     PENDING = 'pending'
+    QUEUED = 'queued'
     RUNNING = 'running'
     COMPLETED = 'completed'
     FAILED = 'failed'
@@ -97,6 +103,27 @@ class ToolJob(BaseModel):
     error_message: Optional[str] = None
     runtime: Optional[float] = None
     timestamp: Optional[str] = None
+    created: Optional[str] = None
+    archive: Optional[str] = None
+    webhook: Optional[str] = None
+
+    # resource accounting
+    client_id: Optional[str] = None
+    cpu_seconds: Optional[float] = None
+    peak_memory: Optional[int] = None
+    stored_bytes: Optional[int] = None
+
+    # estimated from the history of the tool
+    predicted_runtime: Optional[float] = None
+    eta: Optional[str] = None
+
+class JobEvent(BaseModel):
+    event: Literal['created', 'updated', 'deleted']
+    job_id: str
+    status: ToolJobStatus
+    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
+    job: Optional[ToolJob] = None
+
 
 class ToolResultFile(BaseModel):
     path: str
@@ -105,3 +132,114 @@ class ToolResultFile(BaseModel):
     is_dir: bool
     extension: Optional[str] = None
     content_type: Optional[str] = None
+
+    # filled from the result index, once the job was ingested
+    sha256: Optional[str] = None
+    summary: Optional[Dict[str, Any]] = None
+
+
+class ResourceUsage(BaseModel):
+    jobs: int = 0
+    running: int = 0
+    cpu_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    peak_memory: int = 0
+    stored_bytes: int = 0
+
+
+class UsageReport(ResourceUsage):
+    client_id: str
+    period: str
+    tools: Dict[str, ResourceUsage] = {}
+
+
+class RuntimeEstimate(BaseModel):
+    runtime: float
+    memory: Optional[int] = None
+    samples: int
+    method: Literal['median', 'regression']
+
+
+class QueueEntry(BaseModel):
+    job_id: str
+    tool_name: str
+    client_id: Optional[str] = None
+    position: int
+    predicted_runtime: Optional[float] = None
+    predicted_memory: Optional[int] = None
+    queued: str
+    eta: Optional[str] = None
+
+
+class StepOutput(BaseModel):
+    step: str
+    path: str
+
+
+class PipelineStep(BaseModel):
+    name: str
+    tool_name: str
+    docker_image: Optional[str] = None
+    parameters: dict = {}
+    data: Dict[str, str | StepOutput] = {}
+
+    @property
+    def depends_on(self) -> List[str]:
+        """
+        Names of the upstream steps, whose outputs are used as data inputs
+        of this step.
+        """
+        return list(set([d.step for d in self.data.values() if isinstance(d, StepOutput)]))
+
+
+class Pipeline(BaseModel):
+    steps: List[PipelineStep]
+
+    @model_validator(mode='after')
+    def check_graph(self) -> 'Pipeline':
+        # step names are used as references, thus they need to be unique
+        names = [step.name for step in self.steps]
+        if len(names) != len(set(names)):
+            raise ValueError(f"The step names of a pipeline have to be unique. Got: {names}")
+        
+        # all references need to point to existing steps
+        for step in self.steps:
+            for upstream in step.depends_on:
+                if upstream not in names:
+                    raise ValueError(f"Step '{step.name}' uses the output of step '{upstream}', which is not part of the pipeline.")
+        
+        # this will raise if the graph contains a cycle
+        self.topological_order()
+
+        return self
+    
+    def get_step(self, name: str) -> PipelineStep:
+        return next(step for step in self.steps if step.name == name)
+
+    def topological_order(self) -> List[str]:
+        """
+        Return the step names in an order that runs each step after all
+        of its upstream steps.
+        """
+        order = []
+        remaining = {step.name: set(step.depends_on) for step in self.steps}
+        while len(remaining) > 0:
+            ready = [name for name, deps in remaining.items() if deps.issubset(order)]
+            if len(ready) == 0:
+                raise ValueError(f"The pipeline contains a cycle between the steps: {list(remaining.keys())}")
+            
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+        
+        return order
+
+
+class PipelineJob(BaseModel):
+    pipeline_id: str
+    pipeline: Pipeline
+    status: ToolJobStatus = ToolJobStatus.PENDING
+    jobs: Dict[str, str] = {}
+    cached_steps: List[str] = []
+    error_message: Optional[str] = None
+    client_id: Optional[str] = None
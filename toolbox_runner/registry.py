@@ -0,0 +1,196 @@
+"""
+Registry of the tools, shared by all workers and replicas through the store.
+Each tool name is registered with a single atomic HSETNX, thus concurrent
+registrations never overwrite each other. Every change increments the
+version of the registry and is published to the other processes, which
+update their copy and drop their cached tool specifications. If a change
+is missed, ie. while the connection was lost, the version is compared to
+the store every registry_refresh_seconds.
+"""
+from typing import Optional, Dict, Any
+from time import monotonic
+import threading
+import warnings
+import json
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+
+REGISTRY_KEY = 'tool_map'
+VERSION_KEY = 'tool_map:version'
+CHANNEL = 'toolbox_runner:registry'
+
+
+def _clear_specifications():
+    # the specifications and their validators are cached per process
+    from toolbox_runner.handler import get_cached_tool
+    get_cached_tool.cache_clear()
+
+
+class ToolRegistry(BaseSettings):
+    registry_refresh_seconds: float = Field(30.0, description="Seconds after which the registry version is compared to the store, in case a change was missed.")
+
+    store: Optional[Any] = Field(None, repr=False)
+
+    _tools: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _version: int = PrivateAttr(0)
+    _checked: float = PrivateAttr(0.0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def tools(self) -> Dict[str, str]:
+        """
+        Return a copy of the registered tools and their docker images.
+        """
+        self._maybe_refresh()
+        with self._lock:
+            return dict(self._tools)
+
+    def get(self, tool_name: str) -> Optional[str]:
+        """
+        Return the docker image of the tool. Unknown tools are looked up in the
+        store, as they might have been registered by another replica just now.
+        """
+        self._maybe_refresh()
+        with self._lock:
+            docker_image = self._tools.get(tool_name)
+        if docker_image is not None:
+            return docker_image
+
+        docker_image = (self.store.hgetall(REGISTRY_KEY) or {}).get(tool_name)
+        if docker_image is not None:
+            with self._lock:
+                self._tools[tool_name] = docker_image
+        return docker_image
+
+    def load(self):
+        """
+        Load the full registry from the store.
+        """
+        # the version is read first, a change in between is loaded next time
+        version = int(self.store.get(VERSION_KEY) or 0)
+        tools = self.store.hgetall(REGISTRY_KEY) or {}
+        with self._lock:
+            self._tools = dict(tools)
+            self._version = version
+            self._checked = monotonic()
+
+    def refresh(self) -> bool:
+        """
+        Reload the registry, if its version in the store changed.
+        Returns True, if it was reloaded.
+        """
+        version = int(self.store.get(VERSION_KEY) or 0)
+        self._checked = monotonic()
+        if version == self._version:
+            return False
+
+        # a specification might have changed as well
+        self.load()
+        _clear_specifications()
+        return True
+
+    def _maybe_refresh(self):
+        # processes without the listener compare the version from time to time
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if monotonic() - self._checked > self.registry_refresh_seconds:
+            self.refresh()
+
+    def _publish(self, message: dict):
+        # the fallback store is used by a single process only
+        if hasattr(self.store, 'publish'):
+            try:
+                self.store.publish(CHANNEL, json.dumps(message))
+            except Exception as e:
+                warnings.warn(f"Could not publish the registry change: {str(e)}")
+
+    def register(self, tool_name: str, docker_image: str) -> bool:
+        """
+        Register the tool, if the name is not used yet. Returns False, if the
+        name is registered with another docker image.
+        """
+        if not self.store.hsetnx(REGISTRY_KEY, tool_name, docker_image):
+            registered = (self.store.hgetall(REGISTRY_KEY) or {}).get(tool_name)
+            if registered is not None:
+                with self._lock:
+                    self._tools[tool_name] = registered
+            return registered == docker_image
+
+        version = int(self.store.incr(VERSION_KEY))
+        with self._lock:
+            self._tools[tool_name] = docker_image
+            # otherwise another change is missing and loaded by the next refresh
+            if version == self._version + 1:
+                self._version = version
+        self._publish({'event': 'registered', 'version': version, 'tool_name': tool_name, 'docker_image': docker_image})
+
+        return True
+
+    def invalidate(self):
+        """
+        Drop the cached tool specifications of all processes.
+        """
+        version = int(self.store.incr(VERSION_KEY))
+        _clear_specifications()
+        self.load()
+        self._publish({'event': 'invalidated', 'version': version})
+
+    def _apply(self, message: dict):
+        with self._lock:
+            if message['version'] <= self._version:
+                # our own change, or one we already loaded
+                return
+            in_order = message['version'] == self._version + 1
+            if in_order and message['event'] == 'registered':
+                self._tools[message['tool_name']] = message['docker_image']
+                self._version = message['version']
+                return
+
+        # invalidated, or some changes were missed
+        _clear_specifications()
+        self.load()
+
+    def _listen(self):
+        pubsub = None
+        while not self._stop.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.store.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CHANNEL)
+
+                    # changes might have been missed, while not subscribed
+                    self.refresh()
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None and message['type'] == 'message':
+                    self._apply(json.loads(message['data']))
+                if monotonic() - self._checked > self.registry_refresh_seconds:
+                    self.refresh()
+            except Exception as e:
+                warnings.warn(f"Lost the subscription to the tool registry: {str(e)}")
+                pubsub = None
+                self._stop.wait(1.0)
+
+        if pubsub is not None:
+            pubsub.close()
+
+    def start(self):
+        """
+        Follow the changes of the other processes in a background thread.
+        """
+        if not hasattr(self.store, 'pubsub') or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, daemon=True, name='tool-registry')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
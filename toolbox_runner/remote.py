@@ -0,0 +1,193 @@
+"""
+Remote inputs of a job. HTTP(S) and S3 URLs are downloaded into a shared
+cache, keyed by the URL and the ETag of the remote object, so that repeated
+jobs over the same remote data do not download it again.
+"""
+from typing import Optional, Dict, Callable, ContextManager
+from pathlib import Path, PurePosixPath
+from contextlib import nullcontext
+from urllib.parse import urlparse, unquote, quote
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+import threading
+import tempfile
+import hashlib
+import base64
+import shutil
+import os
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+
+REMOTE_SCHEMES = ('http', 'https', 's3')
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_remote(path: str) -> bool:
+    return urlparse(str(path)).scheme in REMOTE_SCHEMES
+
+
+def remote_name(url: str) -> str:
+    """
+    Return the file name of the remote object.
+    """
+    name = PurePosixPath(unquote(urlparse(url).path)).name
+    return name if name != '' else 'download'
+
+
+def _etag_name(etag: str) -> str:
+    # ETags can contain any character, the file name holds them encoded
+    return base64.urlsafe_b64encode(etag.encode()).decode().rstrip('=') + '.data'
+
+
+def _name_etag(name: str) -> str:
+    encoded = name[:-len('.data')]
+    return base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+
+
+def _download(response, dst: Path, read_only: bool = False):
+    # write to a unique temporary file first, so that no partial file is ever
+    # used, even if other processes download the same object at the same time
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=f".{dst.name}.", suffix='.part')
+    tmp = Path(tmp)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+        os.chmod(tmp, 0o444 if read_only else 0o644)
+        os.replace(tmp, dst)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class DownloadCache(BaseSettings):
+    download_cache_dir: Optional[str] = Field(None, description="Directory of the download cache. Defaults to '.downloads' below the mount base dir.")
+    download_cache_max_bytes: int = Field(10 * 1024 ** 3, description="Size of the download cache. The least recently used downloads are removed first.")
+    download_workers: int = Field(8, description="Number of remote inputs that are downloaded in parallel.")
+    download_timeout: float = 60.0
+    s3_endpoint_url: Optional[str] = Field(None, description="Endpoint of the S3-compatible object store used for s3:// inputs. Defaults to AWS.")
+
+    _locks: Dict[str, threading.Lock] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _uncacheable: set = PrivateAttr(default_factory=set)
+
+    def cache_path(self, mount_path: Path) -> Path:
+        if self.download_cache_dir is not None:
+            p = Path(self.download_cache_dir)
+        else:
+            p = mount_path / '.downloads'
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    def http_url(self, url: str) -> str:
+        """
+        Translate s3:// URLs into HTTP URLs. If boto3 is installed and has
+        credentials, the URL is pre-signed, otherwise the object has to be public.
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != 's3':
+            return url
+        bucket, key = parsed.netloc, parsed.path.lstrip('/')
+
+        try:
+            import boto3
+            client = boto3.client('s3', endpoint_url=self.s3_endpoint_url)
+            return client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=3600)
+        except Exception:
+            # boto3 is not installed or there are no credentials
+            pass
+
+        endpoint = self.s3_endpoint_url or 'https://s3.amazonaws.com'
+        return f"{endpoint.rstrip('/')}/{bucket}/{quote(key)}"
+
+    def etag(self, url: str) -> Optional[str]:
+        """
+        Return the current ETag of the remote object, without downloading it.
+        """
+        request = Request(self.http_url(url), method='HEAD')
+        with urlopen(request, timeout=self.download_timeout) as response:
+            return response.headers.get('ETag')
+
+    def _url_lock(self, url: str) -> ContextManager:
+        with self._lock:
+            # URLs without ETag are downloaded each time anyway
+            if url in self._uncacheable:
+                return nullcontext()
+            if url not in self._locks:
+                self._locks[url] = threading.Lock()
+            return self._locks[url]
+
+    def fetch(self, url: str, dst: Path, mount_path: Path, stage: Callable[[Path, Path], None] = shutil.copy) -> Path:
+        """
+        Put the remote object at dst. Objects with an ETag are downloaded
+        into the cache first and staged from there, ie. by hard-linking.
+        Cached versions are revalidated with If-None-Match, so that a
+        download only happens if the object changed. Objects without an
+        ETag are streamed to dst directly.
+        """
+        entry_dir = self.cache_path(mount_path) / hashlib.sha256(url.encode()).hexdigest()
+
+        # the same URL is never downloaded twice at the same time
+        with self._url_lock(url):
+            known = {_name_etag(p.name): p for p in entry_dir.glob('*.data')} if entry_dir.exists() else {}
+            headers = {'If-None-Match': ', '.join(known.keys())} if len(known) > 0 else {}
+
+            try:
+                with urlopen(Request(self.http_url(url), headers=headers), timeout=self.download_timeout) as response:
+                    etag = response.headers.get('ETag')
+
+                    # without a validator, the download can't be reused
+                    if etag is None:
+                        with self._lock:
+                            self._uncacheable.add(url)
+                        _download(response, dst)
+                        return dst
+
+                    with self._lock:
+                        self._uncacheable.discard(url)
+                    cached = entry_dir / _etag_name(etag)
+                    entry_dir.mkdir(parents=True, exist_ok=True)
+                    # cached objects are linked into the jobs, no tool may change them
+                    _download(response, cached, read_only=True)
+            except HTTPError as e:
+                if e.code != 304:
+                    raise
+                # the object did not change
+                etag = e.headers.get('ETag')
+                cached = known.get(etag, next(iter(known.values())) if len(known) == 1 else None)
+                if cached is None:
+                    raise RuntimeError(f"The server answered {url} with 'Not Modified' for an unknown ETag {etag}.")
+
+            # mark as recently used
+            os.utime(cached)
+            stage(cached, dst)
+
+        self.evict(mount_path)
+        return cached
+
+    def evict(self, mount_path: Path) -> int:
+        """
+        Remove the least recently used downloads, until the cache fits into
+        download_cache_max_bytes. Jobs keep their hard-linked copies.
+        Returns the number of removed bytes.
+        """
+        with self._lock:
+            entries = []
+            for p in self.cache_path(mount_path).glob('*/*.data'):
+                try:
+                    stat = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, p))
+
+            total = sum([size for _, size, _ in entries])
+            removed = 0
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total - removed <= self.download_cache_max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                removed += size
+
+            return removed
@@ -0,0 +1,210 @@
+"""
+Serving of single result files with support for range and conditional requests.
+"""
+from typing import TYPE_CHECKING, Callable, IO, Optional, Tuple, Iterator
+from pathlib import Path, PurePosixPath
+from mimetypes import guess_type
+import hashlib
+import zlib
+
+# the web framework is only needed by the server
+if TYPE_CHECKING:
+    from fastapi import Request
+    from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+# these outputs are compressed on the fly, if the client accepts it
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml', 'application/x-yaml')
+COMPRESSIBLE_EXTENSIONS = ('.log', '.csv', '.txt', '.json', '.yml', '.yaml', '.md')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def safe_result_name(file_name: str) -> str:
+    """
+    Normalize a (nested) path relative to the out_dir of a job.
+    Raises a ValueError if the path would point outside of the out_dir.
+    """
+    p = PurePosixPath(file_name.replace('\\', '/'))
+    if p.is_absolute() or '..' in p.parts:
+        raise ValueError(f"The path '{file_name}' is not a valid result path.")
+
+    # pathlib already collapses '.' parts
+    name = p.as_posix()
+    if name in ('', '.'):
+        raise ValueError(f"The path '{file_name}' is not a valid result path.")
+    return name
+
+
+def resolve_result_path(out_dir: str, file_name: str) -> Path:
+    """
+    Resolve a (nested) result path and make sure, that it does not leave
+    the out_dir, ie. by following symlinks.
+    """
+    base = Path(out_dir).resolve()
+    p = (base / safe_result_name(file_name)).resolve()
+    if not p.is_relative_to(base):
+        raise ValueError(f"The path '{file_name}' is not a valid result path.")
+    return p
+
+
+def file_checksum(f: IO[bytes]) -> str:
+    """
+    Calculate the SHA256 checksum of an open file.
+    """
+    h = hashlib.sha256()
+    while chunk := f.read(CHUNK_SIZE):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def media_type(file_name: str) -> str:
+    mime = guess_type(file_name)[0]
+    return mime if mime is not None else 'application/octet-stream'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range of a Range header into an inclusive
+    (start, end) tuple. Multiple ranges are not supported and answered
+    with the full file, by returning None.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    start, _, end = spec.strip().partition('-')
+    try:
+        if start == '':
+            # suffix range - the last N bytes
+            length = int(end)
+            if length == 0:
+                raise UnsatisfiableRange()
+            return (max(size - length, 0), size - 1)
+
+        start = int(start)
+        end = int(end) if end != '' else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise UnsatisfiableRange()
+
+    return (start, min(end, size - 1))
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _read_range(f: IO[bytes], start: int, length: int) -> Iterator[bytes]:
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _compress(f: IO[bytes], encoding: str) -> Iterator[bytes]:
+    try:
+        if encoding == 'br':
+            compressor = brotli.Compressor()
+            flush = compressor.finish
+            compress = compressor.process
+        else:
+            # wbits of 16 + MAX_WBITS writes a gzip header
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            flush = compressor.flush
+            compress = compressor.compress
+
+        while chunk := f.read(CHUNK_SIZE):
+            out = compress(chunk)
+            if out:
+                yield out
+        yield flush()
+    finally:
+        f.close()
+
+
+def _accepted_encoding(request: 'Request', file_name: str, mime: str) -> Optional[str]:
+    if not (mime.startswith(COMPRESSIBLE_TYPES) or file_name.endswith(COMPRESSIBLE_EXTENSIONS)):
+        return None
+
+    accepted = [e.split(';')[0].strip() for e in request.headers.get('accept-encoding', '').split(',')]
+    if 'br' in accepted and brotli is not None:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def serve_result_file(request: 'Request', opener: Callable[[], IO[bytes]], size: int, file_name: str, checksum: Optional[str]) -> 'Response':
+    """
+    Build the response for a single result file. The strong ETag is the
+    checksum of the file. The response honors If-None-Match, Range and
+    If-Range headers and compresses text outputs on the fly, if the client
+    accepts it and did not request a range. Files without a checksum yet
+    are served without ETag.
+    The opener is only called, if the file content is actually send.
+    """
+    from fastapi.responses import Response, StreamingResponse
+
+    etag = f'"{checksum}"' if checksum is not None else None
+    mime = media_type(file_name)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Vary': 'Accept-Encoding',
+        'Content-Disposition': f'inline; filename="{PurePosixPath(file_name).name}"',
+    }
+    if etag is not None:
+        headers['ETag'] = etag
+
+    # a range is only served if the file did not change in the meantime
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header is not None and (if_range is None or (etag is not None and if_range.strip() == etag)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except UnsatisfiableRange:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f"bytes */{size}"})
+    else:
+        byte_range = None
+
+    # the compressed representation needs its own tag
+    encoding = _accepted_encoding(request, file_name, mime) if byte_range is None else None
+    if encoding is not None and etag is not None:
+        headers['ETag'] = f'"{checksum}-{encoding}"'
+
+    # the client already has this version of the file
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None and etag is not None and _etag_matches(if_none_match, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        headers['Content-Length'] = str(end - start + 1)
+        return StreamingResponse(_read_range(opener(), start, end - start + 1), status_code=206, media_type=mime, headers=headers)
+
+    # compress text outputs
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+        return StreamingResponse(_compress(opener(), encoding), media_type=mime, headers=headers)
+
+    headers['Content-Length'] = str(size)
+    return StreamingResponse(_read_range(opener(), 0, size), media_type=mime, headers=headers)
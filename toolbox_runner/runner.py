@@ -1,34 +1,82 @@
-from typing import TYPE_CHECKING, Optional, Literal, Tuple, Dict, List
+from typing import TYPE_CHECKING, Optional, Literal, Tuple, Dict, List, BinaryIO
 from pathlib import Path
 from uuid import uuid4
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from string import ascii_letters
 from random import choice
+import os
 import shutil
+import tarfile
+import zipfile
 import json
+import hashlib
+import threading
+import re
 from time import time
 
-from docker.errors import APIError
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 if TYPE_CHECKING:
     from toolbox_runner.models import Tool
-from toolbox_runner.docker_client import get_client
+from toolbox_runner.backends import ExecutionBackend, ExecutionResult, create_backend
+from toolbox_runner.remote import DownloadCache, is_remote, remote_name
+from toolbox_runner.archives import archive_stem
 from toolbox_runner import __version__
 
+
+# relative path of a shard folder, that holds the job directories
+SHARD_PATTERN = re.compile(r'^\d{4}/\d{2}/\d{2}/[0-9a-f]+$')
+
+
+def shard_path(job_id: str, created: Optional[datetime] = None, width: int = 2) -> Path:
+    """
+    Return the mount directory of a job relative to the mount base dir in
+    the sharded layout, ie. 2024/05/17/3f/<job_id>. Each day is fanned out
+    by a prefix of the hashed job id, to keep the directories small.
+    """
+    created = created or datetime.now()
+    shard = hashlib.sha256(job_id.encode()).hexdigest()[:width]
+    return Path(created.strftime('%Y')) / created.strftime('%m') / created.strftime('%d') / shard / job_id
+
+
 BASE_DIR = str(Path(__file__).parent.parent / 'tool_mounts')
 # BASE_DIR = str(Path('~/tool_runner').expanduser())
 
 
 class ToolRunner(BaseSettings):
     mount_base_dir: str = BASE_DIR
-    name_mode: Literal['uuid', 'tool_name', 'random'] = Field('random', description="Defines how the tool_runner will name the mount directories for a tool run.")
+    name_mode: Literal['uuid', 'tool_name', 'random'] = Field('random', description="Defines how the tool_runner will name the mount directories for a tool run. Only used by the flat mount layout.")
+    mount_layout: Literal['flat', 'sharded'] = Field('sharded', description="'sharded' puts the mount directories below date and job id hash prefix folders, 'flat' puts them right into the mount base dir.")
+    mount_shard_width: int = Field(2, description="Number of hex digits of the hashed job id used as shard folder in the sharded layout.")
     rename_input_files: bool = True
+    link_input_data: bool = Field(True, description="Hard-link input files that already reside below the mount base dir (ie. outputs of other jobs) instead of copying them.")
+    staging_workers: int = Field(8, description="Number of threads that stage the files of directory inputs in parallel.")
+    execution_backend: Literal['docker', 'oci', 'local'] = Field('docker', description="Backend used to run the tools.")
+    backend: Optional[ExecutionBackend] = Field(None, repr=False)
+    downloads: Optional[DownloadCache] = Field(None, repr=False)
 
     # replace the mount base dir with this dir if inside a container
     container_replace_mount: Optional[str] = None
 
+    # number of started tools, that did not finish yet
+    _running: int = PrivateAttr(0)
+    _running_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context) -> None:
+        # the cache for remote inputs
+        if self.downloads is None:
+            self.downloads = DownloadCache()
+
+        # the backend that runs the tools
+        if self.backend is None:
+            self.backend = create_backend(self.execution_backend)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
     @property
     def mount_path(self):
         p = Path(self.mount_base_dir)
@@ -39,6 +87,25 @@ class ToolRunner(BaseSettings):
 
         return p
     
+    def _stage_file(self, src: Path, dst: Path):
+        """
+        Put a single input file into the input directory of a tool run.
+        Files that are already managed by this runner are hard-linked, as they
+        live on the same volume. Anything else is copied.
+        Linked files share their content and mode with the source, thus tools
+        must not change their inputs in place. Cached downloads are read-only
+        already.
+        """
+        if self.link_input_data and src.resolve().is_relative_to(self.mount_path.resolve()):
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                # different devices or links not supported - fall back to copy
+                pass
+        
+        shutil.copy(src, dst)
+
     def _get_tool_mount_name(self, tool_name: Optional[str] = None) -> str:
         # if the name was already created, return that
         if hasattr(self, '__tool_mount_name'):
@@ -57,16 +124,47 @@ class ToolRunner(BaseSettings):
         # return the name
         return self.__tool_mount_name
 
-    def create_mount_folders(self, tool_name: str, in_dir: Optional[str] = None, out_dir: Optional[str] = None) -> Tuple[str, str]:
+    def _create_base_dir(self, tool_name: str, job_id: Optional[str] = None) -> Path:
+        """
+        Create the directory of a new tool run. The directory itself is created
+        with a single mkdir, which fails if it exists already. This way, two
+        runs never share a directory.
+        """
+        if self.mount_layout == 'sharded':
+            base_dir = self.mount_path / shard_path(job_id or str(uuid4()), width=self.mount_shard_width)
+            for _ in range(3):
+                base_dir.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    base_dir.mkdir()
+                    return base_dir
+                except FileExistsError:
+                    raise RuntimeError(f"The mount directory {base_dir} exists already. Is the job id {job_id} used twice?")
+                except FileNotFoundError:
+                    # the janitor removed the emptied shard in the meantime
+                    continue
+            raise RuntimeError(f"Could not create the mount directory {base_dir}.")
+
+        # the names of the flat layout might repeat, ie. for the same tool within a second
+        name = self._get_tool_mount_name(tool_name=tool_name)
+        for attempt in range(100):
+            base_dir = self.mount_path / (name if attempt == 0 else f"{name}_{attempt}")
+            try:
+                base_dir.mkdir()
+                return base_dir
+            except FileExistsError:
+                continue
+        raise RuntimeError(f"Could not create a new mount directory for {name} in {self.mount_path}.")
+
+    def create_mount_folders(self, tool_name: str, in_dir: Optional[str] = None, out_dir: Optional[str] = None, job_id: Optional[str] = None) -> Tuple[str, str]:
         """
         Create the input and output directories for the tool run.
-        By default this will create a random location at the base mount path and create a 
-        input and output directory there.
+        By default this will create a new location below the base mount path,
+        derived from the job_id, and create a input and output directory there.
         
         """
         # check if we need a new location at all
         if in_dir is None or out_dir is None:
-            base_dir = self.mount_path / self._get_tool_mount_name(tool_name=tool_name)
+            base_dir = self._create_base_dir(tool_name=tool_name, job_id=job_id)
         
         # create the input dir at the correct location
         if in_dir is None:
@@ -91,32 +189,108 @@ class ToolRunner(BaseSettings):
         Copies the given list of data_files into the in_dir for the tool
         run. The list should be created using the toolbox_runner.models.Data class,
         so that it was checked for being valid.
+        Directories are copied with all their content. As these can hold
+        thousands of small files, the files are staged in parallel.
+        URLs are downloaded in parallel through the download cache.
 
         """
         # create the mapping for the files
         copied_files = {}
 
+        # collect all files first, to stage them in parallel
+        staged: List[Tuple[Path, Path]] = []
+        remote: List[Tuple[str, Path]] = []
+
         # get the input path
         in_path = Path(in_dir)
 
         # go for each file
         for name, file_name in data_files.items():
+            # remote files are downloaded later
+            if is_remote(file_name):
+                file_path = Path(remote_name(file_name))
+                out_name = in_path / (f"{name}{file_path.suffix}" if self.rename_input_files else file_path.name)
+                remote.append((file_name, out_name))
+                copied_files[name] = f"{self.backend.in_path(in_dir)}/{out_name.name}"
+                continue
+
             file_path = Path(file_name)
             # figure out the out name
             if self.rename_input_files:
-                out_name = in_path / f"{name}{file_path.suffix}"
+                out_name = in_path / (name if file_path.is_dir() else f"{name}{file_path.suffix}")
             else:
                 out_name = in_path / file_path.name
             
-            # copy the file
-            shutil.copy(file_path, out_name)
+            # copy or link the file, or the content of the directory
+            if file_path.is_dir():
+                out_name.mkdir(parents=True, exist_ok=True)
+                for src in file_path.rglob('*'):
+                    dst = out_name / src.relative_to(file_path)
+                    if src.is_dir():
+                        dst.mkdir(parents=True, exist_ok=True)
+                    else:
+                        staged.append((src, dst))
+            else:
+                staged.append((file_path, out_name))
 
             # add the path WITHIN THE CONTAINER to the out-mapping
-            copied_files[name] = f"/in/{out_name.name}"
+            # the local process backend uses the paths on the host
+            copied_files[name] = f"{self.backend.in_path(in_dir)}/{out_name.name}"
+
+        # start the downloads, while the local files are staged
+        downloader = None
+        downloads = []
+        if len(remote) > 0:
+            downloader = ThreadPoolExecutor(max_workers=self.downloads.download_workers, thread_name_prefix='download-input')
+            downloads = [downloader.submit(self.downloads.fetch, url, dst, self.mount_path, self._stage_file) for url, dst in remote]
+
+        try:
+            # stage the files
+            if len(staged) > 1 and self.staging_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.staging_workers, thread_name_prefix='stage-input') as executor:
+                    # consume the results to raise any error
+                    list(executor.map(lambda paths: self._stage_file(*paths), staged))
+            else:
+                for src, dst in staged:
+                    self._stage_file(src, dst)
+            
+            # wait for the downloads and raise any error
+            for download in downloads:
+                download.result()
+        finally:
+            # if anything failed, no download may write into the in_dir afterwards
+            if downloader is not None:
+                downloader.shutdown(wait=True, cancel_futures=True)
 
         # return the mapping
         return copied_files
 
+    def extract_input_archive(self, in_dir: str, name: str, fileobj: BinaryIO, file_name: str) -> str:
+        """
+        Extract an uploaded zip or tar archive into a directory of the in_dir.
+        Tar archives are extracted as a stream, while the read, so that there
+        is no need to save the archive first. Zip archives need a seekable 
+        file, ie. the spooled upload.
+        Returns the path of the directory as seen by the tool.
+        """
+        # figure out the directory name
+        if self.rename_input_files:
+            out_name = Path(in_dir) / name
+        else:
+            out_name = Path(in_dir) / archive_stem(file_name)
+        out_name.mkdir(parents=True, exist_ok=True)
+
+        if file_name.lower().endswith('.zip'):
+            # zipfile strips absolute paths and parent references from the members
+            with zipfile.ZipFile(fileobj) as archive:
+                archive.extractall(out_name)
+        else:
+            # the data filter refuses members and links pointing outside of out_name
+            with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+                archive.extractall(out_name, filter='data')
+
+        return f"{self.backend.in_path(in_dir)}/{out_name.name}"
+
     def create_input_parameterization(self, tool_name: str, input_parameter: dict, in_dir: str, copied_data: Dict[str, str]) -> str:
         """
         Create the inputs.json in the already created mount location.
@@ -141,15 +315,21 @@ class ToolRunner(BaseSettings):
         
         return str(inputs_json)
     
-    def init_tool(self, tool: 'Tool', parameter: dict, data: Dict[str, str], in_dir: Optional[str] = None, out_dir: Optional[str] = None) -> Tuple[str, str]:
+    def init_tool(self, tool: 'Tool', parameter: dict, data: Dict[str, str], in_dir: Optional[str] = None, out_dir: Optional[str] = None, archives: Dict[str, Tuple[str, BinaryIO]] = {}, job_id: Optional[str] = None) -> Tuple[str, str]:
         # first step is to validate given parameter and data
-        input_config = tool.input_file(parameter=parameter, data=data)
+        # archives are (file_name, fileobj) tuples, that are extracted later on
+        input_config = tool.input_file(parameter=parameter, data={**data, **{name: file_name for name, (file_name, _) in archives.items()}})
 
         # if there were no validation error, build the mount directories
-        in_dir, out_dir = self.create_mount_folders(tool_name=tool.name, in_dir=in_dir, out_dir=out_dir)
+        in_dir, out_dir = self.create_mount_folders(tool_name=tool.name, in_dir=in_dir, out_dir=out_dir, job_id=job_id)
         
         # copy the input data
-        copied_data = self.copy_input_data(in_dir=in_dir, data_files=input_config[tool.name]['data'])
+        data_files = {name: path for name, path in input_config[tool.name]['data'].items() if name not in archives}
+        copied_data = self.copy_input_data(in_dir=in_dir, data_files=data_files)
+
+        # extract the uploaded archives
+        for name, (file_name, fileobj) in archives.items():
+            copied_data[name] = self.extract_input_archive(in_dir=in_dir, name=name, fileobj=fileobj, file_name=file_name)
 
         # inject the new info to the parameterization and create the file
         self.create_input_parameterization(tool_name=tool.name, input_parameter=input_config, in_dir=in_dir, copied_data=copied_data)
@@ -158,10 +338,12 @@ class ToolRunner(BaseSettings):
         # successfully been initialized
         return (in_dir, out_dir)
     
-    def run(self, tool: 'Tool', in_dir: str, out_dir: str, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> dict:
+    def start(self, tool: 'Tool', in_dir: str, out_dir: str, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> Future:
         """
-        Run the tool at the given locations. At first it has to be initialized
+        Start the tool at the given locations. At first it has to be initialized
         using the init_tool function.
+        Returns a future of the out_dir, that resolves once the tool finished
+        and its logs and metadata were written to the out_dir.
         """
         # TODO: if the tool runner is running in the docker container, the mount paths need to be 
         # adjusted. anything below the base mount dir (in the container) needs to be replaced with the 
@@ -175,8 +357,8 @@ class ToolRunner(BaseSettings):
             in_mount_point = Path(in_dir).relative_to(self.mount_path)
             host_in_dir = Path(self.container_replace_mount) / in_mount_point
         else:
-            host_in_dir = in_dir
-            host_out_dir = out_dir
+            host_in_dir = Path(in_dir)
+            host_out_dir = Path(out_dir)
 
         # no mapping needed, as tool-runner is not running in a container
         if not Path(in_dir).exists():
@@ -184,57 +366,49 @@ class ToolRunner(BaseSettings):
         if not Path(out_dir).exists():
             raise ValueError(f"Output directory for tool results: {host_out_dir} does not exist. If tool-runner is running in a container, set the mount path on the host as: CONTAINER_REPLACE_MOUNT.")
 
-        # build the run args
-        run_args = dict(
-            image=tool.docker_image,
-            volumes=[
-                f"{host_in_dir.resolve()}:/in",
-                f"{host_out_dir.resolve()}:/out",
-                *extra_mounts
-            ],
-            environment=[
-                f"TOOL_RUN={tool.name}", 
-                *[f"{k.upper()}={v}" for k, v in extra_env.items()]
-            ],
-            **extra_args
-        )
-
-        # get a docker client
-        client = get_client()
-
         # start a timer
         t1 = time()
 
-        try:
-            container = client.containers.create(**run_args)
+        execution = self.backend.start(tool=tool, in_dir=Path(in_dir), out_dir=Path(out_dir), host_in_dir=host_in_dir, host_out_dir=host_out_dir, extra_mounts=extra_mounts, extra_args=extra_args, extra_env=extra_env)
+        with self._running_lock:
+            self._running += 1
 
-            # TODO: some kind of profiling here?
-            container.start()
-            container.wait()
+        # write the logs and metadata, once the tool finished
+        future = Future()
+        def _finalize(f: Future):
+            with self._running_lock:
+                self._running -= 1
+            try:
+                future.set_result(self.finalize(out_dir, t1, f.result()))
+            except Exception as e:
+                future.set_exception(e)
+        execution.add_done_callback(_finalize)
 
-            # load the logs from the container
-            stdout = container.logs(stdout=True, stderr=False).decode()
-            stderr = container.logs(stdout=False, stderr=True).decode()
-        
-        except APIError as e:
-            # Make this better
-            print('Could not run the tool container:')
-            print(e.explanation)
-        finally:
-            t2 = time()
+        return future
+
+    def finalize(self, out_dir: str, started: float, result: ExecutionResult) -> str:
+        """
+        Write the logs and the run metadata of a finished tool to the out_dir.
+        """
+        t2 = time()
         
-        # write to the out location
-        with open(Path(out_dir) / 'STDOUT.log', 'w') as f:
-            f.write(stdout)
+        # write to the out location, if the backend did not already
+        if result.stdout is not None:
+            with open(Path(out_dir) / 'STDOUT.log', 'w') as f:
+                f.write(result.stdout)
         
-        if stderr != '':
+        if result.stderr is not None and result.stderr != '':
             with open(Path(out_dir) / 'STDERR.log', 'w') as f:
-                f.write(stderr)
+                f.write(result.stderr)
         
         # write metadata
         # TODO: write a model for this as well
         metadata = {
-            'runtime': t2 - t1,
+            'runtime': t2 - started,
+            'exit_code': result.exit_code,
+            'oom_killed': result.oom_killed,
+            'cpu_seconds': result.cpu_seconds,
+            'peak_memory': result.peak_memory,
             'toolbox_runner.version': __version__,
             'timestamp': datetime.now().isoformat()
         }
@@ -242,4 +416,11 @@ class ToolRunner(BaseSettings):
             json.dump(metadata, f, indent=4)
 
         # return the output path
-        return out_dir
\ No newline at end of file
+        return out_dir
+
+    def run(self, tool: 'Tool', in_dir: str, out_dir: str, extra_mounts: List[str] = [], extra_args: dict = {}, extra_env: Dict[str, str] = {}) -> str:
+        """
+        Run the tool at the given locations and block until it finished.
+        At first it has to be initialized using the init_tool function.
+        """
+        return self.start(tool=tool, in_dir=in_dir, out_dir=out_dir, extra_mounts=extra_mounts, extra_args=extra_args, extra_env=extra_env).result()
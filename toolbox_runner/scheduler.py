@@ -0,0 +1,268 @@
+"""
+Scheduling of the tool runs. If the number of running tools is limited, the
+runs are queued and started in the order of the scheduler policy:
+
+- fifo: in the order they were submitted
+- sjf: shortest predicted runtime first, so that short interactive runs are
+  not stuck behind long calibrations
+- bin_packing: like sjf, but runs are only started, if their predicted peak
+  memory fits into the memory left by the running tools
+
+To not starve long runs, the predicted runtime of a queued run is reduced
+by scheduler_aging seconds for every second it waited. The queue is kept in
+memory and only orders the runs of this process. The queued jobs are noted
+in the store, together with the scheduler that queued them. Jobs of a
+scheduler, that stopped sending heartbeats (ie. after a restart), are
+queued again by another one.
+"""
+from typing import TYPE_CHECKING, Optional, List, Dict, Callable, Literal, Any
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from time import monotonic
+from uuid import uuid4
+import threading
+import warnings
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import ToolJob, QueueEntry
+
+if TYPE_CHECKING:
+    from toolbox_runner.handler import ToolHandler
+
+
+QUEUED_KEY = 'scheduler:queued'
+
+
+class _Run:
+    def __init__(self, job: ToolJob, start: Callable[[], Future], runtime: Optional[float], memory: Optional[int]):
+        self.job = job
+        self.start = start
+        self.runtime = runtime
+        self.memory = memory
+        self.queued = monotonic()
+        self.queued_at = datetime.now()
+        self.started: Optional[float] = None
+        self.future = Future()
+
+
+class JobScheduler(BaseSettings):
+    scheduler_max_running: Optional[int] = Field(None, description="Maximum number of tools running at the same time. Further runs are queued. Not limited if not set.")
+    scheduler_policy: Literal['fifo', 'sjf', 'bin_packing'] = Field('sjf', description="Order in which queued runs are started.")
+    scheduler_memory_bytes: Optional[int] = Field(None, description="Memory available to the running tools. Only used by the bin_packing policy.")
+    scheduler_aging: float = Field(1.0, description="Seconds of predicted runtime a queued run gains for every second it waits.")
+    scheduler_max_skip_seconds: float = Field(600.0, description="Seconds the first queued run may be skipped by bin_packing, before it is started next.")
+    scheduler_default_runtime: float = Field(60.0, description="Runtime assumed for tools without enough history.")
+    scheduler_heartbeat_seconds: float = Field(10.0, description="Seconds between two heartbeats of the scheduler. Jobs of a scheduler without heartbeat for three times as long are queued again.")
+
+    store: Optional[Any] = Field(None, repr=False)
+
+    _queue: List[_Run] = PrivateAttr(default_factory=list)
+    _running: Dict[str, _Run] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _instance: str = PrivateAttr(default_factory=lambda: uuid4().hex)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _handler: Optional[Any] = PrivateAttr(None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.scheduler_max_running is not None
+
+    @property
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def _runtime(self, run: _Run) -> float:
+        return run.runtime if run.runtime is not None else self.scheduler_default_runtime
+
+    def _order(self, now: float, extra: Optional[_Run] = None) -> List[_Run]:
+        queue = self._queue if extra is None else [*self._queue, extra]
+        if self.scheduler_policy == 'fifo':
+            return list(queue)
+        return sorted(queue, key=lambda r: self._runtime(r) - self.scheduler_aging * (now - r.queued))
+
+    def _pick(self) -> Optional[_Run]:
+        # has to be called with the lock held
+        if len(self._queue) == 0 or len(self._running) >= self.scheduler_max_running:
+            return None
+        now = monotonic()
+        order = self._order(now)
+        if self.scheduler_policy != 'bin_packing' or self.scheduler_memory_bytes is None:
+            return order[0]
+
+        # a run larger than all memory is started, once nothing else runs
+        free = self.scheduler_memory_bytes - sum([r.memory or 0 for r in self._running.values()])
+        if len(self._running) == 0 or (order[0].memory or 0) <= free:
+            return order[0]
+
+        # others may skip the first run only for a while
+        if now - order[0].queued > self.scheduler_max_skip_seconds:
+            return None
+        return next((r for r in order[1:] if (r.memory or 0) <= free), None)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                run = self._pick()
+                if run is None:
+                    return
+                self._queue.remove(run)
+                run.started = monotonic()
+                self._running[run.job.job_id] = run
+
+            # start outside of the lock, as this talks to the backend
+            try:
+                if not self._claim(run.job.job_id):
+                    raise RuntimeError(f"Job {run.job.job_id} was queued again by another worker, as this one missed its heartbeats.")
+                started = run.start()
+            except Exception as e:
+                self._done(run)
+                run.future.set_exception(e)
+                continue
+            started.add_done_callback(lambda f, run=run: self._finished(run, f))
+
+    def _done(self, run: _Run):
+        with self._lock:
+            self._running.pop(run.job.job_id, None)
+
+    def _finished(self, run: _Run, future: Future):
+        self._done(run)
+        try:
+            run.future.set_result(future.result())
+        except Exception as e:
+            run.future.set_exception(e)
+        self._dispatch()
+
+    def submit(self, job: ToolJob, start: Callable[[], Future], runtime: Optional[float] = None, memory: Optional[int] = None) -> Future:
+        """
+        Queue the run of the job. start is called, once the job is picked, and
+        has to return a future of the finished job. Returns a future, that
+        resolves to the finished job as well.
+        """
+        run = _Run(job, start, runtime, memory)
+        if self.store is not None:
+            # without heartbeats, other schedulers would take over the job
+            self.start()
+            self.store.hset(QUEUED_KEY, mapping={job.job_id: self._instance})
+        with self._lock:
+            self._queue.append(run)
+        self._dispatch()
+        return run.future
+
+    def _claim(self, job_id: str) -> bool:
+        # removing the note is atomic, only one scheduler can start the job
+        if self.store is None:
+            return True
+        return self.store.hdel(QUEUED_KEY, job_id) == 1
+
+    def orphaned(self) -> List[str]:
+        """
+        Return the ids of the queued jobs, whose scheduler stopped sending
+        heartbeats. The jobs are claimed, thus they are only returned once.
+        """
+        if self.store is None:
+            return []
+
+        alive = {self._instance: True}
+        orphaned = []
+        for job_id, instance in (self.store.hgetall(QUEUED_KEY) or {}).items():
+            if instance not in alive:
+                alive[instance] = bool(self.store.exists(f"scheduler:alive:{instance}"))
+            if not alive[instance] and self._claim(job_id):
+                orphaned.append(job_id)
+        return orphaned
+
+    def _beat(self):
+        ttl = 3 * self.scheduler_heartbeat_seconds
+        self.store.set(f"scheduler:alive:{self._instance}", datetime.now().isoformat(), px=int(ttl * 1000))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._beat()
+                if self._handler is not None:
+                    self._handler.recover_queued_jobs()
+            except Exception as e:
+                warnings.warn(f"The scheduler heartbeat failed: {str(e)}")
+            self._stop.wait(self.scheduler_heartbeat_seconds)
+
+    def start(self, handler: Optional['ToolHandler'] = None):
+        """
+        Send heartbeats in a background thread. This is started with the
+        first queued job. If a handler is given, the jobs of stopped
+        schedulers are queued again through it as well.
+        """
+        if handler is not None:
+            self._handler = handler
+        if self.store is None or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        # the first heartbeat is sent right away
+        self._beat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='job-scheduler')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.store is None:
+            return
+        try:
+            self.store.delete(f"scheduler:alive:{self._instance}")
+        except Exception:
+            # the heartbeat expires anyway
+            pass
+
+    def _simulate(self, extra: Optional[_Run] = None) -> List[tuple]:
+        """
+        Return the queued runs in the order they are expected to start, with
+        the seconds until they are expected to end.
+        """
+        with self._lock:
+            now = monotonic()
+            order = self._order(now, extra=extra)
+
+            # seconds until each slot is free
+            slots = [max(self._runtime(r) - (now - r.started), 0.0) for r in self._running.values()]
+        slots.extend([0.0] * max(self.scheduler_max_running - len(slots), 0))
+
+        ends = []
+        for run in order:
+            slot = slots.index(min(slots))
+            slots[slot] += self._runtime(run)
+            ends.append((run, slots[slot]))
+        return ends
+
+    def forecast(self, job: ToolJob, runtime: Optional[float] = None) -> Optional[str]:
+        """
+        Return the expected end of the job, if it was submitted now.
+        """
+        if not self.enabled:
+            return None
+        extra = _Run(job, lambda: None, runtime, None)
+        seconds = next(s for r, s in self._simulate(extra) if r is extra)
+        return (datetime.now() + timedelta(seconds=seconds)).isoformat()
+
+    def queue(self) -> List[QueueEntry]:
+        """
+        Return the queued runs in the order they are expected to start. The
+        ETA is the expected end of the run, assuming all predictions hold.
+        """
+        if not self.enabled:
+            return []
+        return [
+            QueueEntry(
+                job_id=run.job.job_id,
+                tool_name=run.job.tool_name,
+                client_id=run.job.client_id,
+                position=position,
+                predicted_runtime=run.runtime,
+                predicted_memory=run.memory,
+                queued=run.queued_at.isoformat(),
+                eta=(datetime.now() + timedelta(seconds=seconds)).isoformat()
+            )
+            for position, (run, seconds) in enumerate(self._simulate())
+        ]
@@ -1,29 +1,122 @@
-from typing import List, Annotated
+from typing import List, Annotated, Literal, Optional
+from contextlib import asynccontextmanager
+import importlib
+import threading
+import asyncio
 import tempfile
 from pathlib import Path
 import json
 from mimetypes import guess_type
 import shutil
+import os
 
-from fastapi import FastAPI, HTTPException, UploadFile, Form
+from fastapi import FastAPI, HTTPException, UploadFile, Form, Request, Query, Depends, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.background import BackgroundTask
 
 from toolbox_runner import __version__
-from toolbox_runner.handler import ToolHandler, ToolRunner, ToolSniffer
-from toolbox_runner.models import Tool, ToolJob, ToolResultFile
+from toolbox_runner.handler import ToolHandler, ToolRunner, ToolSniffer, PipelineStepError
+from toolbox_runner.models import Tool, ToolJob, ToolJobStatus, ToolResultFile, Pipeline, PipelineJob, JobEvent, UsageReport, QueueEntry
 from toolbox_runner.docker_client import get_client
+from toolbox_runner.results import serve_result_file, safe_result_name, resolve_result_path
+from toolbox_runner.slicing import ResultSlicer, CSVSource, SliceTooLarge, parse_bounds
+from toolbox_runner.events import Subscription, job_event
+from toolbox_runner.supervisor import stop_supervisor
+from toolbox_runner.archives import is_archive, archive_stem
+from toolbox_runner.backends import DockerBackend
+from toolbox_runner.accounting import QuotaExceeded
+from toolbox_runner.admission import AdmissionMiddleware, admission_release
+
+
+# for now we will use a global handler, which is created on startup
+# we can later on create a ToolRunner per User witg hard-coded mount-paths and/or tool mapping
+_handler: Optional[ToolHandler] = None
+_handler_lock = threading.Lock()
+
+# state of the startup for the readiness probe
+_startup = {'ready': False, 'tools_cached': None}
+
+
+def get_handler() -> ToolHandler:
+    global _handler
+
+    # the handler connects to the store and loads the tool map
+    if _handler is None:
+        with _handler_lock:
+            if _handler is None:
+                _handler = ToolHandler(runner=ToolRunner())
+    return _handler
+
+Handler = Annotated[ToolHandler, Depends(get_handler)]
+
+
+def get_client_id(handler: Handler, request: Request) -> str:
+    # the client is identified by a header, ie. set by an authenticating proxy
+    return handler.accounting.client(request.headers.get(handler.accounting.client_header))
+
+ClientId = Annotated[str, Depends(get_client_id)]
+
+
+def _warm_tool_cache(handler: ToolHandler):
+    _startup['tools_cached'] = handler.warm_tool_cache()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # create the handler and load the docker client in parallel
+    handler, _ = await asyncio.gather(
+        asyncio.to_thread(get_handler),
+        asyncio.to_thread(importlib.import_module, 'docker')
+    )
+
+    # index the results in processes, the server module is safe to be imported again
+    if handler.ingestor.ingest_executor is None:
+        handler.ingestor.ingest_executor = 'process'
+
+    # start the background cleanup of the mount directories
+    handler.janitor.start(handler)
+    
+    # start archiving idle jobs to the cold storage
+    handler.storage.start(handler)
+
+    # sample the load for the admission control
+    handler.admission.start(handler)
+
+    # follow the tools registered by other workers and replicas
+    handler.registry.start()
+
+    # queue the jobs again, that were queued before a restart
+    handler.scheduler.start(handler)
+
+    # load the tool specifications in the background
+    threading.Thread(target=_warm_tool_cache, args=(handler, ), daemon=True, name='tool-cache').start()
+    _startup['ready'] = True
+    yield
+    _startup['ready'] = False
+    handler.janitor.stop()
+    handler.storage.stop()
+    handler.admission.stop()
+    handler.registry.stop()
+    handler.scheduler.stop()
+    handler.events.close()
+    handler.ingestor.shutdown()
+    stop_supervisor()
+    slicer.clear()
 
 
 app = FastAPI(
+    lifespan=lifespan,
     version=__version__,
     title="Async tool-specs enabled Container Runner",
     description="Asynchronous dispatching server for containerized tools implementing tool-specs interface.",
     root_path="/api/v1"
 )
 
+# reject create and run requests under pressure, before the uploads are read
+app.add_middleware(AdmissionMiddleware, get_controller=lambda: get_handler().admission)
+
 # add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -33,10 +126,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# for now we will use a global handler
-# we can later on create a ToolRunner per User witg hard-coded mount-paths and/or tool mapping
-runner = ToolRunner()
-handler = ToolHandler(runner=runner)
+# keeps result files open for repeated slicing
+slicer = ResultSlicer()
 
 # for now we whitelist the tool container that may be called
 WHITELIST = ['ghcr.io/vforwater/', 'ghcr.io/hydrocode-de/', 'ghcr.io/camels-de/', 'ghcr.io/kit-hyd/']
@@ -48,13 +139,31 @@ def index():
         'version': __version__
     }
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe. Returns a 503 until the store is connected and the
+    background services are started. The tool specifications might still 
+    be loading, which is indicated by tools_cached being null.
+    """
+    if not _startup['ready']:
+        raise HTTPException(status_code=503, detail="The server is still starting up.")
+    
+    return {
+        'ready': True,
+        'tools': len(get_handler().tool_map),
+        'registry_version': get_handler().registry.version,
+        'tools_cached': _startup['tools_cached'],
+        'load': get_handler().admission.state()
+    }
+
 @app.get("/tools")
-def get_tools() -> List[str]:
+def get_tools(handler: Handler) -> List[str]:
     # get the current list of tools
     return list(handler.tool_map.keys())
 
 @app.get("/tools/full")
-def get_full_tool_list() -> List[Tool]:
+def get_full_tool_list(handler: Handler) -> List[Tool]:
     # container for the tools
     tools = []
     # get the current list of tools
@@ -65,7 +174,7 @@ def get_full_tool_list() -> List[Tool]:
     return tools
 
 @app.get("/tool/{tool_name}")
-def get_tool(tool_name: str) -> Tool:
+def get_tool(handler: Handler, tool_name: str) -> Tool:
     # get the tool specification
     tool =  handler.get_tool(tool_name)
 
@@ -76,7 +185,7 @@ def get_tool(tool_name: str) -> Tool:
     return tool
 
 @app.post("/tools/register")
-def register_tools(docker_image: str):
+def register_tools(handler: Handler, docker_image: str):
     # check if the docker image is whitelisted
     if not any([docker_image.startswith(prefix) for prefix in WHITELIST]):
         raise HTTPException(status_code=403, detail=f"Image '{docker_image}' is not whitelisted for registration. Please contact the administrator. You may only use images from these namespaces: {WHITELIST}. If you are the administrator, you can change the WHITELIST variable")
@@ -87,16 +196,17 @@ def register_tools(docker_image: str):
     else:
         tag = 'latest'
 
-    # try to pull the requested images
-    client = get_client()
-    try:
-        client.images.pull(docker_image, tag=tag)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Could not pull {docker_image}:{tag}. ERROR: {str(e)}")
+    # try to pull the requested images - the other backends pull on their own
+    if isinstance(handler.runner.backend, DockerBackend):
+        client = get_client()
+        try:
+            client.images.pull(docker_image, tag=tag)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Could not pull {docker_image}:{tag}. ERROR: {str(e)}")
     
     # create a tool sniffer to find tools
     try:
-        sniffer = ToolSniffer(docker_image=docker_image)
+        sniffer = ToolSniffer(docker_image=docker_image, backend=handler.runner.backend)
         tools = sniffer.get_tools()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"The image {docker_image}:{tag} failed on registration. Does it follow the tool-specs: https://vforwater.github.io/tool-specs/ ? ERROR: {str(e)}")
@@ -114,11 +224,15 @@ def register_tools(docker_image: str):
 
 @app.post("/tool/{tool_name}/create")
 def create_job(
+    handler: Handler,
+    client_id: ClientId,
     tool_name: str, 
     files: list[UploadFile] = [], 
     parameters: Annotated[str, Form()] = '{}', 
     local_data: Annotated[str, Form()] = '{}',
-    name_mapping: Annotated[str, Form()] = '{}'
+    name_mapping: Annotated[str, Form()] = '{}',
+    webhook: Annotated[Optional[str], Form()] = None,
+    extract_archives: Annotated[bool, Form()] = False
 ) -> ToolJob:
     # parameter and local_data might be json encoded strings
     try:
@@ -132,13 +246,19 @@ def create_job(
         raise HTTPException(status_code=400, detail=f"Could not parse the parameters or local_data. Make sure they are valid JSON. ERROR: {str(e)}")
 
     # add the uploaded files
+    archives = {}
     if files is not None:
         dir = tempfile.TemporaryDirectory()        
         for file in files:
+            # archives are extracted right from the upload into the input directory
+            if extract_archives and is_archive(file.filename):
+                archives[name_mapping.get(file.filename, archive_stem(file.filename))] = (file.filename, file.file)
+                continue
+
             # write to a temporary directory
-            p = Path(dir.name) / file.filename
+            p = Path(dir.name) / Path(file.filename).name
             with open(p, 'wb') as f:
-                f.write(file.file.read())
+                shutil.copyfileobj(file.file, f)
             
             # local_data is ie: 'my_specific_filename.csv': 'input_name'
             # when the file name is not in the mapping, we assume the stem is the 'input_name
@@ -148,7 +268,9 @@ def create_job(
     
     # create a new job
     try:
-        job = handler.create_job(tool_name, parameters=parameters, data=local_data)
+        job = handler.create_job(tool_name, parameters=parameters, data=local_data, webhook=webhook, archives=archives, client_id=client_id)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
@@ -159,43 +281,72 @@ def create_job(
     return job
 
 @app.get("/jobs")
-def get_jobs() -> List[ToolJob]:
+def get_jobs(handler: Handler) -> List[ToolJob]:
     # get all jobs
     return handler.list_jobs(ids_only=False)
 
 @app.get("/job/{job_id}")
-def get_job(job_id: str) -> ToolJob:
+def get_job(handler: Handler, job_id: str) -> ToolJob:
     return handler.get_job(job_id=job_id)
 
 @app.get("/job/{job_id}/results")
-def get_job_results(job_id: str) -> List[ToolResultFile]:
+def get_job_results(handler: Handler, job_id: str) -> List[ToolResultFile]:
     # get the job
     job = handler.get_job(job_id=job_id)
+
+    # checksums and summaries are taken from the result index
+    index = handler.result_index(job)
+
+    # archived jobs are listed from the archive index
+    if job.archive is not None:
+        results = handler.storage.list_files(job)
+        for result in results:
+            entry = index.get(Path(result.path).relative_to(job.out_dir).as_posix())
+            if entry is not None and entry.get('size') == result.size:
+                result.sha256, result.summary = entry.get('sha256'), entry.get('summary')
+        return results
     
     # walk the output directory and return filenames, sizes and content types
     results = []
     for p in Path(job.out_dir).rglob('*'):
+        stat = p.stat()
+        entry = index.get(p.relative_to(job.out_dir).as_posix())
+
+        # skip entries of files that changed after the ingestion
+        if entry is not None and entry.get('size') is not None and (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            entry = None
+        entry = entry or {}
+
         results.append(ToolResultFile(
             path=str(p),
             filename= p.name,
-            size=p.stat().st_size,
+            size=stat.st_size,
             is_dir=p.is_dir(),
             extension=p.suffix if not p.is_dir() else None,
-            content_type=guess_type(p)[0] if not p.is_dir() else None
+            content_type=(entry.get('content_type') or guess_type(p)[0]) if not p.is_dir() else None,
+            sha256=entry.get('sha256'),
+            summary=entry.get('summary')
         ))
     return results
 
-@app.get("/job/{job_id}/result/{file_name}")
-def get_result_file(job_id: str, file_name: str):
+@app.get("/job/{job_id}/result/{file_name:path}")
+def get_result_file(handler: Handler, job_id: str, file_name: str, request: Request):
     """
     Retrieve either a single file and send back, or, if the requested file
     end is 'results.zip', create a zip and send back.
+    Files in sub-directories of the output directory can be requested by
+    their relative path. Single files support range requests and are
+    tagged by their checksum, once they are indexed.
     """
     # get the job
     job = handler.get_job(job_id=job_id)
 
     # check if all files are requested
     if file_name  == 'results.zip':
+        # restore archived jobs first
+        if job.archive is not None:
+            job = handler.rehydrate_job(job_id=job_id)
+
         # create a temporary file
         zip = tempfile.NamedTemporaryFile()
         
@@ -206,29 +357,194 @@ def get_result_file(job_id: str, file_name: str):
             filename='results.zip',
             media_type='application/zip',
             content_disposition_type="attachment",
-            background=BackgroundTask(shutil.rmtree, archive_name)
+            background=BackgroundTask(os.remove, archive_name)
         )
+    
+    # make sure the requested file is inside the output directory
+    try:
+        file_name = safe_result_name(file_name)
+        if job.archive is None:
+            p = resolve_result_path(job.out_dir, file_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
         
-    else:
-        # get the file
-        p = Path(job.out_dir) / file_name
+    if job.archive is not None:
+        # read the file from the archive without extracting it
+        try:
+            size = handler.storage.file_size(job, file_name)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"File '{file_name}' not found in the output directory of job '{job_id}'")
+        opener = lambda: handler.storage.open_file(job, file_name)
 
+    else:
         # raise a 404 if the file is not found
-        if not p.exists():
+        if not p.is_file():
             raise HTTPException(status_code=404, detail=f"File '{file_name}' not found in the output directory of job '{job_id}'")
+        size = p.stat().st_size
+        opener = lambda: open(p, 'rb')
+    
+    return serve_result_file(request, opener, size=size, file_name=file_name, checksum=handler.result_checksum(job, file_name))
+
+@app.get("/job/{job_id}/slice/{file_name:path}")
+def get_result_slice(
+    handler: Handler,
+    job_id: str,
+    file_name: str,
+    variables: Annotated[List[str], Query()] = [],
+    start: int = 0,
+    stop: int | None = None,
+    isel: str = '{}',
+    sel: str = '{}',
+    format: Literal['json', 'csv'] = 'json'
+):
+    """
+    Read only a part of a tabular (CSV) or array (NetCDF, Zarr) output file.
+    CSV files are sliced by the rows from start to stop, array files by
+    isel and sel, which are JSON mappings of dimension names to [start, stop]
+    index or label bounds. Variables (or columns) can be selected by repeating
+    the variables parameter.
+    """
+    job = handler.get_job(job_id=job_id)
+
+    # the files need to be on the hot disk for random access
+    if job.archive is not None:
+        job = handler.rehydrate_job(job_id=job_id)
+    
+    try:
+        p = resolve_result_path(job.out_dir, file_name)
+        isel = parse_bounds(isel)
+        sel = parse_bounds(sel)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not p.exists():
+        raise HTTPException(status_code=404, detail=f"File '{file_name}' not found in the output directory of job '{job_id}'")
+
+    try:
+        source = slicer.open(p)
+        try:
+            if isinstance(source, CSVSource):
+                data = source.read(variables=variables, start=start, stop=stop, max_values=slicer.slice_max_values)
+                if format == 'csv':
+                    return PlainTextResponse(source.to_csv(data), media_type='text/csv')
+            else:
+                data = source.read(variables=variables, isel=isel, sel=sel, max_values=slicer.slice_max_values)
+        finally:
+            # evicted files are only closed, once no request reads them
+            slicer.release(source)
+    except SliceTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    return data
+
+@app.post("/job/{job_id}/archive")
+def archive_job(handler: Handler, job_id: str) -> ToolJob:
+    try:
+        return handler.archive_job(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/job/{job_id}/rehydrate")
+def rehydrate_job(handler: Handler, job_id: str) -> ToolJob:
+    return handler.rehydrate_job(job_id)
+
+def _is_final(event: JobEvent) -> bool:
+    return event.event == 'deleted' or event.status in (ToolJobStatus.COMPLETED, ToolJobStatus.FAILED)
+
+async def _event_stream(request: Request, subscription: Subscription, initial: List[JobEvent] = [], until_final: bool = False):
+    """
+    Send job events as server-sent events. If until_final is set, the stream
+    ends once the job is finished or deleted.
+    """
+    try:
+        # the headers are only sent with the first chunk
+        yield ": connected\n\n"
+
+        for event in initial:
+            yield f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
+            if until_final and _is_final(event):
+                return
         
-        # guess the mime type
-        mime = guess_type(p)[0]
-        return FileResponse(p, media_type=mime if mime is not None else 'application/octet-stream')
+        while not await request.is_disconnected():
+            event = await subscription.aget(timeout=15)
+
+            # keep the connection open through proxies
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
+            if until_final and _is_final(event):
+                return
+    finally:
+        subscription.close()
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@app.get("/events")
+async def get_events(handler: Handler, request: Request):
+    """
+    Stream the changes of all jobs as server-sent events.
+    """
+    subscription = handler.events.subscribe(loop=asyncio.get_running_loop())
+    return StreamingResponse(_event_stream(request, subscription), media_type='text/event-stream', headers=SSE_HEADERS)
+
+@app.get("/job/{job_id}/events")
+async def get_job_events(handler: Handler, job_id: str, request: Request):
+    """
+    Stream the changes of a single job as server-sent events. The first event
+    is the current state of the job. The stream ends, once the job finished.
+    """
+    # subscribe first, to not miss any change while loading the job
+    subscription = handler.events.subscribe(job_id=job_id, loop=asyncio.get_running_loop())
+    try:
+        job = await asyncio.to_thread(handler.get_job, job_id)
+    except Exception:
+        subscription.close()
+        raise HTTPException(status_code=404, detail=f"Job with id {job_id} not found")
+    
+    return StreamingResponse(_event_stream(request, subscription, initial=[job_event('updated', job)], until_final=True), media_type='text/event-stream', headers=SSE_HEADERS)
+
+@app.websocket("/ws/jobs")
+async def job_events_websocket(handler: Handler, websocket: WebSocket, job_id: Optional[str] = None):
+    """
+    Send the changes of all jobs, or a single job, over a websocket.
+    """
+    await websocket.accept()
+    subscription = handler.events.subscribe(job_id=job_id, loop=asyncio.get_running_loop())
+
+    # the client does not send anything, but this notices disconnects
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while not receiver.done():
+            event = await subscription.aget(timeout=1)
+            if event is not None:
+                await websocket.send_text(event.model_dump_json())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        subscription.close()
 
 @app.post("/job/{job_id}/run")
-def run_job(job_id: str) -> ToolJob:
-    job = handler.run_job(job_id=job_id)
+def run_job(handler: Handler, job_id: str, request: Request, wait: bool = True) -> ToolJob:
+    """
+    Run the job. With wait=false, the running job is returned immediately.
+    Follow /job/{job_id}/events to get notified, once it finished.
+    """
+    try:
+        # a blocking run does not hold the admission slot until it finished
+        job = handler.run_job(job_id=job_id, wait=wait, on_admitted=admission_release(request))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
     return job
 
 @app.delete("/job/{job_id}")
-def delete_job(job_id: str, keep_files: bool = False):
+def delete_job(handler: Handler, job_id: str, keep_files: bool = False):
     try:
         handler.delete_job(job_id, keep_mount_files=keep_files)
     except Exception as e:
@@ -236,18 +552,77 @@ def delete_job(job_id: str, keep_files: bool = False):
     
     return {'deleted': job_id, 'message': f'Job {job_id} deleted successfully'}
 
+@app.get("/usage")
+def get_usage(handler: Handler, period: Optional[str] = None) -> List[UsageReport]:
+    """
+    Usage of all clients in the given period, ie. '2024-05'. Defaults to the 
+    current quota period.
+    """
+    return [handler.accounting.usage(client_id, period=period) for client_id in handler.accounting.clients()]
+
+@app.get("/usage/{client_id}")
+def get_client_usage(handler: Handler, client_id: str, period: Optional[str] = None) -> UsageReport:
+    return handler.accounting.usage(client_id, period=period)
+
+@app.get("/queue")
+def get_queue(handler: Handler) -> List[QueueEntry]:
+    """
+    Runs waiting for a free slot, in the order they are expected to start.
+    The ETA is the expected end of the run, based on the runtime history.
+    """
+    return handler.scheduler.queue()
+
+@app.post("/pipelines/create")
+def create_pipeline(handler: Handler, client_id: ClientId, pipeline: Pipeline) -> PipelineJob:
+    try:
+        pipeline_job = handler.create_pipeline(pipeline, client_id=client_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return pipeline_job
+
+@app.get("/pipelines")
+def get_pipelines(handler: Handler) -> List[PipelineJob]:
+    return handler.list_pipelines(ids_only=False)
+
+@app.get("/pipeline/{pipeline_id}")
+def get_pipeline(handler: Handler, pipeline_id: str) -> PipelineJob:
+    try:
+        return handler.get_pipeline(pipeline_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/pipeline/{pipeline_id}/run")
+def run_pipeline(handler: Handler, pipeline_id: str, request: Request, use_cache: bool = True) -> PipelineJob:
+    try:
+        return handler.run_pipeline(pipeline_id, use_cache=use_cache, on_admitted=admission_release(request))
+    except PipelineStepError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.delete("/pipeline/{pipeline_id}")
+def delete_pipeline(handler: Handler, pipeline_id: str):
+    try:
+        handler.delete_pipeline(pipeline_id)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Could not delete pipeline '{pipeline_id}': {str(e)}")
+    
+    return {'deleted': pipeline_id, 'message': f'Pipeline {pipeline_id} deleted successfully'}
+
 
-# mount the static files directory
-app.mount("/", StaticFiles(directory = Path(__file__).parent / "static", html=True), name="static")
+# mount the static files directory, if the frontend was built
+if (Path(__file__).parent / "static").exists():
+    app.mount("/", StaticFiles(directory = Path(__file__).parent / "static", html=True), name="static")
 
 if __name__ == '__main__':
     import uvicorn
-    import os
 
     # get UVICORN settings
     HOST = os.getenv("UVICORN_HOST", "127.0.0.1")
     PORT = os.getenv("UVICORN_PORT", 8000)
-    RELOAD = os.getenv("UVICORN_RELOAD", True)
+    RELOAD = os.getenv("UVICORN_RELOAD", "false").lower() in ("1", "true", "yes")
+    WORKERS = int(os.getenv("UVICORN_WORKERS", 1))
 
     # run server
-    uvicorn.run("server:app", host=HOST, port=int(PORT), reload=bool(RELOAD))
+    uvicorn.run("server:app", host=HOST, port=int(PORT), reload=RELOAD, workers=WORKERS if not RELOAD else None)
@@ -0,0 +1,287 @@
+"""
+Partial access to tabular and array outputs of a job. The files are opened
+lazily and only the requested variables and ranges are read.
+"""
+from typing import Optional, List, Dict, Tuple, Any
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import math
+import mmap
+import json
+import csv
+import io
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+
+CSV_EXTENSIONS = ('.csv', '.tsv', '.txt')
+NETCDF_EXTENSIONS = ('.nc', '.nc4', '.netcdf', '.cdf', '.h5', '.hdf5')
+ZARR_EXTENSIONS = ('.zarr', )
+
+
+class SliceTooLarge(Exception):
+    pass
+
+
+def parse_bounds(value: str) -> Dict[str, list]:
+    """
+    Parse a JSON mapping of dimension names to [start, stop] or
+    [start, stop, step] bounds, as passed to isel and sel.
+    """
+    bounds = json.loads(value)
+    if not isinstance(bounds, dict):
+        raise ValueError(f"Bounds have to be a mapping of dimension names to [start, stop], got: {value}")
+    for dim, bound in bounds.items():
+        if not isinstance(bound, list) or not 1 <= len(bound) <= 3:
+            raise ValueError(f"The bounds of dimension '{dim}' have to be a list of [start, stop, step], got: {json.dumps(bound)}")
+    return bounds
+
+
+def _clean(value: Any) -> Any:
+    # NaN and inf are not valid JSON
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    elif isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    return value
+
+
+class CSVSource:
+    """
+    Memory-mapped CSV file. Each line is treated as one row. Every
+    index_every rows the byte offset is remembered, so that later slices
+    can start reading close to the requested row instead of the file start.
+    """
+    def __init__(self, path: Path, index_every: int = 1000):
+        self.path = path
+        self.index_every = index_every
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+
+        # empty files cannot be mapped
+        if path.stat().st_size == 0:
+            self._mm = b''
+        else:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # parse the header
+        header_end = self._line_end(0)
+        header = self._mm[0:header_end].decode().rstrip('\r\n')
+        if path.suffix == '.tsv':
+            self.delimiter = '\t'
+        else:
+            try:
+                self.delimiter = csv.Sniffer().sniff(header, delimiters=',;\t|').delimiter
+            except csv.Error:
+                self.delimiter = ','
+        self.columns = next(csv.reader([header], delimiter=self.delimiter), [])
+
+        # offsets of every index_every-th row
+        self._index = [header_end]
+        self._complete = header_end >= len(self._mm)
+        self._row_count = 0 if self._complete else None
+
+    def _line_end(self, offset: int) -> int:
+        # return the offset of the next line start
+        end = self._mm.find(b'\n', offset)
+        return len(self._mm) if end == -1 else end + 1
+
+    def _offset(self, row: int) -> int:
+        """
+        Return the byte offset of the given row. The offset index is extended
+        on demand.
+        """
+        block = row // self.index_every
+        with self._lock:
+            # extend the index up to the requested block
+            while len(self._index) <= block and not self._complete:
+                offset = self._index[-1]
+                for n in range(self.index_every):
+                    if offset >= len(self._mm):
+                        self._complete = True
+                        self._row_count = (len(self._index) - 1) * self.index_every + n
+                        break
+                    offset = self._line_end(offset)
+                else:
+                    self._index.append(offset)
+
+            if len(self._index) <= block:
+                return len(self._mm)
+            offset = self._index[block]
+
+        # skip the remaining rows within the block
+        for _ in range(row - block * self.index_every):
+            if offset >= len(self._mm):
+                break
+            offset = self._line_end(offset)
+        return offset
+
+    @property
+    def row_count(self) -> Optional[int]:
+        # only known once the whole file was indexed
+        return self._row_count
+
+    def read(self, variables: Optional[List[str]] = None, start: int = 0, stop: Optional[int] = None, max_values: Optional[int] = None) -> dict:
+        if start < 0 or (stop is not None and stop < start):
+            raise ValueError(f"The rows have to be given as 0 <= start <= stop. Got start={start}, stop={stop}.")
+        columns = variables if variables else self.columns
+        missing = [c for c in columns if c not in self.columns]
+        if len(missing) > 0:
+            raise KeyError(f"Columns {missing} not found. Available columns are: {self.columns}")
+        indices = [self.columns.index(c) for c in columns]
+
+        # check the size of the slice, open slices are limited to max_values
+        if max_values is not None:
+            if stop is None:
+                stop = start + max(max_values // max(len(columns), 1), 1)
+            elif (stop - start) * len(columns) > max_values:
+                raise SliceTooLarge(f"The slice of {(stop - start) * len(columns)} values is larger than the allowed {max_values} values.")
+
+        # read the lines of the slice
+        begin = self._offset(start)
+        end = self._offset(stop) if stop is not None else len(self._mm)
+        lines = self._mm[begin:end].decode().splitlines()
+
+        rows = [[row[i] if i < len(row) else None for i in indices] for row in csv.reader(lines, delimiter=self.delimiter)]
+        return {'columns': columns, 'start': start, 'stop': start + len(rows), 'rows': rows, 'row_count': self.row_count}
+
+    def to_csv(self, data: dict) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out, delimiter=self.delimiter)
+        writer.writerow(data['columns'])
+        writer.writerows(data['rows'])
+        return out.getvalue()
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+class DatasetSource:
+    """
+    NetCDF or Zarr dataset opened lazily with xarray. Data is only loaded
+    for the selected variables and ranges.
+    """
+    def __init__(self, path: Path):
+        try:
+            import xarray
+        except ImportError:
+            raise RuntimeError("Slicing NetCDF and Zarr outputs needs the xarray package to be installed.")
+
+        self.path = path
+        if path.suffix in ZARR_EXTENSIONS:
+            self.ds = xarray.open_zarr(path)
+        else:
+            self.ds = xarray.open_dataset(path)
+
+    @property
+    def variables(self) -> List[str]:
+        return list(self.ds.data_vars)
+
+    def read(self, variables: Optional[List[str]] = None, isel: Dict[str, Tuple[int, int]] = {}, sel: Dict[str, Tuple[Any, Any]] = {}, max_values: Optional[int] = None) -> dict:
+        ds = self.ds
+        if variables:
+            missing = [v for v in variables if v not in ds.variables]
+            if len(missing) > 0:
+                raise KeyError(f"Variables {missing} not found. Available variables are: {self.variables}")
+            ds = ds[variables]
+
+        # this is still lazy
+        if len(isel) > 0:
+            ds = ds.isel({dim: slice(*bounds) for dim, bounds in isel.items()})
+        if len(sel) > 0:
+            ds = ds.sel({dim: slice(*bounds) for dim, bounds in sel.items()})
+
+        # check the size before anything is loaded
+        size = sum([var.size for var in ds.data_vars.values()])
+        if max_values is not None and size > max_values:
+            raise SliceTooLarge(f"The slice of {size} values is larger than the allowed {max_values} values.")
+
+        return _clean(ds.load().to_dict(data='list'))
+
+    def close(self):
+        self.ds.close()
+
+
+class ResultSlicer(BaseSettings):
+    slice_cache_size: int = Field(32, description="Number of opened result files that are kept open for further slicing.")
+    slice_max_values: int = Field(1_000_000, description="Maximum number of values that can be requested in a single slice.")
+
+    _cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _refs: Dict[int, int] = PrivateAttr(default_factory=dict)
+    _evicted: Dict[int, Any] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _acquire(self, source: CSVSource | DatasetSource) -> CSVSource | DatasetSource:
+        # has to be called with the lock held
+        self._refs[id(source)] = self._refs.get(id(source), 0) + 1
+        return source
+
+    def _close(self, source: CSVSource | DatasetSource):
+        # has to be called with the lock held, sources in use are closed on release
+        if self._refs.get(id(source), 0) > 0:
+            self._evicted[id(source)] = source
+        else:
+            source.close()
+
+    def open(self, path: Path) -> CSVSource | DatasetSource:
+        """
+        Return an opened source for the given file. Opened files are
+        kept in a LRU cache, which is invalidated, when the file changes.
+        Every opened source has to be given back to release.
+        """
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._acquire(self._cache[key])
+
+        # open the file outside of the lock
+        suffix = path.suffix.lower()
+        if suffix in CSV_EXTENSIONS:
+            source = CSVSource(path)
+        elif suffix in NETCDF_EXTENSIONS or suffix in ZARR_EXTENSIONS:
+            source = DatasetSource(path)
+        else:
+            raise ValueError(f"Slicing is not supported for files of type '{suffix}'.")
+
+        with self._lock:
+            # another request opened the file in the meantime
+            if key in self._cache:
+                source.close()
+                return self._acquire(self._cache[key])
+            self._cache[key] = self._acquire(source)
+
+            # close the least recently used files, once they are not read anymore
+            while len(self._cache) > self.slice_cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                self._close(evicted)
+
+        return source
+
+    def release(self, source: CSVSource | DatasetSource):
+        """
+        Give back a source returned by open. Evicted sources are closed,
+        once the last request released them.
+        """
+        with self._lock:
+            refs = self._refs.get(id(source), 0) - 1
+            if refs > 0:
+                self._refs[id(source)] = refs
+                return
+            self._refs.pop(id(source), None)
+            if self._evicted.pop(id(source), None) is not None:
+                source.close()
+
+    def clear(self):
+        with self._lock:
+            while len(self._cache) > 0:
+                _, source = self._cache.popitem()
+                self._close(source)
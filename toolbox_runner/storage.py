@@ -0,0 +1,195 @@
+from typing import TYPE_CHECKING, Optional, Literal, List, IO
+from pathlib import Path
+from datetime import datetime, timedelta
+from mimetypes import guess_type
+import threading
+import tempfile
+import warnings
+import zipfile
+import os
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.models import ToolJob, ToolJobStatus, ToolResultFile
+from toolbox_runner.locks import LockedError
+
+if TYPE_CHECKING:
+    from toolbox_runner.handler import ToolHandler
+
+
+COMPRESSION = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+
+
+class TieredStorage(BaseSettings):
+    cold_storage_dir: Optional[str] = Field(None, description="Directory for archived jobs. Defaults to '.cold' below the mount base dir.")
+    archive_after_hours: Optional[float] = Field(None, description="Archive finished jobs, that have not been changed for this many hours. Archiving is disabled if not set.")
+    archive_compression: Literal['deflate', 'bzip2', 'lzma'] = 'deflate'
+    storage_interval: float = Field(600, description="Seconds between two checks for jobs to archive.")
+    storage_lock_seconds: float = Field(3600, description="Seconds a job stays locked while it is archived or restored. Frees the lock of a crashed worker.")
+
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+
+    def cold_path(self, mount_path: Path) -> Path:
+        if self.cold_storage_dir is not None:
+            p = Path(self.cold_storage_dir)
+        else:
+            p = mount_path / '.cold'
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    def archive(self, job: ToolJob, mount_path: Path) -> str:
+        """
+        Write the in and out directories of a job into a single compressed
+        zip archive in the cold storage directory. The central directory of
+        the archive is used as an index to read single files later on.
+        Returns the path of the archive.
+        """
+        archive_path = self.cold_path(mount_path) / f"{job.job_id}.zip"
+
+        # a unique temporary file, so that no other process writes into it
+        fd, tmp_path = tempfile.mkstemp(dir=archive_path.parent, prefix=f".{job.job_id}.", suffix='.zip.tmp')
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=COMPRESSION[self.archive_compression]) as zf:
+                for prefix, directory in (('in', job.in_dir), ('out', job.out_dir)):
+                    for p in sorted(Path(directory).rglob('*')):
+                        zf.write(p, arcname=f"{prefix}/{p.relative_to(directory).as_posix()}")
+
+            # only replace the archive once it is complete
+            os.replace(tmp_path, archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return str(archive_path)
+
+    def rehydrate(self, job: ToolJob):
+        """
+        Extract an archived job back into its in and out directories.
+        """
+        with zipfile.ZipFile(job.archive) as zf:
+            for prefix, directory in (('in', job.in_dir), ('out', job.out_dir)):
+                Path(directory).mkdir(parents=True, exist_ok=True)
+                for info in zf.infolist():
+                    if not info.filename.startswith(f"{prefix}/"):
+                        continue
+
+                    target = Path(directory) / info.filename[len(prefix) + 1:]
+                    if info.is_dir():
+                        target.mkdir(parents=True, exist_ok=True)
+                    else:
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        with zf.open(info) as src, open(target, 'wb') as dst:
+                            while chunk := src.read(1024 * 1024):
+                                dst.write(chunk)
+
+    def list_files(self, job: ToolJob) -> List[ToolResultFile]:
+        """
+        List the result files of an archived job from the archive index.
+        """
+        results = []
+        with zipfile.ZipFile(job.archive) as zf:
+            for info in zf.infolist():
+                if not info.filename.startswith('out/'):
+                    continue
+
+                p = Path(job.out_dir) / info.filename[4:]
+                results.append(ToolResultFile(
+                    path=str(p),
+                    filename=p.name,
+                    size=info.file_size,
+                    is_dir=info.is_dir(),
+                    extension=p.suffix if not info.is_dir() else None,
+                    content_type=guess_type(p)[0] if not info.is_dir() else None
+                ))
+        return results
+
+    def open_file(self, job: ToolJob, file_name: str) -> IO[bytes]:
+        """
+        Open a single result file of an archived job without extracting
+        the archive. Raises a FileNotFoundError if the file is not archived.
+        """
+        with zipfile.ZipFile(job.archive) as zf:
+            try:
+                # the opened member keeps the underlying file open on its own
+                return zf.open(f"out/{file_name}")
+            except KeyError:
+                raise FileNotFoundError(f"File '{file_name}' not found in the archive of job '{job.job_id}'")
+
+    def file_size(self, job: ToolJob, file_name: str) -> int:
+        with zipfile.ZipFile(job.archive) as zf:
+            try:
+                return zf.getinfo(f"out/{file_name}").file_size
+            except KeyError:
+                raise FileNotFoundError(f"File '{file_name}' not found in the archive of job '{job.job_id}'")
+
+    def idle_jobs(self, handler: 'ToolHandler') -> List[ToolJob]:
+        """
+        Return all finished jobs, that have not been changed within the
+        configured archive_after_hours.
+        """
+        if self.archive_after_hours is None:
+            return []
+
+        limit = datetime.now() - timedelta(hours=self.archive_after_hours)
+        idle = []
+        for job in handler.list_jobs(ids_only=False):
+            if job.archive is not None or job.status in (ToolJobStatus.PENDING, ToolJobStatus.QUEUED, ToolJobStatus.RUNNING):
+                continue
+            try:
+                changed = datetime.fromtimestamp(Path(job.out_dir).stat().st_mtime)
+            except FileNotFoundError:
+                continue
+            if changed < limit:
+                idle.append(job)
+
+        return idle
+
+    def run_once(self, handler: 'ToolHandler') -> List[str]:
+        """
+        Archive all idle jobs and return their ids.
+        """
+        archived = []
+        for job in self.idle_jobs(handler):
+            if self._stop.is_set():
+                break
+            try:
+                handler.archive_job(job.job_id)
+                archived.append(job.job_id)
+            except LockedError:
+                # archived by another worker right now
+                continue
+            except Exception as e:
+                warnings.warn(f"Could not archive job {job.job_id}: {str(e)}")
+
+        return archived
+
+    def _loop(self, handler: 'ToolHandler'):
+        while not self._stop.is_set():
+            try:
+                self.run_once(handler)
+            except Exception as e:
+                warnings.warn(f"The storage tiering failed: {str(e)}")
+            self._stop.wait(self.storage_interval)
+
+    def start(self, handler: 'ToolHandler'):
+        """
+        Start archiving idle jobs in a background thread.
+        """
+        if self.archive_after_hours is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(handler, ), daemon=True, name='tiered-storage')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
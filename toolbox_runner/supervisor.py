@@ -0,0 +1,388 @@
+"""
+Supervision of running tool containers. Instead of blocking a thread and a
+connection on every container until it exits, a single watcher follows the
+Docker events stream and finalizes the matching run, once a container dies.
+The CPU and memory usage of the running containers is sampled in a second
+thread, as Docker does not keep any statistics of exited containers. The
+samples are read from the cgroup files of the containers, if the Docker host
+is this machine, and only requested from the Docker API otherwise.
+Docker removes the cgroup of a container before it reports its exit. On
+cgroup v2, the sampler is woken up by the cgroup.events file of a container,
+once its processes exited, to read the final usage before that.
+"""
+from typing import TYPE_CHECKING, Optional, Dict, Tuple, Callable, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from time import time, monotonic
+import threading
+import select
+import warnings
+
+from pydantic import Field, PrivateAttr
+from pydantic_settings import BaseSettings
+
+from toolbox_runner.docker_client import get_client
+
+if TYPE_CHECKING:
+    from docker import DockerClient
+
+
+# all tool containers are labeled, so that the events can be filtered
+LABEL = 'toolbox_runner.managed'
+
+# called with the exit code, if the container was killed for running out of memory
+# and the last sampled usage, ie. {'cpu_seconds': 12.3, 'peak_memory': 1048576}
+Finalizer = Callable[[int, bool, Dict[str, Any]], Any]
+
+
+def _read_int(path: Path) -> Optional[int]:
+    try:
+        return int(path.read_text().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cgroup_paths(root: Path, container_id: str) -> Tuple[Path, Path]:
+    # cgroup v2, with the systemd or the cgroupfs driver
+    return (root / 'system.slice' / f"docker-{container_id}.scope", root / 'docker' / container_id)
+
+
+def read_cgroup_usage(root: Path, container_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the CPU time and peak memory of a container from its cgroup files.
+    Returns None, if the cgroup can't be found, ie. if the Docker daemon runs
+    on another host.
+    """
+    for path in cgroup_paths(root, container_id):
+        try:
+            cpu_stat = (path / 'cpu.stat').read_text()
+        except OSError:
+            continue
+        usage = {}
+        for line in cpu_stat.splitlines():
+            if line.startswith('usage_usec '):
+                usage['cpu_seconds'] = int(line.split()[1]) / 1e6
+
+        # memory.peak needs Linux 5.19, the current usage is the best guess before
+        peak = _read_int(path / 'memory.peak') or _read_int(path / 'memory.current')
+        if peak:
+            usage['peak_memory'] = peak
+        return usage
+
+    # cgroup v1, the controllers have their own hierarchies
+    for group in (Path('system.slice') / f"docker-{container_id}.scope", Path('docker') / container_id):
+        cpu = _read_int(root / 'cpuacct' / group / 'cpuacct.usage')
+        if cpu is None:
+            continue
+        usage = {'cpu_seconds': cpu / 1e9}
+        peak = _read_int(root / 'memory' / group / 'memory.max_usage_in_bytes')
+        if peak:
+            usage['peak_memory'] = peak
+        return usage
+
+    return None
+
+
+class ContainerSupervisor(BaseSettings):
+    supervisor_finalize_workers: int = Field(8, description="Number of threads that collect logs and metadata of exited containers.")
+    supervisor_reconcile_interval: float = Field(60.0, description="Seconds after which the events stream is reopened and all watched containers are inspected, in case an event was missed.")
+    supervisor_stats_interval: Optional[float] = Field(5.0, description="Seconds between two samples of the CPU and memory usage of the running containers. Sampling is disabled if not set.")
+    supervisor_cgroup_root: str = Field('/sys/fs/cgroup', description="Mount point of the cgroup filesystem of the Docker host. The usage of containers is requested from the Docker API, if their cgroups are not found here.")
+
+    _watched: Dict[str, Tuple[Future, Finalizer]] = PrivateAttr(default_factory=dict)
+    _oom_killed: set = PrivateAttr(default_factory=set)
+    _usage: Dict[str, Dict[str, Any]] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _connected: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _stop: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _sampler: Optional[threading.Thread] = PrivateAttr(None)
+    _stream: Optional[Any] = PrivateAttr(None)
+    _epoll: Optional[Any] = PrivateAttr(None)
+    _events: Dict[int, Tuple[str, Any]] = PrivateAttr(default_factory=dict)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(None)
+
+    def supervise(self, container_id: str, finalize: Finalizer) -> Future:
+        """
+        Watch the container and call finalize, once it exited. The returned
+        future resolves to the return value of finalize.
+        Has to be called before the container is started, to not miss its exit.
+        """
+        self.start()
+
+        future = Future()
+        with self._lock:
+            self._watched[container_id] = (future, finalize)
+        return future
+
+    def started(self, container_id: str):
+        """
+        Follow the cgroup.events file of a started container, to read its
+        usage once it exited. Short runs are never sampled otherwise.
+        """
+        if self._epoll is None:
+            return
+        path = next((p for p in cgroup_paths(Path(self.supervisor_cgroup_root), container_id) if (p / 'cgroup.events').exists()), None)
+        if path is None:
+            return
+
+        try:
+            events = open(path / 'cgroup.events')
+            self._epoll.register(events.fileno(), select.EPOLLPRI)
+        except OSError:
+            return
+        with self._lock:
+            self._events[events.fileno()] = (container_id, events)
+
+        # it might have exited already
+        self._exited(events.fileno())
+
+    def _unfollow(self, container_id: str):
+        with self._lock:
+            fds = [fd for fd, (followed, _) in self._events.items() if followed == container_id]
+            files = [self._events.pop(fd)[1] for fd in fds]
+        for fd, events in zip(fds, files):
+            try:
+                self._epoll.unregister(fd)
+            except (OSError, ValueError):
+                pass
+            events.close()
+
+    def _exited(self, fd: int):
+        with self._lock:
+            container_id, events = self._events.get(fd, (None, None))
+            if events is None:
+                return
+
+            # the file changes, once the last process of the container exited
+            events.seek(0)
+            populated = 'populated 0' not in events.read()
+        
+        if not populated:
+            sample = read_cgroup_usage(Path(self.supervisor_cgroup_root), container_id)
+            if sample:
+                self._record(container_id, sample)
+            self._unfollow(container_id)
+
+    def forget(self, container_id: str):
+        """
+        Stop watching a container, ie. because it could not be started.
+        """
+        with self._lock:
+            self._watched.pop(container_id, None)
+            self._oom_killed.discard(container_id)
+            self._usage.pop(container_id, None)
+        self._unfollow(container_id)
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return len(self._watched)
+
+    def _resolve(self, container_id: str, exit_code: int, oom_killed: bool = False):
+        with self._lock:
+            entry = self._watched.pop(container_id, None)
+            oom_killed = oom_killed or container_id in self._oom_killed
+            self._oom_killed.discard(container_id)
+            usage = self._usage.pop(container_id, {})
+        self._unfollow(container_id)
+
+        # not a container of this process, or already resolved
+        if entry is None:
+            return
+        future, finalize = entry
+
+        # collecting the logs must not block the events stream
+        def _finalize():
+            # other runtimes keep the cgroup until the container is removed
+            final = read_cgroup_usage(Path(self.supervisor_cgroup_root), container_id) or {}
+            for metric, value in final.items():
+                usage[metric] = max(usage.get(metric, 0), value)
+
+            try:
+                future.set_result(finalize(exit_code, oom_killed, usage))
+            except Exception as e:
+                future.set_exception(e)
+        self._executor.submit(_finalize)
+
+    def _handle(self, event: dict):
+        action = event.get('Action') or event.get('status')
+        container_id = event.get('id') or event.get('Actor', {}).get('ID')
+
+        if action == 'oom':
+            # the die event follows
+            with self._lock:
+                if container_id in self._watched:
+                    self._oom_killed.add(container_id)
+        elif action == 'die':
+            attributes = event.get('Actor', {}).get('Attributes', {})
+            self._resolve(container_id, int(attributes.get('exitCode', -1)))
+
+    def _reconcile(self, client: 'DockerClient'):
+        """
+        Inspect all watched containers and resolve the ones that already exited.
+        """
+        from docker.errors import NotFound
+
+        with self._lock:
+            container_ids = list(self._watched.keys())
+
+        for container_id in container_ids:
+            try:
+                state = client.api.inspect_container(container_id)['State']
+            except NotFound:
+                self._resolve(container_id, -1)
+                continue
+            except Exception:
+                continue
+
+            if state.get('Status') in ('exited', 'dead'):
+                self._resolve(container_id, state.get('ExitCode', -1), state.get('OOMKilled', False))
+
+    def _api_usage(self, client: 'DockerClient', container_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            stats = client.api.stats(container_id, stream=False, one_shot=True)
+        except Exception:
+            # the container exited in the meantime
+            return None
+
+        usage = {}
+        cpu = stats.get('cpu_stats', {}).get('cpu_usage', {}).get('total_usage')
+        if cpu is not None:
+            usage['cpu_seconds'] = cpu / 1e9
+        memory = stats.get('memory_stats', {})
+        peak = max(memory.get('max_usage', 0) or 0, memory.get('usage', 0) or 0)
+        if peak > 0:
+            usage['peak_memory'] = peak
+        return usage
+
+    def _record(self, container_id: str, sample: Dict[str, Any]):
+        with self._lock:
+            if container_id not in self._watched:
+                return
+            usage = self._usage.setdefault(container_id, {})
+            for metric, value in sample.items():
+                usage[metric] = max(usage.get(metric, 0), value)
+
+    def _sample(self, client: 'DockerClient'):
+        """
+        Sample the usage of all watched containers. The CPU time is cumulative,
+        the memory is the highest usage seen so far.
+        """
+        with self._lock:
+            container_ids = list(self._watched.keys())
+
+        root = Path(self.supervisor_cgroup_root)
+        for container_id in container_ids:
+            # reading the cgroup files needs no request per container
+            sample = read_cgroup_usage(root, container_id)
+            if sample is None:
+                sample = self._api_usage(client, container_id)
+            if sample:
+                self._record(container_id, sample)
+
+    def _wait(self, timeout: float):
+        """
+        Wait for the timeout and read the usage of containers exiting meanwhile.
+        """
+        if self._epoll is None:
+            self._stop.wait(timeout)
+            return
+        for fd, _ in self._epoll.poll(timeout):
+            self._exited(fd)
+
+    def _sample_loop(self):
+        due = monotonic() + self.supervisor_stats_interval
+        while not self._stop.is_set():
+            # wake up regularly, to notice the stop
+            self._wait(max(0.0, min(due - monotonic(), 1.0)))
+            if monotonic() < due:
+                continue
+            due = monotonic() + self.supervisor_stats_interval
+
+            try:
+                self._sample(get_client())
+            except Exception as e:
+                warnings.warn(f"Could not sample the container usage: {str(e)}")
+
+    def _loop(self):
+        client = None
+        since = None
+        while not self._stop.is_set():
+            try:
+                if client is None:
+                    client = get_client()
+
+                # the stream ends after the reconcile interval on its own
+                until = int(time()) + int(self.supervisor_reconcile_interval)
+                self._stream = client.api.events(
+                    since=since,
+                    until=until,
+                    decode=True,
+                    filters={'type': 'container', 'label': [LABEL], 'event': ['die', 'oom']}
+                )
+                self._connected.set()
+
+                # containers might have exited while the stream was closed
+                self._reconcile(client)
+
+                for event in self._stream:
+                    self._handle(event)
+                
+                # events are replayed from here on, handling them twice does no harm
+                since = until
+            except Exception as e:
+                client = None
+                if not self._stop.is_set():
+                    warnings.warn(f"Lost the Docker events stream: {str(e)}")
+                    self._stop.wait(1.0)
+            finally:
+                self._connected.clear()
+
+    def start(self, timeout: float = 5.0):
+        """
+        Start the watcher thread, if it is not running, and wait until the
+        events stream is connected.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.supervisor_finalize_workers, thread_name_prefix='container-finalize')
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, daemon=True, name='container-supervisor')
+                self._thread.start()
+            if self.supervisor_stats_interval is not None and (self._sampler is None or not self._sampler.is_alive()):
+                # exits are noticed through epoll on Linux only
+                if self._epoll is None and hasattr(select, 'epoll'):
+                    self._epoll = select.epoll()
+                self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name='container-stats')
+                self._sampler.start()
+
+        if not self._connected.wait(timeout):
+            raise RuntimeError('Could not connect to the Docker events stream.')
+
+    def stop(self):
+        self._stop.set()
+        if self._stream is not None:
+            self._stream.close()
+
+
+_supervisor: Optional[ContainerSupervisor] = None
+_supervisor_lock = threading.Lock()
+
+
+def get_supervisor() -> ContainerSupervisor:
+    """
+    Return the supervisor of this process. There is only one, as a single
+    events stream is enough to watch all containers.
+    """
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = ContainerSupervisor()
+        return _supervisor
+
+
+def stop_supervisor():
+    if _supervisor is not None:
+        _supervisor.stop()
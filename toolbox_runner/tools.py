@@ -1,7 +1,6 @@
-from typing import List
+from typing import Optional, List, Any
 
 from pydantic import BaseModel
-from yaml import load, Loader
 
 from toolbox_runner.docker_client import get_client
 from toolbox_runner.models import Tool
@@ -10,19 +9,23 @@ from toolbox_runner.models import Tool
 class ToolSniffer(BaseModel):
     docker_image: str
 
+    # the execution backend, that reads the tool.yml - defaults to docker
+    backend: Optional[Any] = None
 
-    def _get_tool_config(self) -> dict:
-        # get a docker client
-        client = get_client()
 
+    def _get_tool_config(self) -> dict:
         # check out the yaml in the image
         try:
-            raw = client.containers.run(self.docker_image, command='cat /src/tool.yml', remove=True)
+            if self.backend is not None:
+                raw = self.backend.read_file(self.docker_image, '/src/tool.yml')
+            else:
+                raw = get_client().containers.run(self.docker_image, command='cat /src/tool.yml', remove=True)
         # TODO: change this to the Exception, that occures when the tool.yml is not there
         except Exception:
             return {}
 
         # parse the yaml
+        from yaml import load, Loader
         conf = load(raw, Loader=Loader)
 
         return conf